@@ -1,11 +1,20 @@
 import streamlit as st
-from shared import text_model, parse_gemini_json_response
+from shared import text_model, generate_structured, render_html_component
 import json # Import json for potential debugging/display
 import io # For image handling
 import base64 # For image encoding
-import pandas as pd # For charts
-import matplotlib.pyplot as plt # For charts
-from streamlit.components.v1 import html as st_html # Import html from streamlit.components.v1
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from matplotlib.figure import Figure # For charts; pyplot's global state is avoided
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+import instrumentation
+from pipeline import bind_worker_context
+import tracing
+import schemas
+import validators
+import templates
 
 def generate_anti_persona_data(product_description, api_key):
     """
@@ -17,118 +26,32 @@ def generate_anti_persona_data(product_description, api_key):
     1.  Negative Marketing & Sales Guidelines
     2.  Product Feature Exclusion/Refinement Brief
     3.  New Market/Product Exploration Briefs
+    plus a list of suggested anti-personas. Provide meaningful content for each field based on the product description.
 
     Product/Service Description: {product_description}
-
-    Generate the output in a single JSON object with the following top-level keys and nested structures:
-
-    {{
-        "negative_marketing_card": {{
-            "title": "Negative Marketing & Sales Guidelines",
-            "summary": "(Concise summary of who NOT to target and why, max 250 characters, ensuring it's a complete sentence or two)",
-            "keywords_to_exclude": ["keyword1", "keyword2"], # Keywords/phrases to exclude from advertising campaigns
-            "channels_to_deprioritize": ["channel1", "channel2"], # Marketing channels to de-prioritize
-            "sales_red_flags": ["behavior1", "behavior2"] # Behaviors/questions from leads indicating anti-persona
-        }},
-        "product_brief_card": {{
-            "title": "Product Feature Exclusion/Refinement Brief",
-            "summary": "(Concise summary of product features to avoid/refine for anti-personas, max 250 characters, ensuring it's a complete sentence or two)",
-            "undesirable_features": ["feature1", "feature2"], # Product characteristics/features undesirable for core users but appealing to anti-personas
-            "refinement_suggestions": ["suggestion1", "suggestion2"], # Suggestions for refining existing features
-            "misuse_warnings": ["warning1", "warning2"] # Potential misuses or unintended behaviors
-        }},
-        "opportunity_report_card": {{
-            "title": "New Market/Product Exploration Briefs",
-            "summary": "(Concise summary of identified missed opportunities and new market potential, max 250 characters, ensuring it's a complete sentence or two)",
-            "neglected_areas": [ # List of identified opportunity areas
-                {{
-                    "area_summary": "(Concise summary of the neglected market area)",
-                    "value_score": 0, # Integer score 1-5 for potential value
-                    "details": ["detail1", "detail2"] # Bullet points detailing potential value missed and exploration ideas
-                }}
-            ],
-            "overall_exploration_ideas": ["idea1", "idea2"] # General exploration ideas if needed
-        }},
-        "suggested_anti_personas": [ # New section for suggested anti-personas
-            {{
-                "persona_name": "The Over-Engineer",
-                "reason": "Prefers overly complex solutions; would be frustrated by simplicity."
-            }}
-        ]
-    }}
-
-    Ensure the response is ONLY a valid JSON object with no extra text or markdown outside the JSON block.
-    Provide meaningful content for each field based on the product description.
-    Each summary must be concise and complete, not exceeding 250 characters.
     """
 
     try:
-        # Use the shared text_model (assuming API key is handled)
-        response = text_model.generate_content(prompt)
-        raw_text = response.text.strip()
-
-        # Parse the JSON response using the shared helper
-        parsed_data = parse_gemini_json_response(raw_text)
-
-        # Basic validation of the top-level structure
-        if (parsed_data
-            and isinstance(parsed_data, dict)
-            and 'negative_marketing_card' in parsed_data and isinstance(parsed_data['negative_marketing_card'], dict)
-            and 'product_brief_card' in parsed_data and isinstance(parsed_data['product_brief_card'], dict)
-            and 'opportunity_report_card' in parsed_data and isinstance(parsed_data['opportunity_report_card'], dict)
-            and 'suggested_anti_personas' in parsed_data and isinstance(parsed_data['suggested_anti_personas'], list)): # Added validation for new field
-
-            # Basic validation for nested lists and scores
-            nm_card = parsed_data.get('negative_marketing_card', {})
-            pb_card = parsed_data.get('product_brief_card', {})
-            or_card = parsed_data.get('opportunity_report_card', {})
-            anti_personas_list = parsed_data.get('suggested_anti_personas', []) # Get new list
-
-            if (
-                isinstance(nm_card.get('keywords_to_exclude', []), list) and
-                isinstance(nm_card.get('channels_to_deprioritize', []), list) and
-                isinstance(nm_card.get('sales_red_flags', []), list) and
-                isinstance(pb_card.get('undesirable_features', []), list) and
-                isinstance(pb_card.get('refinement_suggestions', []), list) and
-                isinstance(pb_card.get('misuse_warnings', []), list) and
-                isinstance(or_card.get('neglected_areas', []), list) and
-                isinstance(or_card.get('overall_exploration_ideas', []), list) and
-                isinstance(anti_personas_list, list) # Validate the new list
-            ):
-                 # Validate scores in opportunity_report_card's neglected_areas
-                 valid_opportunity_areas = []
-                 for area in or_card.get('neglected_areas', []):
-                      if isinstance(area, dict) and 'value_score' in area and isinstance(area['value_score'], (int, float)):
-                           valid_opportunity_areas.append(area)
-                      else:
-                           st.warning(f"Skipping opportunity area due to missing/invalid value_score: {area.get('area_summary', 'Unnamed Opportunity Area')}")
-                 or_card['neglected_areas'] = valid_opportunity_areas
-
-                 # Validate suggested_anti_personas list items
-                 valid_anti_personas = []
-                 for persona in anti_personas_list:
-                     if isinstance(persona, dict) and 'persona_name' in persona and 'reason' in persona:
-                         valid_anti_personas.append(persona)
-                     else:
-                         st.warning(f"Skipping invalid anti-persona entry: {persona}")
-                 parsed_data['suggested_anti_personas'] = valid_anti_personas # Update with validated list
-
-                 # Validate nested lists and scores and truncate summaries if necessary
-                 for card_key, card_data in parsed_data.items():
-                      if 'summary' in card_data and isinstance(card_data['summary'], str):
-                           if len(card_data['summary']) > 250:
-                                card_data['summary'] = card_data['summary'][:247] + "..."
-
-                 return parsed_data
-            else:
-                st.error("Generated content has incorrect nested list structures or missing fields.")
-                st.text_area("Raw Model Output:", raw_text, height=200)
-                return None
-
-        else:
-            st.error("Generated content is not in the expected top-level JSON format.")
+        # Schema-constrained JSON; calls are instrumented by shared.generate_content
+        parsed_data = generate_structured("generate_anti_persona_data", prompt, schemas.ANTI_PERSONA_REPORTS)
+        raw_text = json.dumps(parsed_data, indent=2)
+
+        # Structure, types and value_score coercion come from the compiled schema validator
+        result = validators.validate('anti_persona_reports', parsed_data)
+        if not result.ok:
+            st.error("Generated content is not in the expected JSON format: " + "; ".join(result.messages()))
             st.text_area("Raw Model Output:", raw_text, height=200)
             return None
+        for message in result.messages():
+            st.warning(f"Skipping invalid entry in generated reports: {message}")
+
+        reports = result.value
+        # Keep card summaries short enough for the card layout
+        for card_key in ('negative_marketing_card', 'product_brief_card', 'opportunity_report_card'):
+            card_data = reports[card_key]
+            if len(card_data['summary']) > 250:
+                card_data['summary'] = card_data['summary'][:247] + "..."
+        return reports
 
     except Exception as e:
         st.error(f"Error generating anti-persona data: {e}")
@@ -137,6 +60,308 @@ def generate_anti_persona_data(product_description, api_key):
 # --- Formatting Functions for Outputs (No longer needed, model generates structured content directly) ---
 # The old format_ functions are now fully removed or commented out.
 
+# --- Value Score Chart ---
+# Drawn with matplotlib's object-oriented API (Figure + Agg canvas) on a worker thread. pyplot's
+# global figure registry is never touched, so concurrent sessions don't contend on it, and each
+# distinct chart is drawn once: results are kept as base64 PNG keyed by a hash of the chart data.
+CHART_CACHE_SIZE = 64
+_chart_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='chart')
+_chart_futures = OrderedDict() # chart data hash -> Future of the base64 PNG
+_chart_lock = threading.Lock()
+
+def _chart_areas(or_card):
+    """The (area, score) pairs plotted for an opportunity report card."""
+    return [
+        (area.get('area_summary', 'Unnamed Area'), area['value_score'])
+        for area in or_card.get('neglected_areas') or []
+        if isinstance(area.get('value_score'), (int, float))
+    ]
+
+def _draw_value_score_chart(areas):
+    """Renders the neglected areas' value scores as a bar chart, returned as base64 PNG."""
+    fig = Figure(figsize=(6, 3.5)) # Adjust size as needed
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    positions = range(len(areas))
+    ax.bar(positions, [score for _, score in areas], width=0.5, color='#F9AB00')
+    ax.set_xticks(positions)
+    ax.set_xticklabels([summary for summary, _ in areas], rotation=45, fontsize=7)
+    ax.set_title('Potential Value Score', fontsize=10)
+    ax.set_ylabel('Score (1-5)', fontsize=8)
+    ax.tick_params(axis='y', labelsize=8)
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight', transparent=True) # transparent background
+    return base64.b64encode(buf.getvalue()).decode('utf-8')
+
+def _forget_failed_chart(key, future):
+    if future.exception() is not None:
+        with _chart_lock:
+            if _chart_futures.get(key) is future:
+                del _chart_futures[key]
+
+def value_score_chart(areas):
+    """
+    Returns a Future for the base64 PNG chart of [(area, score)], starting the render on a
+    worker if this data hasn't been drawn yet. Callers with the same data share one Future.
+    """
+    areas = [(str(summary), score) for summary, score in areas]
+    key = templates.content_hash(areas)
+    with _chart_lock:
+        future = _chart_futures.get(key)
+        hit = future is not None
+        if hit:
+            _chart_futures.move_to_end(key)
+        else:
+            future = _chart_futures[key] = _chart_executor.submit(bind_worker_context(_draw_value_score_chart), areas)
+            while len(_chart_futures) > CHART_CACHE_SIZE:
+                _chart_futures.popitem(last=False)
+    if not hit:
+        # Registered outside the lock: a future that has already failed runs the callback right here
+        future.add_done_callback(functools.partial(_forget_failed_chart, key))
+    instrumentation.record_cache('value_score_chart', hit)
+    return future
+
+# --- Report Cards ---
+# Styles and the flip handler for the cards iframe (static, no template fields)
+_CARDS_HEAD = """
+    <style>
+        html, body { margin: 0; padding: 0; } /* Reset html and body margins/padding within iframe */
+
+        /* CSS for cards and layout */
+        .cards-row {
+            display: flex;
+            flex-wrap: wrap;
+            justify-content: space-evenly; /* Center cards horizontally with even spacing */
+            gap: 20px;
+            margin-top: 20px;
+            margin-bottom: 20px;
+            height: 500px; /* Increased height significantly */
+        }
+        .flip-card-container {
+            background-color: transparent;
+            width: 350px;
+            height: 400px; /* Increased height significantly */
+            perspective: 1000px;
+            margin: 10px;
+            cursor: pointer;
+            flex-shrink: 0;
+        }
+        .flip-card-inner {
+            position: relative;
+            width: 100%;
+            height: 100%;
+            text-align: center;
+            transition: transform 0.8s;
+            transform-style: preserve-3d;
+            border-radius: 12px;
+            box-shadow: 0 6px 12px rgba(0,0,0,0.15);
+        }
+        .flip-card-container.flipped .flip-card-inner {
+            transform: rotateY(180deg);
+        }
+        .flip-card-front, .flip-card-back {
+            position: absolute;
+            width: 100%;
+            height: 100%;
+            -webkit-backface-visibility: hidden;
+            backface-visibility: hidden;
+            border-radius: 12px;
+            display: flex;
+            flex-direction: column;
+            justify-content: flex-start; /* Ensure content starts from the top */
+            align-items: flex-start; /* Ensure content aligns to the left */
+            box-sizing: border-box;
+            color: #3C4043;
+            font-family: 'Inter', sans-serif;
+        }
+        .flip-card-front {
+            background: linear-gradient(135deg, #e8f0fe 0%, #d2e3fc 100%);
+            display: flex;
+            justify-content: center;
+            align-items: center;
+            padding: 0px 10px;
+        }
+        .flip-card-back {
+            background-color: #ffffff;
+            transform: rotateY(180deg);
+            text-align: left;
+            overflow-y: auto;
+            font-family: 'Inter', sans-serif;
+            padding: 30px 20px 20px 20px; /* Ample top padding */
+            display: flex;
+            flex-direction: column;
+            gap: 20px;
+            min-height: 100%;
+            box-sizing: border-box;
+        }
+        .card-title {
+            font-size: 1.3em;
+            font-weight: 700;
+            margin: 0; /* Reset all margins */
+            text-align: center;
+            width: 100%;
+            padding: 0; /* Reset all padding */
+            flex-shrink: 0; /* Prevent shrinking */
+        }
+        .card-summary {
+            font-size: 0.95em;
+            line-height: 1.5;
+            display: block;
+            text-align: center; /* Centered text */
+        }
+        .card-details {
+            font-size: 0.95em;
+            line-height: 1.7;
+            margin: 0; /* Reset all margins */
+            width: 100%;
+            padding: 0; /* Reset all padding */
+            flex-grow: 1;
+            flex-shrink: 0; /* Prevent shrinking */
+        }
+        .card-details h5 {
+            font-size: 1.1em;
+            margin-top: 0; /* Reset margin-top for subheadings */
+            margin-bottom: 8px;
+            color: #5F6368;
+        }
+        .card-details ul {
+            padding-left: 20px;
+            margin-top: 0; /* Reset margin-top for ul */
+            margin-bottom: 10px;
+        }
+        .card-details li {
+            margin-bottom: 5px;
+            line-height: 1.5;
+        }
+        .card-chart-container {
+            width: 100%;
+            height: 150px;
+            margin-top: 15px;
+            border-top: 1px solid #eee;
+            padding-top: 10px;
+        }
+    </style>
+    <script>
+        // Function to toggle the 'flipped' class
+        function flipCard(cardId) {
+            console.log(`flipCard called for: ${cardId}`); // DEBUG log
+            const card = document.getElementById(cardId);
+            if (card) {
+                card.classList.toggle('flipped');
+                console.log(`Card ${cardId} flipped!`); // DEBUG log
+            } else {
+                console.log(`Card ${cardId} not found!`); // DEBUG log
+            }
+        }
+
+        // Attach event listeners after the DOM is fully loaded within the iframe
+        document.addEventListener('DOMContentLoaded', function() {
+            console.log("st_html.html DOMContentLoaded fired."); // DEBUG log
+            const cards = document.querySelectorAll('.flip-card-container');
+            console.log(`Found ${cards.length} flip card containers within iframe.`); // DEBUG log
+            cards.forEach(card => {
+                console.log(`Attaching listener to card with ID: ${card.id}`); // DEBUG log
+                card.addEventListener('click', function() {
+                    flipCard(this.id);
+                });
+            });
+            console.log("Event listeners attachment complete within iframe."); // DEBUG log
+        });
+    </script>
+"""
+
+_CARDS_ROW = templates.Template('anti_persona_cards', "{head:raw}<div class='cards-row animated-section'>{cards:raw}</div>")
+
+_FLIP_CARD = templates.Template('flip_card', """
+        <div class="flip-card-container" id="{card_id}">
+            <div class="flip-card-inner">
+                <div class="flip-card-front">
+                    <div class="card-title">{icon} {title}</div>
+                    <p class="card-summary">{summary}</p>
+                </div>
+                <div class="flip-card-back">
+                    <div class="card-title">{title} Details</div>
+                    <div class="card-details">
+                        {details:raw}
+                    </div>
+                    {chart:raw}
+                </div>
+            </div>
+        </div>
+        """)
+
+_DETAIL_LIST = templates.Template('detail_list', "<h5>{heading}</h5><ul>{items:raw}</ul>")
+_NEGLECTED_AREA = templates.Template('neglected_area', "<h6>{summary} (Value: {score}/5)</h6>{details:raw}")
+_CARD_CHART = templates.Template('card_chart', "<div class='card-chart-container'><img src='data:image/png;base64,{chart_base64}' style='width:100%; height:100%; object-fit: contain;'/></div>")
+
+# (report key, element id, icon, default title, [(list field, heading)])
+_LIST_CARDS = [
+    ('negative_marketing_card', 'nmCard', '📉', 'Negative Marketing', [
+        ('keywords_to_exclude', 'Keywords to Exclude:'),
+        ('channels_to_deprioritize', 'Channels to Deprioritize:'),
+        ('sales_red_flags', 'Sales Red Flags:'),
+    ]),
+    ('product_brief_card', 'pbCard', '🛠️', 'Product Brief', [
+        ('undesirable_features', 'Undesirable Features:'),
+        ('refinement_suggestions', 'Refinement Suggestions:'),
+        ('misuse_warnings', 'Misuse Warnings:'),
+    ]),
+]
+
+def _detail_lists(card, sections):
+    return _DETAIL_LIST.render_each(
+        {'heading': heading, 'items': templates.list_items(card[field])}
+        for field, heading in sections if card.get(field)
+    )
+
+def _opportunity_card(or_card):
+    # Usually already rendering: the chart is requested as soon as the reports arrive
+    areas = _chart_areas(or_card)
+    chart = value_score_chart(areas) if areas else None
+
+    details_html = ""
+    if or_card.get('neglected_areas'):
+        areas_html = ""
+        for area in or_card['neglected_areas']:
+            summary = area.get('area_summary', 'Unnamed Area')
+            score = area.get('value_score', 'N/A')
+            area_details = area.get('details', [])
+            areas_html += _NEGLECTED_AREA.render(
+                summary=summary, score=score,
+                details=f"<ul>{templates.list_items(area_details)}</ul>" if area_details else ""
+            )
+        details_html += "<h5>Neglected Areas &amp; Value:</h5>" + areas_html
+    details_html += _detail_lists(or_card, [('overall_exploration_ideas', 'General Exploration Ideas:')])
+
+    chart_html = ""
+    if chart is not None:
+        try:
+            chart_html = _CARD_CHART.render(chart_base64=chart.result())
+        except Exception as e:
+            st.warning(f"Could not render the value score chart: {e}")
+    return _FLIP_CARD.render(
+        card_id='orCard', icon='💡', title=or_card.get('title', 'Opportunity Report'),
+        summary=or_card.get('summary', 'N/A'), details=details_html, chart=chart_html
+    )
+
+@templates.memoize
+def _render_report_cards(reports):
+    """Builds the flip cards iframe document for a set of anti-persona reports."""
+    cards = ""
+    for key, card_id, icon, default_title, sections in _LIST_CARDS:
+        card = reports.get(key, {})
+        if card:
+            cards += _FLIP_CARD.render(
+                card_id=card_id, icon=icon, title=card.get('title', default_title),
+                summary=card.get('summary', 'N/A'), details=_detail_lists(card, sections), chart=""
+            )
+    or_card = reports.get('opportunity_report_card', {})
+    if or_card:
+        cards += _opportunity_card(or_card)
+    return _CARDS_ROW.render(head=_CARDS_HEAD, cards=cards)
+
 def render(api_key, active_main_tab_index):
     """
     Render the Anti-Persona & Opportunity Cost Analysis section.
@@ -162,11 +387,15 @@ def render(api_key, active_main_tab_index):
         if not product_description:
             st.warning("Please provide a product or service description.")
         else:
-            with st.spinner("Analyzing anti-personas and opportunity costs with Gemini AI..."):
+            with st.spinner("Analyzing anti-personas and opportunity costs with Gemini AI..."), tracing.span("anti_persona.analyze"):
                 # anti_persona_results now holds the structured reports directly
                 anti_persona_reports = generate_anti_persona_data(product_description, api_key) 
                 if anti_persona_reports:
                     st.session_state['anti_persona_reports'] = anti_persona_reports 
+                    # Start drawing the chart now so it renders while the page reruns
+                    areas = _chart_areas(anti_persona_reports.get('opportunity_report_card', {}))
+                    if areas:
+                        value_score_chart(areas)
                     st.success("Analysis complete! Interactive reports below.")
                     # Preserve the main tab state before rerunning
                     st.session_state.active_main_tab_index = active_main_tab_index
@@ -179,291 +408,7 @@ def render(api_key, active_main_tab_index):
         reports = st.session_state['anti_persona_reports']
 
         # Prepare all card HTML, CSS, and JS within a single block for st_html.html
-        all_component_html = """
-        <style>
-            html, body { margin: 0; padding: 0; } /* Reset html and body margins/padding within iframe */
-
-            /* CSS for cards and layout */
-            .cards-row {
-                display: flex;
-                flex-wrap: wrap;
-                justify-content: space-evenly; /* Center cards horizontally with even spacing */
-                gap: 20px;
-                margin-top: 20px;
-                margin-bottom: 20px;
-                height: 500px; /* Increased height significantly */
-            }
-            .flip-card-container {
-                background-color: transparent;
-                width: 350px;
-                height: 400px; /* Increased height significantly */
-                perspective: 1000px;
-                margin: 10px;
-                cursor: pointer;
-                flex-shrink: 0;
-            }
-            .flip-card-inner {
-                position: relative;
-                width: 100%;
-                height: 100%;
-                text-align: center;
-                transition: transform 0.8s;
-                transform-style: preserve-3d;
-                border-radius: 12px;
-                box-shadow: 0 6px 12px rgba(0,0,0,0.15);
-            }
-            .flip-card-container.flipped .flip-card-inner {
-                transform: rotateY(180deg);
-            }
-            .flip-card-front, .flip-card-back {
-                position: absolute;
-                width: 100%;
-                height: 100%;
-                -webkit-backface-visibility: hidden;
-                backface-visibility: hidden;
-                border-radius: 12px;
-                display: flex;
-                flex-direction: column;
-                justify-content: flex-start; /* Ensure content starts from the top */
-                align-items: flex-start; /* Ensure content aligns to the left */
-                box-sizing: border-box;
-                color: #3C4043;
-                font-family: 'Inter', sans-serif;
-            }
-            .flip-card-front {
-                background: linear-gradient(135deg, #e8f0fe 0%, #d2e3fc 100%);
-                display: flex;
-                justify-content: center;
-                align-items: center;
-                padding: 0px 10px;
-            }
-            .flip-card-back {
-                background-color: #ffffff;
-                transform: rotateY(180deg);
-                text-align: left;
-                overflow-y: auto;
-                font-family: 'Inter', sans-serif;
-                padding: 30px 20px 20px 20px; /* Ample top padding */
-                display: flex;
-                flex-direction: column;
-                gap: 20px;
-                min-height: 100%;
-                box-sizing: border-box;
-            }
-            .card-title {
-                font-size: 1.3em;
-                font-weight: 700;
-                margin: 0; /* Reset all margins */
-                text-align: center;
-                width: 100%;
-                padding: 0; /* Reset all padding */
-                flex-shrink: 0; /* Prevent shrinking */
-            }
-            .card-summary {
-                font-size: 0.95em;
-                line-height: 1.5;
-                display: block;
-                text-align: center; /* Centered text */
-            }
-            .card-details {
-                font-size: 0.95em;
-                line-height: 1.7;
-                margin: 0; /* Reset all margins */
-                width: 100%;
-                padding: 0; /* Reset all padding */
-                flex-grow: 1;
-                flex-shrink: 0; /* Prevent shrinking */
-            }
-            .card-details h5 {
-                font-size: 1.1em;
-                margin-top: 0; /* Reset margin-top for subheadings */
-                margin-bottom: 8px;
-                color: #5F6368;
-            }
-            .card-details ul {
-                padding-left: 20px;
-                margin-top: 0; /* Reset margin-top for ul */
-                margin-bottom: 10px;
-            }
-            .card-details li {
-                margin-bottom: 5px;
-                line-height: 1.5;
-            }
-            .card-chart-container {
-                width: 100%;
-                height: 150px;
-                margin-top: 15px;
-                border-top: 1px solid #eee;
-                padding-top: 10px;
-            }
-        </style>
-        <script>
-            // Function to toggle the 'flipped' class
-            function flipCard(cardId) {
-                console.log(`flipCard called for: ${cardId}`); // DEBUG log
-                const card = document.getElementById(cardId);
-                if (card) {
-                    card.classList.toggle('flipped');
-                    console.log(`Card ${cardId} flipped!`); // DEBUG log
-                } else {
-                    console.log(`Card ${cardId} not found!`); // DEBUG log
-                }
-            }
-
-            // Attach event listeners after the DOM is fully loaded within the iframe
-            document.addEventListener('DOMContentLoaded', function() {
-                console.log("st_html.html DOMContentLoaded fired."); // DEBUG log
-                const cards = document.querySelectorAll('.flip-card-container');
-                console.log(`Found ${cards.length} flip card containers within iframe.`); // DEBUG log
-                cards.forEach(card => {
-                    console.log(`Attaching listener to card with ID: ${card.id}`); // DEBUG log
-                    card.addEventListener('click', function() {
-                        flipCard(this.id);
-                    });
-                });
-                console.log("Event listeners attachment complete within iframe."); // DEBUG log
-            });
-        </script>
-        <div class='cards-row animated-section'>
-        """
-
-        # --- Negative Marketing Card ---
-        nm_card = reports.get('negative_marketing_card', {})
-        if nm_card:
-            nm_details_html = ""
-            if nm_card.get("keywords_to_exclude"):
-                keywords_html = "".join([f'<li>{item}</li>' for item in nm_card['keywords_to_exclude']])
-                nm_details_html += f"<h5>Keywords to Exclude:</h5><ul>{keywords_html}</ul>"
-            if nm_card.get("channels_to_deprioritize"):
-                channels_html = "".join([f'<li>{item}</li>' for item in nm_card['channels_to_deprioritize']])
-                nm_details_html += f"<h5>Channels to Deprioritize:</h5><ul>{channels_html}</ul>"
-            if nm_card.get("sales_red_flags"):
-                sales_red_flags_html = "".join([f'<li>{item}</li>' for item in nm_card['sales_red_flags']])
-                nm_details_html += f"<h5>Sales Red Flags:</h5><ul>{sales_red_flags_html}</ul>"
-
-            all_component_html += f"""
-            <div class="flip-card-container" id="nmCard">
-                <div class="flip-card-inner">
-                    <div class="flip-card-front">
-                        <div class="card-title">📉 {nm_card.get('title', 'Negative Marketing')}</div>
-                        <p class="card-summary">{nm_card.get('summary', 'N/A')}</p>
-                    </div>
-                    <div class="flip-card-back">
-                        <div class="card-title">{nm_card.get('title', 'Negative Marketing')} Details</div>
-                        <div class="card-details">
-                            {nm_details_html}
-                        </div>
-                    </div>
-                </div>
-            </div>
-            """
-
-        # --- Product Brief Card ---
-        pb_card = reports.get('product_brief_card', {})
-        if pb_card:
-            pb_details_html = ""
-            if pb_card.get("undesirable_features"):
-                undesirable_features_html = "".join([f'<li>{item}</li>' for item in pb_card['undesirable_features']])
-                pb_details_html += f"<h5>Undesirable Features:</h5><ul>{undesirable_features_html}</ul>"
-            if pb_card.get("refinement_suggestions"):
-                refinement_suggestions_html = "".join([f'<li>{item}</li>' for item in pb_card['refinement_suggestions']])
-                pb_details_html += f"<h5>Refinement Suggestions:</h5><ul>{refinement_suggestions_html}</ul>"
-            if pb_card.get("misuse_warnings"):
-                misuse_warnings_html = "".join([f'<li>{item}</li>' for item in pb_card['misuse_warnings']])
-                pb_details_html += f"<h5>Misuse Warnings:</h5><ul>{misuse_warnings_html}</ul>"
-
-            all_component_html += f"""
-            <div class="flip-card-container" id="pbCard">
-                <div class="flip-card-inner">
-                    <div class="flip-card-front">
-                        <div class="card-title">🛠️ {pb_card.get('title', 'Product Brief')}</div>
-                        <p class="card-summary">{pb_card.get('summary', 'N/A')}</p>
-                    </div>
-                    <div class="flip-card-back">
-                        <div class="card-title">{pb_card.get('title', 'Product Brief')} Details</div>
-                        <div class="card-details">
-                            {pb_details_html}
-                        </div>
-                    </div>
-                </div>
-            </div>
-            """
-
-        # --- Opportunity Report Card ---
-        or_card = reports.get('opportunity_report_card', {})
-        if or_card:
-            or_details_html = ""
-            opportunity_areas_for_chart = [] # Data for the bar chart
-
-            if 'neglected_areas' in or_card and or_card['neglected_areas']:
-                or_details_html += "<h5>Neglected Areas & Value:</h5>"
-                for area in or_card['neglected_areas']:
-                    summary = area.get('area_summary', 'Unnamed Area')
-                    score = area.get('value_score', 'N/A')
-                    details = area.get('details', [])
-                    or_details_html += f"<h6>{summary} (Value: {score}/5)</h6>"
-                    if details:
-                        or_details_html += "<ul>"
-                        for detail in details:
-                            or_details_html += f"<li>{detail}</li>"
-                        or_details_html += "</ul>"
-                    # Add data for chart
-                    if isinstance(score, (int, float)):
-                         opportunity_areas_for_chart.append({'Area': summary, 'Value': score})
-                or_details_html += "</ul>"
-            
-            if 'overall_exploration_ideas' in or_card and or_card['overall_exploration_ideas']:
-                 or_details_html += "<h5>General Exploration Ideas:</h5><ul>"
-                 for idea in or_card['overall_exploration_ideas']:
-                      or_details_html += f"<li>{idea}</li>"
-                 or_details_html += "</ul>"
-
-            # Generate chart as Base64 image and embed it
-            chart_img_base64 = ""
-            if opportunity_areas_for_chart:
-                df_chart = pd.DataFrame(opportunity_areas_for_chart)
-                df_chart = df_chart.set_index('Area')
-                
-                # Create matplotlib figure and axes
-                fig, ax = plt.subplots(figsize=(6, 3.5)) # Adjust size as needed
-                df_chart.plot(kind='bar', ax=ax, legend=False, color='#F9AB00')
-                ax.set_title('Potential Value Score', fontsize=10)
-                ax.set_xlabel('', fontsize=8)
-                ax.set_ylabel('Score (1-5)', fontsize=8)
-                ax.tick_params(axis='x', rotation=45, labelsize=7)
-                ax.tick_params(axis='y', labelsize=8)
-                plt.tight_layout()
-
-                # Save plot to BytesIO and encode to Base64
-                buf = io.BytesIO()
-                plt.savefig(buf, format='png', bbox_inches='tight', transparent=True) # transparent background
-                buf.seek(0)
-                chart_img_base64 = base64.b64encode(buf.read()).decode('utf-8')
-                plt.close(fig) # Close the plot to free memory
-
-            chart_html_embed = f"<div class='card-chart-container'><img src='data:image/png;base64,{chart_img_base64}' style='width:100%; height:100%; object-fit: contain;'/></div>" if chart_img_base64 else ""
-
-            all_component_html += f"""
-            <div class="flip-card-container" id="orCard">
-                <div class="flip-card-inner">
-                    <div class="flip-card-front">
-                        <div class="card-title">💡 {or_card.get('title', 'Opportunity Report')}</div>
-                        <p class="card-summary">{or_card.get('summary', 'N/A')}</p>
-                    </div>
-                    <div class="flip-card-back">
-                        <div class="card-title">{or_card.get('title', 'Opportunity Report')} Details</div>
-                        <div class="card-details">
-                            {or_details_html}
-                        </div>
-                        {chart_html_embed} <!-- Embedded chart -->
-                    </div>
-                </div>
-            </div>
-            """
-
-        all_component_html += "</div>" # Close cards-row container
-        
-        st_html(all_component_html, height=500, scrolling=False) # Increased height, removed scroll
+        render_html_component('anti_persona_cards', _render_report_cards(reports), height=500, scrolling=False) # Increased height, removed scroll
 
         # --- Suggested Anti-Personas Section ---
         if 'suggested_anti_personas' in reports and reports['suggested_anti_personas']:
@@ -0,0 +1,173 @@
+"""
+Batch messaging generation for a persona x content-type matrix.
+
+Cells run on a bounded thread pool. Every model and Imagen request they make (a
+Social Post Hooks cell makes one text call plus one per image) takes a token from
+a shared RateLimiter, so BATCH_REQUESTS_PER_MINUTE limits requests, not cells.
+Every finished cell is written straight into a zip archive on disk (raw text,
+HTML mockup and the full-resolution images behind the mockup's thumbnails), so
+memory only holds the cells still in flight. If the batch stops early, the zip
+still gets a manifest of the cells finished so far.
+"""
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import shared
+from config import Config
+from pipeline import bind_worker_context
+
+DEFAULT_BATCH_CONCURRENCY = 4
+DEFAULT_BATCH_REQUESTS_PER_MINUTE = 60
+
+CellResult = namedtuple('CellResult', ['persona_index', 'content_type', 'ok', 'error', 'duration'])
+
+
+class RateLimiter:
+    """Token bucket shared by all workers: rate_per_minute acquisitions per minute, bursts of up to `burst`."""
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.interval:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.interval)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait_for = (1 - self.tokens) * self.interval
+            time.sleep(wait_for)
+
+
+def safe_filename(name):
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', str(name)).strip('_').lower() or 'untitled'
+
+
+def persona_folder(persona_index, persona_data):
+    # The index keeps folders unique when two personas share a name
+    return f"{persona_index + 1:02d}_{safe_filename(persona_data.get('name', 'persona'))}"
+
+
+class BatchZipWriter:
+    """
+    Appends batch outputs to a zip file on disk as they arrive. Write from a single thread.
+    Used as a context manager, a temp file it created itself is removed if the block raises.
+    """
+
+    def __init__(self, path=None):
+        self._temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='messaging_batch_', suffix='.zip')
+            os.close(fd)
+        self.path = path
+        self._zip = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def write_text(self, arcname, text):
+        self._zip.writestr(arcname, text)
+
+    def write_bytes(self, arcname, data, compress=True):
+        # Already-compressed image formats are stored as-is
+        self._zip.writestr(arcname, data, compress_type=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED)
+
+    def write_cell(self, folder, content_type, raw_text, html_output, images=()):
+        stem = f"{folder}/{safe_filename(content_type)}"
+        self.write_text(f"{stem}.txt", raw_text or "")
+        self.write_text(f"{stem}.html", html_output or "")
+        for filename, image_bytes in images:
+            self.write_bytes(f"{stem}_{safe_filename(filename)}", image_bytes, compress=False)
+
+    def write_persona(self, folder, persona_data):
+        persona_export = {k: v for k, v in persona_data.items() if k != 'avatar_image'}
+        self.write_text(f"{folder}/persona.json", json.dumps(persona_export, indent=2))
+        avatar = persona_data.get('avatar_image')
+        if avatar is not None and hasattr(avatar, 'save'):
+            buffered = io.BytesIO()
+            avatar.save(buffered, format="PNG")
+            self.write_bytes(f"{folder}/avatar.png", buffered.getvalue(), compress=False)
+
+    def close(self):
+        self._zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        # Interrupted (including a Streamlit rerun or stop): nobody will download this archive
+        if exc_type is not None and self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
+        return False
+
+
+def run_matrix(personas, content_types, generate_fn, api_key, writer, max_workers=None, limiter=None):
+    """
+    Generates every (persona, content type) cell with generate_fn(persona, content_type, api_key, warnings),
+    which returns (raw_text, html_output, images, ok) and appends its warnings to the given list, and writes
+    each into writer as soon as it completes. A cell with ok False is written too, and recorded as failed
+    with its warnings (or its raw text) as the error. Yields a CellResult per cell in
+    completion order. Every request a cell makes waits for a limiter token.
+    A manifest.json with the status of every finished cell is written when the generator ends, also when it
+    is closed early; cells that haven't started by then are cancelled.
+    """
+    if max_workers is None:
+        max_workers = int(Config.get_config('BATCH_CONCURRENCY', DEFAULT_BATCH_CONCURRENCY))
+    if limiter is None:
+        limiter = RateLimiter(float(Config.get_config('BATCH_REQUESTS_PER_MINUTE', DEFAULT_BATCH_REQUESTS_PER_MINUTE)))
+
+    def generate_cell(persona_data, content_type):
+        start = time.perf_counter()
+        warnings = []
+        with shared.rate_limited(limiter):
+            raw_text, html_output, images, ok = generate_fn(persona_data, content_type, api_key, warnings)
+        error = None if ok else "; ".join(warnings) or str(raw_text)
+        return raw_text, html_output, images, error, time.perf_counter() - start
+
+    folders = [persona_folder(i, p) for i, p in enumerate(personas)]
+    for folder, persona_data in zip(folders, personas):
+        writer.write_persona(folder, persona_data)
+
+    manifest = []
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='batch')
+    try:
+        futures = {}
+        for persona_index, persona_data in enumerate(personas):
+            for content_type in content_types:
+                future = executor.submit(bind_worker_context(generate_cell), persona_data, content_type)
+                futures[future] = (persona_index, content_type)
+        for future in as_completed(futures):
+            persona_index, content_type = futures.pop(future)
+            try:
+                raw_text, html_output, images, error, duration = future.result()
+            except Exception as e:
+                result = CellResult(persona_index, content_type, False, str(e), 0.0)
+            else:
+                writer.write_cell(folders[persona_index], content_type, raw_text, html_output, images)
+                result = CellResult(persona_index, content_type, error is None, error, duration)
+            manifest.append({
+                'persona': folders[persona_index],
+                'content_type': content_type,
+                'ok': result.ok,
+                'error': result.error,
+                'duration_s': round(result.duration, 3),
+            })
+            yield result
+    finally:
+        # Stopped early (a Streamlit rerun or stop, or the caller broke out of the loop): skip the rest
+        executor.shutdown(wait=False, cancel_futures=True)
+        writer.write_text("manifest.json", json.dumps(manifest, indent=2))
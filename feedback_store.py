@@ -0,0 +1,73 @@
+"""
+Columnar store for classified feedback entries.
+
+A FeedbackStore holds one upload's entries as a single DataFrame, one column per
+field, instead of a list of per-entry dicts:
+
+    text        the feedback (pandas string dtype)
+    sentiment   categorical label: Positive, Neutral or Negative
+    confidence  the model's 0-1 confidence (float32; NaN if it gave none)
+    source      categorical: 'csv' or 'text'
+    length      characters in the text (int32)
+
+Stores are kept in session state under the digest of the upload they were built
+from (see remember()), so a CSV is classified once per session however many times
+the page reruns or a persona is rebuilt from it. Counts, filters and pages are
+vectorized queries on the frame.
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+SENTIMENTS = ['Positive', 'Neutral', 'Negative']
+SOURCES = ['csv', 'text']
+FEEDBACK_STORE_LIMIT = 8  # Uploads kept per session; the least recently used is dropped
+
+
+def upload_digest(data):
+    """Key for the store built from an upload's bytes."""
+    return hashlib.sha256(data or b'').hexdigest()[:16]
+
+
+class FeedbackStore:
+    __slots__ = ('digest', 'frame')
+
+    def __init__(self, digest, frame):
+        self.digest = digest
+        self.frame = frame
+
+    @classmethod
+    def build(cls, digest, texts, sentiments, confidences=None, source='csv'):
+        """Builds a store from parallel lists; entries are numbered from 1 in upload order."""
+        texts = pd.Series(texts, dtype='string')
+        frame = pd.DataFrame({
+            'text': texts.array,
+            'sentiment': pd.Categorical(sentiments, categories=SENTIMENTS),
+            'confidence': np.asarray([np.nan if c is None else c for c in confidences or [None] * len(texts)], dtype=np.float32),
+            'source': pd.Categorical([source] * len(texts), categories=SOURCES),
+            'length': texts.str.len().fillna(0).to_numpy(dtype=np.int32),
+        }, index=pd.RangeIndex(1, len(texts) + 1, name='Entry'))
+        return cls(digest, frame)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def counts(self):
+        """{sentiment: number of entries} for every sentiment, including zeros."""
+        return {str(k): int(v) for k, v in self.frame['sentiment'].value_counts(sort=False).items()}
+
+    def tail(self, n):
+        """The last n entries as {'text', 'sentiment'} dicts."""
+        return self.frame[['text', 'sentiment']].tail(n).astype(str).to_dict('records')
+
+    def memory_bytes(self):
+        return int(self.frame.memory_usage(deep=True).sum())
+
+
+def remember(stores, store):
+    """Adds store to a digest -> FeedbackStore dict (e.g. in session state), keeping the most recent FEEDBACK_STORE_LIMIT."""
+    stores.pop(store.digest, None)
+    stores[store.digest] = store
+    while len(stores) > FEEDBACK_STORE_LIMIT:
+        stores.pop(next(iter(stores)))
@@ -0,0 +1,61 @@
+"""
+Paginated viewer for per-entry feedback sentiment.
+
+A large CSV yields thousands of entries, and one Streamlit element per entry makes
+every rerun slow for both the server and the browser. The entries (a
+feedback_store.FeedbackStore frame) are filtered by sentiment and text search on
+the server instead, and only the current page is sent to the browser, as a
+single table.
+"""
+import math
+
+import pandas as pd
+import streamlit as st
+
+from feedback_store import SENTIMENTS
+
+PAGE_SIZES = [25, 50, 100, 250]
+_COLUMNS = {'text': 'Feedback', 'sentiment': 'Sentiment', 'confidence': 'Confidence'}
+
+
+def filter_entries(frame, sentiments=None, search=None):
+    """Entries with one of the given sentiments (any, if none are given) whose text contains search, ignoring case."""
+    mask = pd.Series(True, index=frame.index)
+    if sentiments and set(sentiments) != set(SENTIMENTS):
+        mask &= frame['sentiment'].isin(sentiments)
+    if search:
+        mask &= frame['text'].str.contains(search, case=False, regex=False)
+    return frame[mask]
+
+
+def render(frame, key="feedback_viewer"):
+    """Renders the filter controls and the current page of frame's entries."""
+    col_sentiment, col_search, col_page_size = st.columns([2, 3, 1])
+    with col_sentiment:
+        sentiments = st.multiselect("Sentiment", SENTIMENTS, default=SENTIMENTS, key=f"{key}_sentiments")
+    with col_search:
+        search = st.text_input("Search feedback", placeholder="Text contains...", key=f"{key}_search").strip()
+    with col_page_size:
+        page_size = st.selectbox("Rows per page", PAGE_SIZES, key=f"{key}_page_size")
+
+    matches = filter_entries(frame, sentiments, search)
+    page_count = max(1, math.ceil(len(matches) / page_size))
+    # Back to the first page whenever the filters (or the entries) change
+    filters = (tuple(sentiments), search, page_size, len(frame))
+    if st.session_state.get(f"{key}_filters") != filters:
+        st.session_state[f"{key}_filters"] = filters
+        st.session_state[f"{key}_page"] = 1
+
+    if matches.empty:
+        st.info("No feedback entries match these filters.")
+        return
+    page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key=f"{key}_page")
+    start = (page - 1) * page_size
+    visible = matches.iloc[start:start + page_size]
+    st.caption(f"Showing {start + 1}-{start + len(visible)} of {len(matches)} matching entries "
+               f"(page {page} of {page_count}; {len(frame)} entries in total)")
+    st.dataframe(
+        visible[[c for c in _COLUMNS if c in visible]].rename(columns=_COLUMNS),
+        use_container_width=True,
+        column_config={'Confidence': st.column_config.ProgressColumn(min_value=0.0, max_value=1.0, format="%.2f")}
+    )
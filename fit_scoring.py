@@ -0,0 +1,195 @@
+"""
+Fit scoring for the Problem-Solution radar chart.
+
+score_solutions() rates any number of candidate solutions (the persona's current
+workarounds, its ideal solution, generated solution ideas) from 1 to 5 on each of
+schemas.FIT_DIMENSIONS, and returns them as one candidates x dimensions matrix.
+
+- 'model' (default): every candidate is scored in a single schema-constrained
+  Gemini call that sees the persona's problem and expectations.
+- 'local': a hashing-vector similarity with no model call. Candidates and each
+  dimension's positive/negative descriptors are hashed into fixed-size vectors
+  and compared with one matrix product for all candidates at once.
+
+FIT_SCORING_MODE selects the mode. Candidates the model leaves out, or every
+candidate if the call fails, fall back to local scores. Results are cached per
+persona version (persona_fingerprint) and candidate list.
+"""
+import json
+import re
+import threading
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+import instrumentation
+import schemas
+import templates
+import tracing
+import validators
+from config import Config
+from shared import generate_structured, persona_fingerprint
+
+DIMENSIONS = list(schemas.FIT_DIMENSIONS)
+DIMENSION_LABELS = list(schemas.FIT_DIMENSIONS.values())
+MIN_SCORE, MAX_SCORE = 1, 5
+FIT_SCORE_CACHE_SIZE = 64
+
+# --- Local Scoring ---
+HASH_FEATURES = 2 ** 12
+_SIMILARITY_GAIN = 4.0  # How sharply the positive-negative similarity gap moves a score away from neutral
+
+# Descriptors per dimension: domain-neutral wording that signals a good fit, and wording that signals a poor one.
+# Words that read both ways (cost, time, money) appear on both sides, so only their qualifiers move a score.
+_DESCRIPTORS = {
+    'ease_of_use': (
+        "easy simple intuitive straightforward self-explanatory guided setup user-friendly effortless convenient "
+        "one place unified view all in one fewer steps clear self-service",
+        "complicated complex confusing hard difficult steep learning curve tedious cumbersome clunky frustrating "
+        "too many steps too many tools scattered disconnected several apps workaround copy between manual effort",
+    ),
+    'cost_efficiency': (
+        "affordable inexpensive cheaper low price cost-effective saves money within budget pays for itself "
+        "value for money reduces cost return on investment",
+        "expensive costly pricey overpriced fees high cost wasted money hidden cost over budget lost revenue "
+        "losses penalties",
+    ),
+    'time_savings': (
+        "automate automatically automated fast faster instant instantly real-time saves time in minutes "
+        "streamlined one click no manual",
+        "slow manual manually by hand time-consuming takes hours wasted time delays waiting repetitive "
+        "chasing weekends late",
+    ),
+    'reliability': (
+        "reliable accurate consistent dependable trusted up to date always current stable secure "
+        "source of truth never miss",
+        "error-prone unreliable inaccurate mistakes errors outdated stale inconsistent crashes downtime "
+        "missed double lost data guesswork",
+    ),
+    'scalability': (
+        "scale scalable grows with growth more users every team every location integrations flexible expandable "
+        "high volume across",
+        "limited does not scale capped small only one-off breaks down bottleneck outgrow rigid single user "
+        "one location",
+    ),
+}
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+
+
+def _features(text):
+    tokens = [t[:-1] if len(t) > 3 and t.endswith('s') else t for t in _TOKEN.findall(str(text).lower())]
+    return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+
+def hash_vectors(texts):
+    """L2-normalized hashing-trick vectors (unigrams + bigrams, signed buckets) for a list of texts."""
+    vectors = np.zeros((len(texts), HASH_FEATURES))
+    for row, text in enumerate(texts):
+        for feature in _features(text):
+            digest = zlib.crc32(feature.encode('utf-8'))
+            vectors[row, digest % HASH_FEATURES] += 1.0 if digest & 0x80000000 else -1.0
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+_POSITIVE = hash_vectors([_DESCRIPTORS[d][0] for d in DIMENSIONS])
+_NEGATIVE = hash_vectors([_DESCRIPTORS[d][1] for d in DIMENSIONS])
+
+
+def local_scores(candidates):
+    """Scores candidates on every dimension from descriptor similarity; returns a len(candidates) x len(DIMENSIONS) array."""
+    vectors = hash_vectors(candidates)
+    gap = vectors @ _POSITIVE.T - vectors @ _NEGATIVE.T
+    midpoint, half_range = (MIN_SCORE + MAX_SCORE) / 2, (MAX_SCORE - MIN_SCORE) / 2
+    return np.round(midpoint + half_range * np.tanh(_SIMILARITY_GAIN * gap), 1)
+
+
+# --- Model Scoring ---
+_PERSONA_FIELDS = (
+    'archetype',
+    'problem_description_from_persona_view_summary',
+    'current_solutions_and_their_flaws_summary',
+    'ideal_solution_expectations_summary',
+    'ideal_solution_expectations_details',
+    'pain_points_related_to_problem_details',
+)
+
+
+def _model_scores(persona, candidates):
+    """Scores every candidate in one call; rows the response leaves out are NaN."""
+    persona_context = {k: persona[k] for k in _PERSONA_FIELDS if persona.get(k)}
+    numbered = "\n".join(f"{i}. {' '.join(candidate.split())}" for i, candidate in enumerate(candidates, 1))
+    prompt = f"""
+    Rate how well each candidate solution would serve this customer, from 1 (very poor) to 5 (excellent), on: {', '.join(DIMENSION_LABELS)}.
+    Judge from the customer's problem, pain points and expectations. Score every candidate.
+
+    Customer: {json.dumps(persona_context, separators=(',', ':'), ensure_ascii=False)}
+
+    Candidates:
+    {numbered}
+    """
+    response = generate_structured("score_fit", prompt, schemas.FIT_SCORES)
+    result = validators.validate('fit_scores', response)
+    if not result.ok:
+        raise ValueError("; ".join(result.messages()))
+
+    scores = np.full((len(candidates), len(DIMENSIONS)), np.nan)
+    for entry in result.value['scores']:
+        row = entry['candidate'] - 1
+        if 0 <= row < len(candidates):
+            scores[row] = [entry[d] for d in DIMENSIONS]
+    return np.clip(scores, MIN_SCORE, MAX_SCORE)
+
+
+# --- Cache ---
+_score_cache = OrderedDict() # (persona fingerprint, candidates hash, mode) -> (scores, source)
+_score_cache_lock = threading.Lock()
+
+
+def _scoring_mode():
+    return str(Config.get_config('FIT_SCORING_MODE', 'model')).lower()
+
+
+def score_solutions(persona, candidates):
+    """
+    Returns (scores, source) for a list of candidate solution descriptions: scores is a read-only
+    len(candidates) x len(DIMENSIONS) array, source is 'model', 'local' or 'model+local'.
+    """
+    candidates = [str(candidate) for candidate in candidates]
+    if not candidates:
+        return np.empty((0, len(DIMENSIONS))), 'local'
+    mode = _scoring_mode()
+    key = (persona_fingerprint(persona), templates.content_hash(candidates), mode)
+    with _score_cache_lock:
+        cached = _score_cache.get(key)
+        if cached is not None:
+            _score_cache.move_to_end(key)
+    instrumentation.record_cache('fit_scores', cached is not None)
+    if cached is not None:
+        return cached
+
+    with tracing.span("fit_scoring.score", candidates=len(candidates), mode=mode):
+        scores, source = None, 'local'
+        if mode != 'local':
+            try:
+                scores = _model_scores(persona, candidates)
+                source = 'model'
+            except Exception as e:
+                tracing.set_attribute("fit_scoring.model_error", f"{type(e).__name__}: {e}")
+        if scores is None:
+            scores = local_scores(candidates)
+        else:
+            missing = np.isnan(scores).any(axis=1)
+            if missing.any():
+                scores[missing] = local_scores([c for c, m in zip(candidates, missing) if m])
+                source = 'model+local'
+        tracing.set_attribute("fit_scoring.source", source)
+
+    scores.setflags(write=False)
+    with _score_cache_lock:
+        _score_cache[key] = (scores, source)
+        while len(_score_cache) > FIT_SCORE_CACHE_SIZE:
+            _score_cache.popitem(last=False)
+    return scores, source
@@ -0,0 +1,253 @@
+"""
+In-process instrumentation for Gemini and Imagen calls.
+
+Every model call goes through shared.generate_content (or the Imagen request in
+shared.generate_persona_image), which records per-operation wall time,
+time-to-first-token, token counts, payload bytes and cache hits/misses here.
+Values are aggregated into fixed-bucket histograms, so recording is a bisect and
+a couple of integer increments under a lock. Rendered HTML components report
+their payload size through record_render().
+
+The aggregate can be read with snapshot() (JSON-friendly dict) or
+prometheus_text() (Prometheus exposition format), or scraped over HTTP from
+start_metrics_server() at /metrics and /metrics.json.
+"""
+import bisect
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import Config
+
+METRIC_PREFIX = "persona_engine"
+
+
+def _exponential_buckets(start, factor, count):
+    return tuple(start * factor ** i for i in range(count))
+
+
+DURATION_BUCKETS = _exponential_buckets(0.005, 2, 16)   # 5ms .. ~164s
+TOKEN_BUCKETS = _exponential_buckets(8, 2, 18)          # 8 .. ~1M tokens
+BYTE_BUCKETS = _exponential_buckets(256, 2, 18)         # 256B .. ~32MB
+
+HISTOGRAMS = {
+    'call_duration_seconds': ("Wall time of a model call.", DURATION_BUCKETS),
+    'time_to_first_token_seconds': ("Time until the first response chunk arrived.", DURATION_BUCKETS),
+    'prompt_tokens': ("Prompt token count reported in usage_metadata.", TOKEN_BUCKETS),
+    'response_tokens': ("Candidate token count reported in usage_metadata.", TOKEN_BUCKETS),
+    'request_bytes': ("Approximate request payload size.", BYTE_BUCKETS),
+    'response_bytes': ("Response payload size.", BYTE_BUCKETS),
+    'render_bytes': ("Size of an HTML component payload sent to the browser.", BYTE_BUCKETS),
+}
+
+
+class Histogram:
+    """Fixed-bucket histogram. Not thread-safe on its own; the registry lock guards it."""
+
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last slot is the +Inf bucket
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimates a quantile by linear interpolation inside the matching bucket."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for i, bucket_count in enumerate(self.counts):
+            if running + bucket_count >= target and bucket_count:
+                lower = self.bounds[i - 1] if i > 0 else 0.0
+                upper = self.bounds[i] if i < len(self.bounds) else self.bounds[-1]
+                return lower + (upper - lower) * (target - running) / bucket_count
+            running += bucket_count
+        return self.bounds[-1]
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': {('+Inf' if i == len(self.bounds) else repr(self.bounds[i])): c
+                        for i, c in enumerate(self.counts) if c},
+        }
+
+
+class MetricsRegistry:
+    """Per-operation histograms and counters behind a single lock."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}   # (metric, operation) -> Histogram
+        self._counters = {}     # (metric, operation, label_value) -> int
+
+    def observe(self, metric, operation, value):
+        with self._lock:
+            histogram = self._histograms.get((metric, operation))
+            if histogram is None:
+                histogram = self._histograms[(metric, operation)] = Histogram(HISTOGRAMS[metric][1])
+            histogram.observe(value)
+
+    def increment(self, metric, operation, label_value, amount=1):
+        key = (metric, operation, label_value)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def snapshot(self):
+        """Returns {'operations': {operation: {metric: summary}}} suitable for json.dumps."""
+        with self._lock:
+            operations = {}
+            for (metric, operation), histogram in self._histograms.items():
+                operations.setdefault(operation, {})[metric] = histogram.as_dict()
+            for (metric, operation, label_value), count in self._counters.items():
+                operations.setdefault(operation, {}).setdefault(metric, {})[label_value] = count
+        return {'operations': operations}
+
+    def prometheus_text(self):
+        """Renders all metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        by_metric = {}
+        for (metric, operation), histogram in histograms:
+            by_metric.setdefault(metric, []).append((operation, histogram))
+        for metric, series in by_metric.items():
+            name = f"{METRIC_PREFIX}_{metric}"
+            lines.append(f"# HELP {name} {HISTOGRAMS[metric][0]}")
+            lines.append(f"# TYPE {name} histogram")
+            for operation, histogram in series:
+                label = _escape_label(operation)
+                cumulative = 0
+                for i, bound in enumerate(histogram.bounds):
+                    cumulative += histogram.counts[i]
+                    lines.append(f'{name}_bucket{{operation="{label}",le="{bound:g}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{operation="{label}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{operation="{label}"}} {histogram.total:g}')
+                lines.append(f'{name}_count{{operation="{label}"}} {histogram.count}')
+        counter_labels = {'calls_total': 'status', 'cache_total': 'result'}
+        seen_counters = set()
+        for (metric, operation, label_value), count in counters:
+            name = f"{METRIC_PREFIX}_{metric}"
+            if metric not in seen_counters:
+                seen_counters.add(metric)
+                lines.append(f"# TYPE {name} counter")
+            label_name = counter_labels.get(metric, 'label')
+            lines.append(f'{name}{{operation="{_escape_label(operation)}",{label_name}="{_escape_label(label_value)}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+def record_call(operation, wall_time, time_to_first_token=None, prompt_tokens=None, response_tokens=None,
+                request_bytes=None, response_bytes=None, status="ok"):
+    """Records one completed (or failed) model call."""
+    registry.increment('calls_total', operation, status)
+    registry.observe('call_duration_seconds', operation, wall_time)
+    if time_to_first_token is not None:
+        registry.observe('time_to_first_token_seconds', operation, time_to_first_token)
+    if prompt_tokens is not None:
+        registry.observe('prompt_tokens', operation, prompt_tokens)
+    if response_tokens is not None:
+        registry.observe('response_tokens', operation, response_tokens)
+    if request_bytes is not None:
+        registry.observe('request_bytes', operation, request_bytes)
+    if response_bytes is not None:
+        registry.observe('response_bytes', operation, response_bytes)
+
+
+def record_cache(operation, hit):
+    """Records a cache lookup for an operation as a hit or a miss."""
+    registry.increment('cache_total', operation, 'hit' if hit else 'miss')
+
+
+def record_render(component, payload_bytes):
+    """Records the size of one rendered HTML component (e.g. a mockup iframe)."""
+    registry.observe('render_bytes', component, payload_bytes)
+
+
+def snapshot():
+    return registry.snapshot()
+
+
+def prometheus_text():
+    return registry.prometheus_text()
+
+
+def estimate_request_bytes(contents):
+    """Approximates the payload size of generate_content contents (text plus inline image data)."""
+    if contents is None:
+        return 0
+    if isinstance(contents, (bytes, bytearray)):
+        return len(contents)
+    if isinstance(contents, str):
+        return len(contents.encode('utf-8'))
+    if isinstance(contents, dict):
+        return sum(estimate_request_bytes(v) for k, v in contents.items() if k in ('text', 'data', 'parts'))
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_request_bytes(item) for item in contents)
+    return 0
+
+
+# --- Scrape Endpoint ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body = json.dumps(snapshot()).encode('utf-8')
+            content_type = 'application/json'
+        elif self.path.startswith('/metrics'):
+            body = prometheus_text().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+_metrics_server = None
+_metrics_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, host='127.0.0.1'):
+    """
+    Starts the scrape endpoint once per process (Streamlit reruns call this repeatedly).
+    The port defaults to the METRICS_PORT setting; returns None when it is unset.
+    """
+    global _metrics_server
+    port = port if port is not None else Config.get_config('METRICS_PORT')
+    if port is None:
+        return None
+    with _metrics_server_lock:
+        if _metrics_server is None:
+            _metrics_server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+            _metrics_server.daemon_threads = True
+            threading.Thread(target=_metrics_server.serve_forever, name='metrics', daemon=True).start()
+        return _metrics_server
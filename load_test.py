@@ -0,0 +1,364 @@
+"""
+Concurrent-session load test for the engine functions.
+
+Simulates N researchers using the app at the same time. Each simulated session
+runs the real engine functions end to end against the mock backend:
+persona build from a CSV, refinement, all five messaging types,
+problem-solution with solution ideas, and the anti-persona analysis.
+
+Usage:
+    python load_test.py --users 20 --iterations 2 --latency uniform:100,400
+    python load_test.py --users 50 --base-url http://127.0.0.1:8765 --json results.json
+
+Every session gets its own inputs (feedback, refinement, problem statement and
+product description are salted with the user and iteration), and the personas
+it gets back are renamed the same way, because the mock returns one canned
+persona for every prompt. Otherwise the process-wide caches (persona context
+models, rendered HTML, fit scores, image contexts, charts) would answer most
+sessions after the first. --cold also empties those caches before every session.
+
+Reports throughput and p50/p95/p99 latency per operation, memory per session, and
+the hit rate of every cache lookup made during the run.
+"""
+import argparse
+import json
+import logging
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+import anti_persona_engine
+import fit_scoring
+import instrumentation
+import messaging_generator
+import mock_server
+import pipeline
+import problem_solution_fit
+import shared
+
+API_KEY = "load-test-key"
+
+MESSAGING_CONTENT_TYPES = [
+    "Landing Page Copy",
+    "Pitch Slide Headlines",
+    "Cold Email / Re-engagement Campaigns",
+    "Taglines / Hero Section Ideas",
+    "Social Post Hooks"
+]
+
+SAMPLE_FEEDBACK = [
+    "The app is too complicated, I just want a simple way to track expenses.",
+    "Love the new design, very intuitive and fast!",
+    "Onboarding was overwhelming and I almost gave up.",
+    "Syncing with my bank fails every other day.",
+    "Reports are great but exporting to Excel is clunky.",
+    "Customer support answered within minutes, impressive.",
+    "I wish there was a dark mode for late-night budgeting.",
+    "Pricing feels steep for a solo freelancer.",
+]
+
+
+def build_sample_csv(rows, salt=""):
+    """Returns CSV bytes with a 'feedback' column of the given length; salt makes the upload unique."""
+    entries = [f"{SAMPLE_FEEDBACK[i % len(SAMPLE_FEEDBACK)]} (respondent {i + 1}{salt})" for i in range(rows)]
+    return pd.DataFrame({'feedback': entries}).to_csv(index=False).encode('utf-8')
+
+
+# --- Measurement ---
+class LatencyRecorder:
+    """Thread-safe collection of per-operation latencies and failures."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+        self.failures = {}
+
+    def record(self, operation, seconds, ok=True):
+        with self._lock:
+            self.samples.setdefault(operation, []).append(seconds)
+            if not ok:
+                self.failures[operation] = self.failures.get(operation, 0) + 1
+
+    def timed(self, operation, fn, *args, **kwargs):
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            # Messaging generators report failures in-band: their result tuple ends with ok=False
+            ok = result is not None and not (isinstance(result, tuple) and result[-1] is False)
+            return result
+        finally:
+            self.record(operation, time.perf_counter() - start, ok)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate retained size of an object graph, counting PIL images by their pixel buffers."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, shared.PIL_Image.Image):
+        return sys.getsizeof(obj) + len(obj.getbands()) * obj.width * obj.height
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+
+def _peak_rss_bytes():
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def clear_caches():
+    """Empties the process-wide result caches, so the next session computes everything again."""
+    with shared._persona_context_lock:
+        shared._persona_context_models.clear()
+    with shared._image_context_lock:
+        shared._image_contexts.clear()
+    with fit_scoring._score_cache_lock:
+        fit_scoring._score_cache.clear()
+    with anti_persona_engine._chart_lock:
+        anti_persona_engine._chart_futures.clear()
+    for module in (messaging_generator, problem_solution_fit, anti_persona_engine):
+        for renderer in vars(module).values():
+            if callable(getattr(renderer, 'cache_clear', None)):
+                renderer.cache_clear()
+
+
+def cache_hit_rates(before, after):
+    """{operation: {'hits', 'lookups', 'hit_rate'}} for the cache lookups recorded between two snapshots."""
+    rates = {}
+    for operation, metrics in after['operations'].items():
+        counts = metrics.get('cache_total')
+        if not counts:
+            continue
+        previous = before['operations'].get(operation, {}).get('cache_total', {})
+        hits = counts.get('hit', 0) - previous.get('hit', 0)
+        lookups = hits + counts.get('miss', 0) - previous.get('miss', 0)
+        if lookups:
+            rates[operation] = {'hits': hits, 'lookups': lookups, 'hit_rate': hits / lookups}
+    return rates
+
+
+# --- Simulated Session ---
+def _salted(persona, salt):
+    # The mock answers every session with the same persona; a distinct name gives each session its own
+    if persona:
+        persona['name'] = f"{persona.get('name') or 'Persona'}{salt}"
+    return persona
+
+
+def run_session(recorder, csv_bytes, think_time=0.0, salt=""):
+    """
+    Runs one researcher's workflow through the engine functions. salt is appended to the
+    session's inputs and persona names so its requests don't repeat another session's.
+    Returns the session-state dict the Streamlit app would hold afterwards.
+    """
+    session_state = {'generated_personas': [], 'messaging_outputs': {}}
+
+    def persona_build():
+        results = {}
+        for result in pipeline.build_persona_pipeline(csv_bytes=csv_bytes, api_key=API_KEY).run():
+            results[result.name] = result.value
+        session_state['feedback_store'] = results.get('row_sentiment')
+        persona = results.get('persona')
+        if persona and results.get('avatar'):
+            persona['avatar_image'] = results['avatar']
+        return _salted(persona, salt)
+
+    persona = recorder.timed('persona_build_csv', persona_build)
+    if persona:
+        session_state['generated_personas'].append(persona)
+    time.sleep(think_time)
+
+    if persona:
+        refined = recorder.timed('refine', shared.refine_persona_with_gemini, persona, f"Add a pain point about time management{salt}")
+        if refined:
+            refined['avatar_image'] = persona.get('avatar_image')
+            _salted(refined, salt)
+            session_state['generated_personas'][0] = refined
+            persona = refined
+        time.sleep(think_time)
+
+        for content_type in MESSAGING_CONTENT_TYPES:
+            session_state['messaging_outputs'][content_type] = recorder.timed(
+                f'messaging:{content_type}', messaging_generator._generate_content_for_persona, persona, content_type, API_KEY
+            )
+            time.sleep(think_time)
+
+    problem_persona = recorder.timed(
+        'problem_solution', shared.generate_problem_solution_persona,
+        f"Small business owners struggle to manage inventory across multiple sales channels.{salt}"
+    )
+    _salted(problem_persona, salt)
+    session_state['problem_solution_persona'] = problem_persona
+    if problem_persona:
+        session_state['solution_ideas'] = recorder.timed('solution_ideas', problem_solution_fit.generate_solution_ideas, problem_persona)
+    time.sleep(think_time)
+
+    session_state['anti_persona_reports'] = recorder.timed(
+        'anti_persona', anti_persona_engine.generate_anti_persona_data,
+        f"A mobile app that helps busy professionals track daily water intake.{salt}", API_KEY
+    )
+    return session_state
+
+
+def run_load_test(users, iterations=1, csv_rows=20, ramp_up=0.0, think_time=0.0, cold=False):
+    """
+    Runs users x iterations sessions concurrently, each with its own salted inputs.
+    With cold=True the process-wide caches are emptied before every session. Returns a results dict.
+    """
+    recorder = LatencyRecorder()
+    session_sizes = []
+    sizes_lock = threading.Lock()
+    rss_before = _peak_rss_bytes()
+    metrics_before = instrumentation.snapshot()
+
+    def user_loop(user_index):
+        if ramp_up and users > 1:
+            time.sleep(ramp_up * user_index / (users - 1))
+        for iteration in range(iterations):
+            salt = f" [user {user_index + 1}, run {iteration + 1}]"
+            if cold:
+                clear_caches()
+            state = run_session(recorder, build_sample_csv(csv_rows, salt), think_time, salt)
+            size = deep_sizeof(state)
+            with sizes_lock:
+                session_sizes.append(size)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users, thread_name_prefix='session') as executor:
+        list(executor.map(user_loop, range(users)))
+    wall = time.perf_counter() - start
+    rss_after = _peak_rss_bytes()
+
+    operations = {}
+    total_ops = 0
+    for operation, values in sorted(recorder.samples.items()):
+        ordered = sorted(values)
+        total_ops += len(ordered)
+        operations[operation] = {
+            'count': len(ordered),
+            'failures': recorder.failures.get(operation, 0),
+            'throughput_per_s': len(ordered) / wall if wall else 0.0,
+            'p50_ms': percentile(ordered, 50) * 1000,
+            'p95_ms': percentile(ordered, 95) * 1000,
+            'p99_ms': percentile(ordered, 99) * 1000,
+            'max_ms': ordered[-1] * 1000,
+        }
+    sessions = len(session_sizes)
+    return {
+        'users': users,
+        'iterations': iterations,
+        'cold': cold,
+        'sessions': sessions,
+        'wall_time_s': wall,
+        'throughput_ops_per_s': total_ops / wall if wall else 0.0,
+        'sessions_per_s': sessions / wall if wall else 0.0,
+        'operations': operations,
+        'memory': {
+            'mean_session_state_bytes': sum(session_sizes) / sessions if sessions else 0,
+            'max_session_state_bytes': max(session_sizes) if session_sizes else 0,
+            'peak_rss_growth_per_session_bytes': (rss_after - rss_before) / sessions if sessions else 0,
+            'peak_rss_bytes': rss_after,
+        },
+        'cache_hit_rates': cache_hit_rates(metrics_before, instrumentation.snapshot()),
+    }
+
+
+def format_report(results):
+    lines = [
+        f"Users: {results['users']}  Caches: {'cold' if results.get('cold') else 'warm'}  Sessions: {results['sessions']}  Wall: {results['wall_time_s']:.2f}s  "
+        f"Throughput: {results['throughput_ops_per_s']:.2f} ops/s ({results['sessions_per_s']:.2f} sessions/s)",
+        "",
+        f"{'operation':<48}{'count':>7}{'fail':>6}{'ops/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}",
+    ]
+    for operation, stats in results['operations'].items():
+        lines.append(
+            f"{operation:<48}{stats['count']:>7}{stats['failures']:>6}{stats['throughput_per_s']:>9.2f}"
+            f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    memory = results['memory']
+    lines += [
+        "",
+        f"Session state: mean {memory['mean_session_state_bytes'] / 1024:.1f} KiB, "
+        f"max {memory['max_session_state_bytes'] / 1024:.1f} KiB",
+        f"Peak RSS: {memory['peak_rss_bytes'] / 1048576:.1f} MiB "
+        f"(+{memory['peak_rss_growth_per_session_bytes'] / 1024:.1f} KiB per session)",
+    ]
+    if results.get('cache_hit_rates'):
+        lines += ["", f"{'cache':<68}{'lookups':>9}{'hits':>7}{'hit rate':>10}"]
+        for operation, stats in results['cache_hit_rates'].items():
+            lines.append(f"{operation:<68}{stats['lookups']:>9}{stats['hits']:>7}{stats['hit_rate']:>10.0%}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test against the mock backend.")
+    parser.add_argument('--users', type=int, default=10, help="Number of concurrent simulated sessions")
+    parser.add_argument('--iterations', type=int, default=1, help="Workflows each user runs back to back")
+    parser.add_argument('--csv-rows', type=int, default=20, help="Rows in the uploaded feedback CSV")
+    parser.add_argument('--ramp-up', type=float, default=0.0, help="Seconds over which user start times are spread")
+    parser.add_argument('--think-time', type=float, default=0.0, help="Seconds a user pauses between steps")
+    parser.add_argument('--cold', action='store_true', help="Empty the process-wide caches before every session")
+    parser.add_argument('--base-url', default=None, help="Use an already running backend instead of an in-process mock")
+    parser.add_argument('--latency', default='uniform:50,250', help="Latency spec for the in-process mock")
+    parser.add_argument('--image-latency', default='uniform:500,1500')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0)
+    parser.add_argument('--image-size', type=int, default=1024)
+    parser.add_argument('--json', dest='json_path', default=None, help="Also write the results to this JSON file")
+    parser.add_argument('--metrics', dest='metrics_path', default=None,
+                        help="Write the per-call instrumentation snapshot (tokens, bytes, TTFT) to this JSON file")
+    args = parser.parse_args()
+
+    # Engine functions report through st.* which is a no-op outside a Streamlit run
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    server = None
+    base_url = args.base_url
+    if not base_url:
+        server = mock_server.start_mock_server(settings={
+            'latency': args.latency,
+            'image_latency': args.image_latency,
+            'error_rate': args.error_rate,
+            'rate_limit_rate': args.rate_limit_rate,
+            'image_size': args.image_size,
+        })
+        base_url = server.base_url
+    shared.configure_gemini(API_KEY, base_url)
+
+    try:
+        results = run_load_test(args.users, args.iterations, args.csv_rows, args.ramp_up, args.think_time, args.cold)
+    finally:
+        if server:
+            server.shutdown()
+
+    print(format_report(results))
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.metrics_path:
+        with open(args.metrics_path, 'w') as f:
+            json.dump(instrumentation.snapshot(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
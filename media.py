@@ -0,0 +1,122 @@
+"""
+Image handling for the HTML mockups.
+
+Imagen returns full-size PNGs (1-2 MB each once base64-encoded), far more than a
+mockup card displays. mockup_data_uri() embeds a thumbnail instead: downscaled so
+its longest side is MOCKUP_IMAGE_SIZE and re-encoded as WebP, or JPEG where
+Pillow lacks WebP support. The full-resolution original is kept as PNG bytes
+(png_bytes) and only offered as a download.
+
+Uploaded context images go the other way: prepare_vision_image() turns a phone
+photo (often 5-12 MB) into what the vision model needs, upright (EXIF
+orientation applied), no larger than VISION_IMAGE_SIZE and re-encoded as JPEG,
+along with a perceptual hash (dhash) for recognising near-identical uploads.
+"""
+import base64
+import io
+
+from PIL import Image as PIL_Image
+from PIL import ImageOps as PIL_ImageOps
+from PIL import features
+
+from config import Config
+
+DEFAULT_MOCKUP_IMAGE_SIZE = 640     # Longest side in px; about 2x the widest image slot in the mockups
+DEFAULT_MOCKUP_IMAGE_FORMAT = 'WEBP'
+DEFAULT_MOCKUP_IMAGE_QUALITY = 80
+
+DEFAULT_VISION_IMAGE_SIZE = 768      # Longest side in px; Gemini tiles larger images at 768x768 anyway
+DEFAULT_VISION_IMAGE_QUALITY = 85
+
+MIME_TYPES = {'WEBP': 'image/webp', 'JPEG': 'image/jpeg'}
+
+
+def _mockup_format():
+    image_format = str(Config.get_config('MOCKUP_IMAGE_FORMAT', DEFAULT_MOCKUP_IMAGE_FORMAT)).upper()
+    if image_format == 'JPG':
+        image_format = 'JPEG'
+    if image_format not in MIME_TYPES or (image_format == 'WEBP' and not features.check('webp')):
+        image_format = 'JPEG'
+    return image_format
+
+
+def _flatten(image):
+    # JPEG has no alpha channel; flatten onto white
+    if image.mode == 'RGB':
+        return image
+    background = PIL_Image.new('RGB', image.size, (255, 255, 255))
+    rgba = image.convert('RGBA')
+    background.paste(rgba, mask=rgba.getchannel('A'))
+    return background
+
+
+def thumbnail(image, max_size=None, image_format=None, quality=None):
+    """Returns (bytes, mime_type) for a copy of a PIL image scaled down to fit max_size x max_size."""
+    max_size = int(max_size or Config.get_config('MOCKUP_IMAGE_SIZE', DEFAULT_MOCKUP_IMAGE_SIZE))
+    image_format = image_format or _mockup_format()
+    quality = int(quality or Config.get_config('MOCKUP_IMAGE_QUALITY', DEFAULT_MOCKUP_IMAGE_QUALITY))
+
+    resized = image.copy()
+    resized.thumbnail((max_size, max_size), PIL_Image.LANCZOS)
+    if image_format == 'JPEG':
+        resized = _flatten(resized)
+    buffered = io.BytesIO()
+    resized.save(buffered, format=image_format, quality=quality)
+    return buffered.getvalue(), MIME_TYPES[image_format]
+
+
+def data_uri(data, mime_type):
+    return f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+
+
+def mockup_data_uri(image):
+    """The thumbnail of a PIL image as a data: URI for embedding in a mockup."""
+    return data_uri(*thumbnail(image))
+
+
+def png_bytes(image):
+    """The full-resolution image as PNG bytes, for download."""
+    buffered = io.BytesIO()
+    image.save(buffered, format="PNG")
+    return buffered.getvalue()
+
+
+# --- Vision Input ---
+def dhash(image, hash_size=8):
+    """
+    Difference hash of a PIL image as an int of hash_size**2 bits: one bit per pair of horizontally
+    adjacent pixels in a small grayscale copy. Re-encoded, resized or lightly edited copies of an
+    image differ in only a few bits.
+    """
+    small = image.convert('L').resize((hash_size + 1, hash_size), PIL_Image.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hash_distance(a, b):
+    """Number of differing bits between two dhash values."""
+    return bin(a ^ b).count('1')
+
+
+def prepare_vision_image(image_bytes):
+    """
+    Returns (bytes, mime_type, dhash) for an uploaded image, ready to send to the vision model.
+    Raises PIL.UnidentifiedImageError (an OSError) if the bytes aren't an image Pillow can read.
+    """
+    max_size = int(Config.get_config('VISION_IMAGE_SIZE', DEFAULT_VISION_IMAGE_SIZE))
+    quality = int(Config.get_config('VISION_IMAGE_QUALITY', DEFAULT_VISION_IMAGE_QUALITY))
+
+    with PIL_Image.open(io.BytesIO(image_bytes)) as source:
+        # JPEG can decode at 1/2, 1/4 or 1/8 scale, skipping most of the work for large photos
+        source.draft('RGB', (max_size, max_size))
+        image = PIL_ImageOps.exif_transpose(source)
+    image.thumbnail((max_size, max_size), PIL_Image.LANCZOS)
+    image = _flatten(image)
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG', quality=quality, optimize=True)
+    return buffered.getvalue(), MIME_TYPES['JPEG'], dhash(image)
@@ -1,13 +1,23 @@
 import streamlit as st
-from shared import text_model, generate_persona_image, generation_model # Import necessary functions and models
+from shared import text_model, generate_structured, generate_persona_image, generation_model, persona_fingerprint, generate_with_persona_context, render_html_component # Import necessary functions and models
 import json
-import base64
-from datetime import datetime
-import re # Import re for parsing JSON from markdown
-import io # Import io for image processing
 from PIL import Image as PIL_Image # Import PIL Image
-
-def _generate_content_for_persona(persona_data, content_type, api_key):
+import tracing
+from schemas import MESSAGING_SCHEMAS
+import validators
+import templates
+import media
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from pipeline import bind_worker_context
+import batch_generator
+import os
+import pandas as pd
+
+MESSAGING_OUTPUTS_LIMIT = 4 # Persona versions whose generated messaging is kept per session
+
+def _persona_context_prompt(persona_data):
+    """The persona description shared by every content type; sent once per persona version."""
     persona_name = persona_data.get('name', 'the user')
     persona_archetype = persona_data.get('archetype', 'a typical customer')
     motivations = persona_data.get('motivations_details', [])
@@ -18,8 +28,8 @@ def _generate_content_for_persona(persona_data, content_type, api_key):
     aspirations_summary = persona_data.get('aspirations_summary', '')
     scenario = persona_data.get('typical_scenario', '')
 
-    base_prompt = f"""
-You are an expert marketing copywriter and product strategist. Generate {content_type} for the following customer persona. Use their motivations, pain points, aspirations, and archetype to make the content highly relevant and persuasive.
+    return f"""
+You are an expert marketing copywriter and product strategist. You write content for the following customer persona. Use their motivations, pain points, aspirations, and archetype to make the content highly relevant and persuasive.
 
 Persona Name: {persona_name}
 Archetype: {persona_archetype}
@@ -29,331 +39,151 @@ Aspirations: {aspirations_summary} {', '.join(aspirations)}
 Typical Scenario: {scenario}
 """
 
-    if content_type == "Landing Page Copy":
-        prompt = base_prompt + """
-Generate a landing page copy in JSON format. The JSON should have the following structure:
-{
-    "Hero": {
-        "Headline": "A compelling headline (string, MUST be a descriptive, non-empty headline)",
-        "Sub-headline": "A concise sub-headline (string, MUST be a descriptive, non-empty sub-headline)"
-    },
-    "Problem": {
-        "Title": "Problem title (string, MUST be a descriptive, non-empty title)",
-        "Paragraph_1": "Description of the problem (string, MUST be a descriptive, non-empty paragraph)",
-        "Bullet_Points": ["Bullet point 1 (string, MUST be a descriptive, non-empty bullet point)", "Bullet point 2 (string, MUST be a descriptive, non-empty bullet point)", "Bullet point 3 (string, MUST be a descriptive, non-empty bullet point)"]
-    },
-    "Solution": {
-        "Title": "Solution title (string, MUST be a descriptive, non-empty title)",
-        "Paragraph_1": "Description of the solution (string, MUST be a descriptive, non-empty paragraph)",
-        "Features": ["Feature 1 (string, MUST be a descriptive, non-empty feature)", "Feature 2 (string, MUST be a descriptive, non-empty feature)", "Feature 3 (string, MUST be a descriptive, non-empty feature)"],
-        "Paragraph_2": "Further explanation of the solution (string, MUST be a descriptive, non-empty paragraph)"
-    },
-    "Call to Action": {
-        "Button_Text": "Text for the call to action button (string, MUST be a descriptive, non-empty button text)",
-        "Subtext": "Optional subtext for the call to action (string, if provided, MUST be descriptive and non-empty)"
-    }
-}
-All strings in the JSON must contain meaningful, non-empty content. Respond with ONLY the JSON object, ensuring it is valid and contains no extra text or markdown outside the JSON block.
-"""
-    elif content_type == "Pitch Slide Headlines":
-        prompt = base_prompt + """
-Generate 5-7 concise, compelling pitch slide headlines for an investor deck. Each headline should capture a key aspect of the product/solution in a way that resonates with the persona's problems and aspirations, and hints at market opportunity.
-
-Respond with a JSON object in this exact format:
-{
-    "headlines": [
-        "Headline 1 (string, MUST be non-empty and compelling)",
-        "Headline 2 (string, MUST be non-empty and compelling)",
-        "Headline 3 (string, MUST be non-empty and compelling)",
-        "Headline 4 (string, MUST be non-empty and compelling)",
-        "Headline 5 (string, MUST be non-empty and compelling)"
-    ]
+# Task-specific instructions; the output structure comes from schemas.MESSAGING_SCHEMAS
+_MESSAGING_PROMPTS = {
+    "Landing Page Copy": "Write landing page copy for this persona: a hero headline and sub-headline, the problem they face, how the solution addresses it, and a call to action. Every field must contain meaningful content.",
+    "Pitch Slide Headlines": "Write 5-7 concise, compelling pitch slide headlines for an investor deck. Each headline should capture a key aspect of the product/solution in a way that resonates with the persona's problems and aspirations, and hints at market opportunity.",
+    "Cold Email / Re-engagement Campaigns": "Write a short, personalized cold email (or re-engagement email) for this persona: a catchy subject line and a body under 100 words that addresses a key pain point, offers a clear value proposition and ends with a call to action.",
+    "Taglines / Hero Section Ideas": "Write 5-7 short, memorable taglines or hero section ideas for a website. They should instantly communicate the core value proposition and resonate with the persona's primary motivation or aspiration.",
+    "Social Post Hooks": "Write 3-5 engaging social media post hooks (for Twitter, LinkedIn, or Instagram). Each hook should be short, attention-grabbing, and pique the persona's interest by addressing a pain point or aspiration. Include relevant emojis.",
 }
-All strings in the list must be non-empty and descriptive. Ensure the response is valid JSON with no extra text or markdown outside the JSON block.
-"""
-    elif content_type == "Cold Email / Re-engagement Campaigns":
-        prompt = base_prompt + """
-Generate a short, personalized cold email (or re-engagement email) for this persona. Include a catchy subject line, a brief body that addresses a key pain point and offers a clear value proposition, and a call to action. Keep it under 100 words.
 
-Respond with a JSON object in this exact format:
-{
-    "subject": "Your compelling subject line here (string, MUST be non-empty)",
-    "body": "Your email body here. Can include multiple paragraphs separated by newlines. (string, MUST be non-empty)"
-}
-All strings in the JSON must contain meaningful, non-empty content. Ensure the response is valid JSON with no extra text or markdown outside the JSON block.
-"""
-    elif content_type == "Taglines / Hero Section Ideas":
-        prompt = base_prompt + """
-Generate 5-7 short, memorable taglines or hero section ideas for a website. These should instantly communicate the core value proposition and resonate with the persona's primary motivation or aspiration.
-
-Respond with a JSON object in this exact format:
-{
-    "taglines": [
-        "Tagline 1 (string, MUST be non-empty and memorable)",
-        "Tagline 2 (string, MUST be non-empty and memorable)",
-        "Tagline 3 (string, MUST be non-empty and memorable)",
-        "Tagline 4 (string, MUST be non-empty and memorable)",
-        "Tagline 5 (string, MUST be non-empty and memorable)"
-    ]
-}
-All strings in the list must be non-empty and descriptive. Ensure the response is valid JSON with no extra text or markdown outside the JSON block.
-"""
-    elif content_type == "Social Post Hooks":
-        prompt = base_prompt + """
-Generate 3-5 engaging social media post hooks (for Twitter, LinkedIn, or Instagram). Each hook should be short, attention-grabbing, and designed to pique the persona's interest by addressing a pain point or aspiration. Include relevant emojis.
-
-Respond with a JSON object in this exact format:
-{
-    "posts": [
-        "Hook 1 including relevant emojis ✨ (string, MUST be non-empty)",
-        "Hook 2 addressing a pain point 😬 (string, MUST be non-empty)",
-        "Hook 3 with a call to action 👉 (string, MUST be non-empty)"
-    ]
-}
-All strings in the list must be non-empty and descriptive. Ensure the response is valid JSON with no extra text or markdown outside the JSON block.
-"""
-    else:
-        return "Invalid content type.", "<h2>Invalid content type.</h2>"
+def _generate_content_for_persona(persona_data, content_type, api_key, warnings=None):
+    """
+    Returns (raw_text, html_output, images, ok). The HTML mockup embeds thumbnails only;
+    images holds the full-resolution originals as (filename, PNG bytes) for download.
+    ok is False when the content couldn't be generated or failed validation; raw_text then
+    holds the error or the unusable response, and html_output shows it. Warnings are shown with st.warning, or appended to `warnings` if a list is given
+    (callers on worker threads show them afterwards, on the script thread).
+    """
+    def warn(message):
+        if warnings is None:
+            st.warning(message)
+        else:
+            warnings.append(message)
+
+    if content_type not in _MESSAGING_PROMPTS:
+        return "Invalid content type.", "<h2>Invalid content type.</h2>", [], False
 
     raw_text = ""
     html_output = ""
+    images = []
     parsed_content = None
-    error_message = None
 
     try:
-        response = text_model.generate_content(prompt)
-        raw_text = response.text.strip()
-        
-        # --- Attempt JSON Parsing First (more robust) ---
-        json_string = None
-        parsed_content = None
-
-        # Try finding JSON object or array using regex
-        json_match = re.search(r'```json\n(.*)\n```', raw_text, re.DOTALL)
-        if json_match:
-            json_string = json_match.group(1)
-        else:
-            # If no markdown code block, try finding the first { and last }
-            start_index = raw_text.find('{')
-            end_index = raw_text.rfind('}')
-            # Also try finding the first [ and last ] for array responses
-            start_array_index = raw_text.find('[')
-            end_array_index = raw_text.rfind(']')
-
-            if start_index != -1 and end_index != -1 and end_index > start_index:
-                # Found a potential object
-                json_string = raw_text[start_index : end_index + 1]
-            elif start_array_index != -1 and end_array_index != -1 and end_array_index > start_array_index:
-                # Found a potential array (might be the case for Social Hooks)
-                json_string = raw_text[start_array_index : end_array_index + 1]
-            else:
-                # If no JSON structure found, raise error to go to fallback
-                raise json.JSONDecodeError("No JSON structure found", raw_text, 0)
-
-        # Attempt to load the identified JSON string
-        if json_string:
-            try:
-                parsed_content = json.loads(json_string)
-            except json.JSONDecodeError:
-                # If direct load fails, try cleaning up common issues
-                cleaned_json_string = re.sub(r',\s*}', '}', json_string)
-                cleaned_json_string = re.sub(r',\s*\]', ']', cleaned_json_string)
-                cleaned_json_string = re.sub(r'//.*', '', cleaned_json_string)
-                
-                try:
-                    parsed_content = json.loads(cleaned_json_string)
-                except json.JSONDecodeError as e:
-                    st.error(f"Failed to parse cleaned JSON: {e}")
-                    raise e
-
-        # --- Generate HTML based on content type and parsed JSON ---
-        if content_type == "Landing Page Copy" and parsed_content:
-            flat_content = {}
-
-            # Hero Section
-            hero = parsed_content.get('Hero', {})
-            if isinstance(hero, dict):
-                headline = hero.get('Headline', '').strip()
-                sub_headline = hero.get('Sub-headline', '').strip()
-                flat_content['Hero'] = f"{headline}\n{sub_headline}".strip()
-            elif isinstance(hero, str):
-                flat_content['Hero'] = hero.strip()
-
-            # Problem Section
-            problem = parsed_content.get('Problem', {})
-            if isinstance(problem, dict):
-                title = problem.get('Title', '').strip()
-                paragraph = problem.get('Paragraph_1', '').strip()
-                points = problem.get('Bullet_Points', [])
-                
-                problem_parts = []
-                if title: problem_parts.append(title)
-                if paragraph: problem_parts.append(paragraph)
-                if points and isinstance(points, list):
-                    cleaned_points = [f'- {p.strip()}' for p in points if isinstance(p, str) and p.strip()]
-                    problem_parts.extend(cleaned_points)
+        # Only the task-specific prompt is sent; the persona context lives on the model
+        parsed_content = generate_with_persona_context(
+            f"generate_content_for_persona[{content_type}]",
+            _persona_context_prompt(persona_data),
+            _MESSAGING_PROMPTS[content_type],
+            MESSAGING_SCHEMAS[content_type]
+        )
+        raw_text = json.dumps(parsed_content, indent=2, ensure_ascii=False)
+
+        # --- Validate, then generate HTML based on content type ---
+        # The compiled schema validator strips strings and drops empty or malformed entries
+        result = validators.validate(content_type, parsed_content)
+        if not result.ok:
+            warn(f"Could not use the generated {content_type} ({'; '.join(result.messages())}). Displaying raw text.")
+            return raw_text, f"<pre>{templates.escape(raw_text)}</pre>", [], False
+        content = result.value
+
+        if content_type == "Landing Page Copy":
+            hero, problem, solution, cta = content['Hero'], content['Problem'], content['Solution'], content['Call to Action']
+            flat_content = {
+                'Hero': f"{hero['Headline']}\n{hero['Sub-headline']}",
+                'Problem': "\n\n".join([problem['Title'], problem['Paragraph_1']] + [f'- {p}' for p in problem['Bullet_Points']]),
+                'Solution': "\n\n".join([solution['Title'], solution['Paragraph_1']] + [f'- {f}' for f in solution['Features']] + [solution['Paragraph_2']]),
+                'Call to Action': "\n".join([cta['Button_Text']] + ([cta['Subtext']] if cta.get('Subtext') else [])),
+            }
+            html_output = _create_landing_page_html(flat_content)
+
+        elif content_type == "Pitch Slide Headlines":
+            html_output = _create_pitch_slides_html(content['headlines'])
+
+        elif content_type == "Cold Email / Re-engagement Campaigns":
+            html_output = _create_email_html(content['subject'], content['body'])
+
+        elif content_type == "Taglines / Hero Section Ideas":
+            html_output = _create_taglines_html(content['taglines'])
+
+        elif content_type == "Social Post Hooks":
+            posts = content['posts']
+            # Prepare list to hold posts with images
+            posts_with_images = []
+            for i, post_text in enumerate(posts):
+                platform = "twitter" if i % 3 == 0 else "linkedin" if i % 3 == 1 else "instagram"
+                image_src = None # Thumbnail data URI for the mockup
                 
-                flat_content['Problem'] = "\n\n".join(problem_parts)
-            elif isinstance(problem, str):
-                flat_content['Problem'] = problem.strip()
-
-            # Solution Section
-            solution = parsed_content.get('Solution', {})
-            if isinstance(solution, dict):
-                title = solution.get('Title', '').strip()
-                paragraph1 = solution.get('Paragraph_1', '').strip()
-                features = solution.get('Features', [])
-                paragraph2 = solution.get('Paragraph_2', '').strip()
-
-                solution_parts = []
-                if title: solution_parts.append(title)
-                if paragraph1: solution_parts.append(paragraph1)
-                if features and isinstance(features, list):
-                    cleaned_features = [f'- {f.strip()}' for f in features if isinstance(f, str) and f.strip()]
-                    solution_parts.extend(cleaned_features)
-                if paragraph2: solution_parts.append(paragraph2)
-
-                flat_content['Solution'] = "\n\n".join(solution_parts)
-            elif isinstance(solution, str):
-                flat_content['Solution'] = solution.strip()
-
-            # Call to Action Section
-            cta = parsed_content.get('Call to Action', {})
-            if isinstance(cta, dict):
-                button_text = cta.get('Button_Text', '').strip()
-                subtext = cta.get('Subtext', '').strip()
-                cta_parts = []
-                if button_text: cta_parts.append(button_text)
-                if subtext: cta_parts.append(subtext)
-                flat_content['Call to Action'] = "\n".join(cta_parts)
-            elif isinstance(cta, str):
-                flat_content['Call to Action'] = cta.strip()
-
-            # Check if we have any content
-            if any(value.strip() for value in flat_content.values()):
-                html_output = _create_landing_page_html(flat_content)
-            else:
-                st.warning(f"Parsed JSON for {content_type} but could not extract sufficient content. Displaying raw text.")
-                html_output = f"<pre>{raw_text}</pre>"
-
-        elif content_type == "Pitch Slide Headlines" and parsed_content:
-            headlines = parsed_content.get('headlines', [])
-            
-            # Add check for valid list of strings
-            if isinstance(headlines, list) and headlines and all(isinstance(h, str) and h.strip() for h in headlines):
-                html_output = _create_pitch_slides_html(headlines)
-            elif isinstance(headlines, list) and not all(isinstance(h, str) and h.strip() for h in headlines):
-                 st.warning("Parsed JSON for Pitch Slide Headlines, but content list contains non-string or empty elements. Displaying raw text.")
-                 html_output = f"<pre>{raw_text}</pre>"
-            else:
-                st.warning("No valid 'headlines' list found in the response. Displaying raw text.")
-                html_output = f"<pre>{raw_text}</pre>"
-
-        elif content_type == "Cold Email / Re-engagement Campaigns" and parsed_content:
-            subject = parsed_content.get('subject', '')
-            body = parsed_content.get('body', '')
+                # Only generate images for Instagram and LinkedIn
+                if platform in ["instagram", "linkedin"]:
+                     # Create a prompt for the image based on the post text and persona
+                     image_prompt = f"Create a compelling visual concept for a social media post designed for {platform.capitalize()} with the following message: '{post_text}'. The image should be highly relevant to the message content, visually striking, and aligned with the overall persona: {persona_data.get('summary', persona_data.get('archetype', 'customer'))}. Focus on capturing the feeling or key idea of the post."
+                     try:
+                          # Generate image
+                          generated_image = generate_persona_image(image_prompt, api_key=api_key)
+                          if generated_image:
+                              # The mockup gets a small WebP/JPEG; the original PNG is kept for download
+                              image_src = media.mockup_data_uri(generated_image)
+                              images.append((f"post_{i+1}_{platform}.png", media.png_bytes(generated_image)))
+                     except Exception as img_e:
+                          warn(f"Could not generate image for post {i+1}: {img_e}")
+                          image_src = None # Ensure it's None if generation fails
+
+                # Store post text and generated image (or None)
+                posts_with_images.append({'text': post_text, 'platform': platform, 'image_src': image_src})
             
-            # Add checks for valid subject and body strings
-            if isinstance(subject, str) and subject.strip() and isinstance(body, str) and body.strip():
-                html_output = _create_email_html(subject, body)
-            elif parsed_content is not None:
-                 st.warning("Parsed JSON for Cold Email, but 'subject' or 'body' are missing or not strings. Displaying raw text.")
-                 html_output = f"<pre>{raw_text}</pre>"
-            else:
-                st.warning("Could not find 'subject' or 'body' in the response. Displaying raw text.")
-                html_output = f"<pre>{raw_text}</pre>"
-
-        elif content_type == "Taglines / Hero Section Ideas" and parsed_content:
-            taglines = parsed_content.get('taglines', [])
-            
-            # Add check for valid list of strings
-            if isinstance(taglines, list) and taglines and all(isinstance(t, str) and t.strip() for t in taglines):
-                html_output = """
-                <style>
-                .tagline-item {
-                    background: linear-gradient(135deg, #f8f9fa 0%, #ffffff 100%);
-                    padding: 15px;
-                    margin: 10px 0;
-                    border-radius: 8px;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-                    transition: all 0.3s ease;
-                }
-                .tagline-item:hover {
-                    transform: translateY(-2px);
-                    box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-                    background: linear-gradient(135deg, #e8f0fe 0%, #ffffff 100%);
-                }
-                /* Instagram Gradient on Hover */
-                .tagline-item:hover {
-                    background: linear-gradient(to right, #833ab4, #fd1d1d, #fcb045); /* Instagram colors */
-                    color: white; /* Optional: change text color for better contrast */
-                }
-                </style>
-                <div class="taglines-container">
-                """
-                for tagline in taglines:
-                    html_output += f'<div class="tagline-item">{tagline}</div>'
-                html_output += "</div>"
-            elif isinstance(taglines, list) and not all(isinstance(t, str) and t.strip() for t in taglines):
-                st.warning("Parsed JSON for Taglines, but content list contains non-string or empty elements. Displaying raw text.")
-                html_output = f"<pre>{raw_text}</pre>"
-            else:
-                st.warning("No valid 'taglines' list found in the response. Displaying raw text.")
-                html_output = f"<pre>{raw_text}</pre>"
-
-        elif content_type == "Social Post Hooks" and parsed_content:
-            posts = parsed_content.get('posts', [])
-            
-            # Add check for valid list of strings
-            if isinstance(posts, list) and posts and all(isinstance(p, str) and p.strip() for p in posts):
-                html_output = ""
-                # Prepare list to hold posts with images
-                posts_with_images = []
-                for i, post_text in enumerate(posts):
-                    platform = "twitter" if i % 3 == 0 else "linkedin" if i % 3 == 1 else "instagram"
-                    image_base64 = None # Initialize image_base64
-                    
-                    # Only generate images for Instagram and LinkedIn
-                    if platform in ["instagram", "linkedin"]:
-                         # Create a prompt for the image based on the post text and persona
-                         image_prompt = f"Create a compelling visual concept for a social media post designed for {platform.capitalize()} with the following message: '{post_text}'. The image should be highly relevant to the message content, visually striking, and aligned with the overall persona: {persona_data.get('summary', persona_data.get('archetype', 'customer'))}. Focus on capturing the feeling or key idea of the post."
-                         try:
-                              # Generate image
-                              generated_image = generate_persona_image(image_prompt, api_key=api_key)
-                              if generated_image:
-                                  # Convert PIL Image to base64
-                                  buffered = io.BytesIO()
-                                  generated_image.save(buffered, format="PNG")
-                                  image_base64 = base64.b64encode(buffered.getvalue()).decode()
-                         except Exception as img_e:
-                              st.warning(f"Could not generate image for post {i+1}: {img_e}")
-                              image_base64 = None # Ensure it's None if generation fails
-
-                    # Store post text and generated image (or None)
-                    posts_with_images.append({'text': post_text, 'platform': platform, 'image_base64': image_base64})
-                
-                # Generate HTML using the posts with images
-                for post_data in posts_with_images:
-                     html_output += _create_social_post_html(post_data['text'], post_data['platform'], post_data['image_base64'])
+            # Generate HTML using the posts with images
+            html_output = _create_social_posts_html(posts_with_images)
 
-            elif isinstance(posts, list) and not all(isinstance(p, str) and p.strip() for p in posts):
-                 st.warning("Parsed JSON for Social Posts, but content list contains non-string or empty elements. Displaying raw text.")
-                 html_output = f"<pre>{raw_text}</pre>"
-            else:
-                st.warning("No valid 'posts' list found in the response. Displaying raw text.")
-                html_output = f"<pre>{raw_text}</pre>"
-
-        else:
-            st.warning(f"Could not parse content for {content_type}. Displaying raw text.")
-            html_output = f"<pre>{raw_text}</pre>"
-
-        return raw_text, html_output
+        return raw_text, html_output, images, True
 
     except Exception as e:
         error_msg = f"[Error generating content: {e}]"
-        return error_msg, f"<p style='color: red;'>{error_msg}</p>"
+        return error_msg, f"<p style='color: red;'>{templates.escape(error_msg)}</p>", [], False
 
 # --- HTML Mockup Functions ---
+_LANDING_PAGE = templates.Template('landing_page', """
+    <div style="font-family: 'Google Sans', sans-serif; max-width: 700px; margin: 20px auto; padding: 30px; border: 1px solid #e0e0e0; border-radius: 12px; background-color: #fdfbf6; box-shadow: 0 6px 12px rgba(0,0,0,0.1); overflow-y: auto; max-height: 500px; color: #3C4043;">
+        <div style="text-align: center; padding: 30px 0 40px; border-bottom: 1px solid #eee; margin-bottom: 30px;">
+            <h1 style="color: #202124; font-size: 2.5em; font-weight: 700; margin-bottom: 10px; line-height: 1.2;">{headline}</h1>
+            <p style="color: #5F6368; font-size: 1.1em; margin-top: 0;">{sub_headline}</p>
+            <div style="margin-top: 30px;">
+                 <button style="background-color: #202124; color: white; padding: 12px 25px; border: none; border-radius: 25px; cursor: pointer; font-size: 1.1em; font-weight: 500; box-shadow: 0 4px 8px rgba(0,0,0,0.2); transition: background-color 0.3s ease;">&rarr; {button_text}</button>
+            </div>
+        </div>
+        <div style="padding: 0 10px;">
+        {sections:raw}
+        </div>
+    </div>
+    """)
+
+_LANDING_SECTION = templates.Template('landing_section', """
+            <div style="margin-bottom: 30px; padding-bottom: 20px; border-bottom: 1px solid #f0f0f0;">
+                <h3 style="color: #34A853; font-size: 1.5em; font-weight: 500; margin-bottom: 12px;">{title}</h3>
+                <div style="color: #3C4043; line-height: 1.7; font-size: 1em; white-space: pre-wrap;">{body:raw}</div>
+            </div>
+        """)
+
+_PARAGRAPH = templates.Template('paragraph', "<p>{text}</p>")
+_PLAIN_LIST = templates.Template('plain_list', "<ul style='list-style-type: none; padding-left: 0;'>{items:raw}</ul>")
+
+def _landing_section_body(text):
+    # Lines starting with '-' become list items; any other line is a paragraph
+    if '-' not in text:
+        return _PARAGRAPH.render(text=text)
+    parts = []
+    has_items = False
+    for line in text.split('\n'):
+        if line.strip().startswith('-'):
+            parts.append(templates.LIST_ITEM.render(text=line.strip()[1:].strip()))
+            has_items = True
+        else:
+            parts.append(_PARAGRAPH.render(text=line))
+    body = '\n'.join(parts)
+    return _PLAIN_LIST.render(items=body) if has_items else body
+
+@templates.memoize
 def _create_landing_page_html(content_sections):
     """Generates HTML for a simplified landing page mockup with improved styling."""
     # Extract specific content for the hero section
@@ -387,214 +217,63 @@ def _create_landing_page_html(content_sections):
                     button_text = words[0].capitalize()
                 break
 
-    html_content = f"""
-    <div style="font-family: 'Google Sans', sans-serif; max-width: 700px; margin: 20px auto; padding: 30px; border: 1px solid #e0e0e0; border-radius: 12px; background-color: #fdfbf6; box-shadow: 0 6px 12px rgba(0,0,0,0.1); overflow-y: auto; max-height: 500px; color: #3C4043;">
-        <div style="text-align: center; padding: 30px 0 40px; border-bottom: 1px solid #eee; margin-bottom: 30px;">
-            <h1 style="color: #202124; font-size: 2.5em; font-weight: 700; margin-bottom: 10px; line-height: 1.2;">{headline}</h1>
-            <p style="color: #5F6368; font-size: 1.1em; margin-top: 0;">{sub_headline}</p>
-            <div style="margin-top: 30px;">
-                 <button style="background-color: #202124; color: white; padding: 12px 25px; border: none; border-radius: 25px; cursor: pointer; font-size: 1.1em; font-weight: 500; box-shadow: 0 4px 8px rgba(0,0,0,0.2); transition: background-color 0.3s ease;">&rarr; {button_text}</button>
-            </div>
-        </div>
-        <div style="padding: 0 10px;">
-    """
-    # Exclude 'Hero' as it's handled separately
-    for section_name, text in content_sections.items():
-        if section_name != 'Hero' and text and text.strip(): # Only display if section is not Hero and has content after stripping
-            # Convert bullet points to HTML list items
-            if '-' in text:
-                parts = text.split('\n')
-                formatted_parts = []
-                for part in parts:
-                    if part.strip().startswith('-'):
-                        formatted_parts.append(f"<li>{part.strip()[1:].strip()}</li>")
-                    else:
-                        formatted_parts.append(f"<p>{part}</p>")
-                formatted_text = '\n'.join(formatted_parts)
-                if any('<li>' in part for part in formatted_parts):
-                    formatted_text = f"<ul style='list-style-type: none; padding-left: 0;'>{formatted_text}</ul>"
-            else:
-                formatted_text = f"<p>{text}</p>"
-
-            html_content += f"""
-            <div style="margin-bottom: 30px; padding-bottom: 20px; border-bottom: 1px solid #f0f0f0;">
-                <h3 style="color: #34A853; font-size: 1.5em; font-weight: 500; margin-bottom: 12px;">{section_name}</h3>
-                <div style="color: #3C4043; line-height: 1.7; font-size: 1em; white-space: pre-wrap;">{formatted_text}</div>
-            </div>
-        """
-    html_content += """
-        </div>
-    </div>
-    """
-    return html_content
-
-def _create_pitch_slides_html(headlines):
-    """Generates HTML for an interactive pitch slides carousel with enhanced styling."""
-    # Define pastel color palettes for slides
-    pastel_colors = [
-        {
-            'bg': 'linear-gradient(135deg, #FFE5E5 0%, #FFF0F0 100%)',  # Soft pink
-            'accent': '#FF9999',
-            'text': '#4A4A4A'
-        },
-        {
-            'bg': 'linear-gradient(135deg, #E5F4FF 0%, #F0F9FF 100%)',  # Soft blue
-            'accent': '#99CCFF',
-            'text': '#4A4A4A'
-        },
-        {
-            'bg': 'linear-gradient(135deg, #E5FFE5 0%, #F0FFF0 100%)',  # Soft green
-            'accent': '#99FF99',
-            'text': '#4A4A4A'
-        },
-        {
-            'bg': 'linear-gradient(135deg, #FFE5F4 0%, #FFF0F9 100%)',  # Soft purple
-            'accent': '#FF99CC',
-            'text': '#4A4A4A'
-        },
-        {
-            'bg': 'linear-gradient(135deg, #FFF4E5 0%, #FFF9F0 100%)',  # Soft orange
-            'accent': '#FFCC99',
-            'text': '#4A4A4A'
-        },
-        {
-            'bg': 'linear-gradient(135deg, #F4E5FF 0%, #F9F0FF 100%)',  # Soft lavender
-            'accent': '#CC99FF',
-            'text': '#4A4A4A'
-        },
-        {
-            'bg': 'linear-gradient(135deg, #E5FFF4 0%, #F0FFF9 100%)',  # Soft mint
-            'accent': '#99FFCC',
-            'text': '#4A4A4A'
-        }
-    ]
-
-    slides_html = ""
-    for i, headline in enumerate(headlines):
-        # Get color scheme for this slide (cycle through colors if more slides than colors)
-        color_scheme = pastel_colors[i % len(pastel_colors)]
-        
-        slides_html += f"""
-        <div class="slide" style="display: {'block' if i == 0 else 'none'}; 
-            width: 100%; 
-            height: 400px; 
-            background: {color_scheme['bg']};
-            border: 1px solid #e0e0e0; 
-            border-radius: 12px; 
-            margin-bottom: 15px; 
-            display: flex; 
-            flex-direction: column; 
-            justify-content: center; 
-            align-items: center; 
-            text-align: center; 
-            box-shadow: 0 4px 12px rgba(0,0,0,0.1); 
-            padding: 30px;
-            position: relative;
-            transition: opacity 0.3s ease;">
-            
-            <!-- Slide number indicator -->
-            <div style="position: absolute; top: 15px; right: 15px; 
-                background-color: {color_scheme['accent']}; 
-                color: {color_scheme['text']}; 
-                padding: 5px 12px; 
-                border-radius: 15px; 
-                font-size: 0.9em;
-                font-weight: 500;">
-                {i+1}/{len(headlines)}
-            </div>
-            
-            <!-- Main content -->
-            <div style="max-width: 80%; display: flex; flex-direction: column; align-items: center;">
-                <h2 style="color: {color_scheme['text']}; 
-                    font-size: 2em; 
-                    line-height: 1.3; 
-                    margin-bottom: 20px; 
-                    font-weight: 600;
-                    text-align: center;">
-                    {headline}
-                </h2>
-                
-                <!-- Decorative element -->
-                <div style="width: 60px; 
-                    height: 4px; 
-                    background: {color_scheme['accent']}; 
-                    margin: 20px auto; 
-                    border-radius: 2px;">
-                </div>
-                
-                <!-- Placeholder for supporting text -->
-                <p style="color: {color_scheme['text']}; 
-                    font-size: 1.1em; 
-                    line-height: 1.5; 
-                    margin-top: 20px;
-                    text-align: center;
-                    opacity: 0.8;">
-                    Supporting text for this slide would go here
-                </p>
-            </div>
-        </div>
-        """
-    
-    navigation_html = """
-    <div style="display: flex; justify-content: center; gap: 15px; margin: 20px 0;">
-        <button onclick="prevSlide()" 
-            style="background-color: #4285F4; 
-            color: white; 
-            padding: 10px 20px; 
-            border: none; 
-            border-radius: 25px; 
-            cursor: pointer;
-            font-size: 1em;
-            font-weight: 500;
-            display: flex;
-            align-items: center;
-            gap: 8px;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
-            ← Previous
-        </button>
-        <button onclick="nextSlide()" 
-            style="background-color: #4285F4; 
-            color: white; 
-            padding: 10px 20px; 
-            border: none; 
-            border-radius: 25px; 
-            cursor: pointer;
-            font-size: 1em;
-            font-weight: 500;
-            display: flex;
-            align-items: center;
-            gap: 8px;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 5px rgba(0,0,0,0.1);">
-            Next →
-        </button>
-    </div>
-    """
-    
-    javascript = """
-    <script>
+    # Exclude 'Hero' as it's handled separately; only sections with content are shown
+    sections = _LANDING_SECTION.render_each(
+        {'title': section_name, 'body': _landing_section_body(text)}
+        for section_name, text in content_sections.items()
+        if section_name != 'Hero' and text and text.strip()
+    )
+    return _LANDING_PAGE.render(headline=headline, sub_headline=sub_headline, button_text=button_text, sections=sections)
+
+# Pastel color palette for slides (cycled when there are more slides than colors)
+_SLIDE_PALETTE = [
+    {'bg': 'linear-gradient(135deg, #FFE5E5 0%, #FFF0F0 100%)', 'accent': '#FF9999', 'text': '#4A4A4A'},  # Soft pink
+    {'bg': 'linear-gradient(135deg, #E5F4FF 0%, #F0F9FF 100%)', 'accent': '#99CCFF', 'text': '#4A4A4A'},  # Soft blue
+    {'bg': 'linear-gradient(135deg, #E5FFE5 0%, #F0FFF0 100%)', 'accent': '#99FF99', 'text': '#4A4A4A'},  # Soft green
+    {'bg': 'linear-gradient(135deg, #FFE5F4 0%, #FFF0F9 100%)', 'accent': '#FF99CC', 'text': '#4A4A4A'},  # Soft purple
+    {'bg': 'linear-gradient(135deg, #FFF4E5 0%, #FFF9F0 100%)', 'accent': '#FFCC99', 'text': '#4A4A4A'},  # Soft orange
+    {'bg': 'linear-gradient(135deg, #F4E5FF 0%, #F9F0FF 100%)', 'accent': '#CC99FF', 'text': '#4A4A4A'},  # Soft lavender
+    {'bg': 'linear-gradient(135deg, #E5FFF4 0%, #F0FFF9 100%)', 'accent': '#99FFCC', 'text': '#4A4A4A'},  # Soft mint
+]
+
+_PITCH_DECK_ASSET = templates.Asset('pitch_deck', css="""
+    .deck { position: relative; max-width: 900px; margin: 0 auto; }
+    .deck-slides { overflow: hidden; border-radius: 12px; margin-bottom: 20px; }
+    .slide { display: none; width: 100%; height: 400px; border: 1px solid #e0e0e0; border-radius: 12px; margin-bottom: 15px;
+        flex-direction: column; justify-content: center; align-items: center; text-align: center;
+        box-shadow: 0 4px 12px rgba(0,0,0,0.1); padding: 30px; position: relative; box-sizing: border-box;
+        opacity: 0; transition: opacity 0.3s ease; }
+    .slide.active { display: flex; opacity: 1; }
+    .slide-number { position: absolute; top: 15px; right: 15px; padding: 5px 12px; border-radius: 15px; font-size: 0.9em; font-weight: 500; }
+    .slide-body { max-width: 80%; display: flex; flex-direction: column; align-items: center; }
+    .slide-body h2 { font-size: 2em; line-height: 1.3; margin-bottom: 20px; font-weight: 600; text-align: center; }
+    .slide-rule { width: 60px; height: 4px; margin: 20px auto; border-radius: 2px; }
+    .slide-note { font-size: 1.1em; line-height: 1.5; margin-top: 20px; text-align: center; opacity: 0.8; }
+    .deck-nav { display: flex; justify-content: center; gap: 15px; margin: 20px 0; }
+    .deck-nav button { background-color: #4285F4; color: white; padding: 10px 20px; border: none; border-radius: 25px; cursor: pointer;
+        font-size: 1em; font-weight: 500; display: flex; align-items: center; gap: 8px; transition: all 0.3s ease; box-shadow: 0 2px 5px rgba(0,0,0,0.1); }
+""" + "".join(
+    f"""
+    .slide-c{i} {{ background: {colors['bg']}; }}
+    .slide-c{i} .slide-number, .slide-c{i} .slide-rule {{ background: {colors['accent']}; }}
+    .slide-c{i} .slide-number, .slide-c{i} h2, .slide-c{i} .slide-note {{ color: {colors['text']}; }}"""
+    for i, colors in enumerate(_SLIDE_PALETTE)
+), js="""
     let currentSlide = 0;
     const slides = document.getElementsByClassName('slide');
-    
+
     function showSlide(n) {
-        // Hide all slides
+        // Only the current slide carries the 'active' class
         for (let i = 0; i < slides.length; i++) {
-            slides[i].style.display = 'none';
-            slides[i].style.opacity = '0';
+            slides[i].classList.toggle('active', i === n);
         }
-        // Show the current slide with a fade effect
-        slides[n].style.display = 'block';
-        setTimeout(() => {
-            slides[n].style.opacity = '1';
-        }, 50);
     }
-    
+
     function nextSlide() {
         currentSlide = (currentSlide + 1) % slides.length;
         showSlide(currentSlide);
     }
-    
+
     function prevSlide() {
         currentSlide = (currentSlide - 1 + slides.length) % slides.length;
         showSlide(currentSlide);
@@ -608,32 +287,38 @@ def _create_pitch_slides_html(headlines):
             prevSlide();
         }
     });
-    </script>
-    """
-    
-    return f"""
-    <div style="position: relative; max-width: 900px; margin: 0 auto;">
-        <div style="overflow: hidden; border-radius: 12px; margin-bottom: 20px;">
-            {slides_html}
-        </div>
-        {navigation_html}
-        {javascript}
-    </div>
-    """
+""")
+
+_PITCH_SLIDE = templates.Template('pitch_slide', """
+        <div class="slide slide-c{color}{active}">
+            <div class="slide-number">{number}/{total}</div>
+            <div class="slide-body">
+                <h2>{headline}</h2>
+                <div class="slide-rule"></div>
+                <p class="slide-note">Supporting text for this slide would go here</p>
+            </div>
+        </div>""")
 
-def _escape_js_literal(s):
-    return s.replace('\\', '\\\\').replace("'", "\'").replace("\"", "\\\"").replace("\n", "\\n").replace("\r", "\\r").replace("<", "\\u003C").replace(">", "\\u003E").replace("&", "\\u0026")
+_PITCH_DECK = templates.Template('pitch_deck', """
+    <div class="deck">
+        <div class="deck-slides">{slides:raw}
+        </div>
+        <div class="deck-nav">
+            <button onclick="prevSlide()">← Previous</button>
+            <button onclick="nextSlide()">Next →</button>
+        </div>
+    </div>""")
 
-def _create_email_html(subject, body):
-    """Generates HTML for a realistic email client mockup."""
-    # Ensure subject and body are strings and handle None values
-    subject = str(subject) if subject is not None else ''
-    body = str(body) if body is not None else ''
-    
-    # Replace newlines with <br> tags for HTML display
-    body_html = body.replace('\n', '<br>')
+@templates.memoize
+def _create_pitch_slides_html(headlines):
+    """Generates HTML for an interactive pitch slides carousel with enhanced styling."""
+    slides = _PITCH_SLIDE.render_each(
+        {'color': i % len(_SLIDE_PALETTE), 'active': ' active' if i == 0 else '', 'number': i + 1, 'total': len(headlines), 'headline': headline}
+        for i, headline in enumerate(headlines)
+    )
+    return templates.page(_PITCH_DECK.render(slides=slides), _PITCH_DECK_ASSET)
 
-    html_content = """
+_EMAIL = templates.Template('email', """
     <div style="font-family: 'Google Sans', sans-serif; max-width: 600px; margin: 0 auto; border: 1px solid #e0e0e0; border-radius: 8px; background-color: #ffffff; box-shadow: 0 4px 8px rgba(0,0,0,0.1); overflow: hidden;">
         <div style="background-color: #f0f0f0; padding: 10px 20px; border-bottom: 1px solid #e0e0e0; display: flex; align-items: center; justify-content: space-between;">
             <div style="display: flex; align-items: center;">
@@ -650,197 +335,213 @@ def _create_email_html(subject, body):
             <p style="margin: 5px 0 0; font-weight: bold; color: #3C4043;">Subject: {subject}</p>
         </div>
         <div style="padding: 20px; line-height: 1.6; color: #3C4043; font-size: 0.95em;">
-            {body_html}
+            {body:lines}
         </div>
     </div>
-    """.format(subject=subject, body_html=body_html)
-    return html_content
-
-def _create_social_post_html(post_text, platform="twitter", image_base64=None):
-    """Generates HTML for platform-specific social media post mockups, including an image for Instagram."""
-    platform_icons = {
-        "twitter": "🐦",
-        "linkedin": "💼",
-        "instagram": "📸"
-    }
-    platform_colors = {
-        "twitter": "#1DA1F2",
-        "linkedin": "#0077B5",
-        "instagram": "#E1306C"
-    }
-    
-    # Escape post_text for use in JavaScript before inserting into HTML
-    post_content_escaped = _escape_js_literal(post_text)
-
-    # Generate the dynamic filename in Python
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    download_filename = f'{platform}_post_{timestamp}.txt'
+    """)
 
-    # Determine image content: use provided base64 image or the original placeholder
-    image_content = ""
-    if image_base64:
-        image_content = f'<img src="data:image/png;base64,{image_base64}" style="width: 100%; height: 100%; object-fit: cover;" alt="Social post image">'
-    else:
-        image_content = "Image Placeholder (Instagram)"
+@templates.memoize
+def _create_email_html(subject, body):
+    """Generates HTML for a realistic email client mockup."""
+    return _EMAIL.render(subject='' if subject is None else subject, body='' if body is None else body)
+
+_TAGLINES = templates.Template('taglines', """
+            <style>
+            .tagline-item {{
+                background: linear-gradient(135deg, #f8f9fa 0%, #ffffff 100%);
+                padding: 15px;
+                margin: 10px 0;
+                border-radius: 8px;
+                box-shadow: 0 2px 4px rgba(0,0,0,0.05);
+                transition: all 0.3s ease;
+            }}
+            .tagline-item:hover {{
+                transform: translateY(-2px);
+                box-shadow: 0 4px 8px rgba(0,0,0,0.1);
+                background: linear-gradient(135deg, #e8f0fe 0%, #ffffff 100%);
+            }}
+            /* Instagram Gradient on Hover */
+            .tagline-item:hover {{
+                background: linear-gradient(to right, #833ab4, #fd1d1d, #fcb045); /* Instagram colors */
+                color: white; /* Optional: change text color for better contrast */
+            }}
+            </style>
+            <div class="taglines-container">{items:raw}</div>""")
+
+_TAGLINE_ITEM = templates.Template('tagline_item', '<div class="tagline-item">{text}</div>')
+
+@templates.memoize
+def _create_taglines_html(taglines):
+    """Generates HTML for a list of tagline cards."""
+    return _TAGLINES.render(items=_TAGLINE_ITEM.render_each({'text': tagline} for tagline in taglines))
+
+_SOCIAL_POST_ASSET = templates.Asset('social_post', css="""
+    .sp-card { font-family: 'Google Sans', sans-serif; margin: 0 auto; border: 1px solid #e0e0e0; border-radius: 8px; background-color: #ffffff; box-shadow: 0 4px 8px rgba(0,0,0,0.1); overflow: hidden; }
+    .sp-card p { margin: 0; }
+    .sp-header { display: flex; align-items: center; padding: 15px; }
+    .sp-avatar { border-radius: 50%; margin-right: 10px; }
+    .sp-name { font-weight: bold; font-size: 0.9em; }
+    .sp-meta { font-size: 0.8em; color: #70757A; }
+    .sp-more { margin-left: auto; font-size: 1.2em; color: #8e8e8e; }
+    .sp-media { width: 100%; display: flex; justify-content: center; align-items: center; }
+    .sp-media img { width: 100%; height: 100%; object-fit: cover; }
+    .sp-export-bar { padding: 10px 15px; background-color: #f8f9fa; border-top: 1px solid #e0e0e0; text-align: right; }
+    .sp-export { color: white; padding: 5px 10px; border: none; border-radius: 4px; cursor: pointer; font-size: 0.8em; }
+
+    .sp-twitter { max-width: 500px; }
+    .sp-twitter .sp-header { border-bottom: 1px solid #f0f0f0; }
+    .sp-twitter .sp-name { color: #3C4043; font-size: 1em; }
+    .sp-twitter .sp-more { font-size: 1.5em; color: inherit; }
+    .sp-twitter .sp-body { padding: 15px; line-height: 1.5; color: #3C4043; font-size: 0.95em; }
+    .sp-twitter .sp-actions { padding: 10px 15px; border-top: 1px solid #f0f0f0; display: flex; justify-content: space-around; font-size: 0.9em; color: #70757A; }
+    .sp-twitter .sp-export { background-color: #1DA1F2; }
+
+    .sp-instagram { max-width: 350px; }
+    .sp-instagram .sp-header { padding: 10px 15px; }
+    .sp-instagram .sp-name { color: #262626; }
+    .sp-instagram .sp-meta { font-size: 0.7em; color: #8e8e8e; }
+    .sp-instagram .sp-media { height: 350px; background-color: #efefef; color: #8e8e8e; }
+    .sp-instagram .sp-body { padding: 10px 15px; color: #262626; font-size: 0.9em; }
+    .sp-instagram .sp-icons { display: flex; justify-content: space-between; margin-bottom: 10px; font-size: 1.4em; }
+    .sp-instagram .sp-body p { margin-bottom: 5px; }
+    .sp-instagram .sp-handle, .sp-instagram .sp-likes { font-weight: bold; }
+    .sp-instagram .sp-faint { font-size: 0.8em; color: #8e8e8e; }
+    .sp-instagram .sp-ago { font-size: 0.7em; color: #8e8e8e; }
+    .sp-instagram .sp-comment { padding: 10px 15px; background-color: #f8f8f8; border-top: 1px solid #efefef; display: flex; align-items: center; }
+    .sp-instagram .sp-comment span { font-size: 1.2em; margin-right: 10px; }
+    .sp-instagram .sp-comment input { border: none; outline: none; flex-grow: 1; background: none; font-size: 0.9em; }
+    .sp-instagram .sp-comment button { border: none; background: none; color: #3897f0; font-weight: bold; cursor: pointer; font-size: 0.9em; }
+    .sp-instagram .sp-export { background-color: #E1306C; }
+
+    .sp-linkedin { max-width: 600px; }
+    .sp-linkedin .sp-header { padding: 12px 15px; }
+    .sp-linkedin .sp-name { color: #212121; }
+    .sp-linkedin .sp-meta { color: #666; }
+    .sp-linkedin .sp-meta + .sp-meta { font-size: 0.7em; }
+    .sp-linkedin .sp-more { color: #666; }
+    .sp-linkedin .sp-body { padding: 0 15px 12px 15px; color: #333; font-size: 0.9em; line-height: 1.4; }
+    .sp-linkedin .sp-media { height: 150px; background-color: #f0f0f0; color: #666; font-size: 0.9em; }
+    .sp-linkedin .sp-stats { padding: 8px 15px; display: flex; justify-content: space-between; align-items: center; font-size: 0.8em; color: #666; border-bottom: 1px solid #eee; }
+    .sp-linkedin .sp-actions { padding: 8px 0; display: flex; text-align: center; color: #666; }
+    .sp-linkedin .sp-actions div { flex-grow: 1; cursor: pointer; padding: 8px 0; border-radius: 4px; transition: background-color 0.2s ease; }
+    .sp-linkedin .sp-export { background-color: #0077B5; }
+""", js="""
+    // One delegated handler exports the text of whichever post's button was clicked
+    document.addEventListener('click', function(e) {
+        const button = e.target.closest('.sp-export');
+        if (!button) return;
+        const postContent = button.closest('.sp-card').querySelector('.sp-text').textContent;
+        const blob = new Blob([postContent], { type: 'text/plain' });
+        const url = window.URL.createObjectURL(blob);
+        const a = document.createElement('a');
+        a.href = url;
+        a.download = button.dataset.filename;
+        document.body.appendChild(a);
+        a.click();
+        window.URL.revokeObjectURL(url);
+        document.body.removeChild(a);
+    });
+""")
 
-    # --- Start building platform-specific HTML --- #
-    html_content = ""
+_EXPORT_POST_BUTTON = """
+            <div class="sp-export-bar"><button class="sp-export" data-filename="{filename}">Export Post</button></div>"""
 
-    if platform == "twitter":
-        html_content = f"""
-        <div style="font-family: 'Google Sans', sans-serif; max-width: 500px; margin: 0 auto; border: 1px solid #e0e0e0; border-radius: 8px; background-color: #ffffff; box-shadow: 0 4px 8px rgba(0,0,0,0.1); overflow: hidden;">
-            <div style="padding: 15px; display: flex; align-items: center; border-bottom: 1px solid #f0f0f0;">
-                <img src="https://placehold.co/40x40/{platform_colors[platform].replace('#', '')}/ffffff?text=C" style="border-radius: 50%; margin-right: 10px;">
+_SOCIAL_POST_TEMPLATES = {
+    "twitter": templates.Template('social_post_twitter', """
+        <div class="sp-card sp-twitter">
+            <div class="sp-header">
+                <img class="sp-avatar" src="https://placehold.co/40x40/1DA1F2/ffffff?text=C">
                 <div>
-                    <p style="margin: 0; font-weight: bold; color: #3C4043;">Your Company Name</p>
-                    <p style="margin: 0; font-size: 0.8em; color: #70757A;">@YourCompany • Just now</p>
-                </div>
-                <div style="margin-left: auto;">
-                    <span style="font-size: 1.5em;">{platform_icons[platform]}</span>
+                    <p class="sp-name">Your Company Name</p>
+                    <p class="sp-meta">@YourCompany • Just now</p>
                 </div>
+                <span class="sp-more">🐦</span>
             </div>
-            <div style="padding: 15px; line-height: 1.5; color: #3C4043; font-size: 0.95em;">
-                {post_content_escaped}
-            </div>
-            <div style="padding: 10px 15px; border-top: 1px solid #f0f0f0; display: flex; justify-content: space-around; font-size: 0.9em; color: #70757A;">
-                <span>❤️ Like</span>
-                <span>💬 Comment</span>
-                <span>🔁 Share</span>
-                <span>📊 Analytics</span>
-            </div>
-            <div style="padding: 10px 15px; background-color: #f8f9fa; border-top: 1px solid #e0e0e0; text-align: right;">
-                <button onclick="exportPost('{_escape_js_literal(download_filename)}')" style="background-color: {platform_colors[platform]}; color: white; padding: 5px 10px; border: none; border-radius: 4px; cursor: pointer; font-size: 0.8em;">Export Post</button>
-            </div>
-        </div>
-        <script>
-        function exportPost(filename) {{
-            const postContent = `{post_content_escaped}`;
-            const blob = new Blob([postContent], {{ type: 'text/plain' }});
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.href = url;
-            a.download = filename; // Use the filename passed as an argument
-            document.body.appendChild(a);
-            a.click();
-            window.URL.revokeObjectURL(url);
-            document.body.removeChild(a);
-        }}
-        </script>
-        """
-
-    elif platform == "instagram":
-        html_content = f"""
-        <div style="font-family: 'Google Sans', sans-serif; max-width: 350px; margin: 0 auto; border: 1px solid #e0e0e0; border-radius: 8px; background-color: #ffffff; box-shadow: 0 4px 8px rgba(0,0,0,0.1); overflow: hidden;">
-            <div style="padding: 10px 15px; display: flex; align-items: center;">
-                 <img src="https://placehold.co/32x32/{platform_colors[platform].replace('#', '')}/ffffff?text=C" style="border-radius: 50%; margin-right: 10px;">
-                 <div>
-                     <p style="margin: 0; font-weight: bold; color: #262626; font-size: 0.9em;">yourcompany</p>
-                     <p style="margin: 0; font-size: 0.7em; color: #8e8e8e;">Location (Optional)</p>
-                 </div>
-                 <div style="margin-left: auto;">
-                     <span style="font-size: 1.2em; color: #8e8e8e;">...</span>
-                 </div>
+            <div class="sp-body"><span class="sp-text">{post}</span></div>
+            <div class="sp-actions"><span>❤️ Like</span><span>💬 Comment</span><span>🔁 Share</span><span>📊 Analytics</span></div>""" + _EXPORT_POST_BUTTON + """
+        </div>"""),
+
+    "instagram": templates.Template('social_post_instagram', """
+        <div class="sp-card sp-instagram">
+            <div class="sp-header">
+                <img class="sp-avatar" src="https://placehold.co/32x32/E1306C/ffffff?text=C">
+                <div>
+                    <p class="sp-name">yourcompany</p>
+                    <p class="sp-meta">Location (Optional)</p>
+                </div>
+                <span class="sp-more">...</span>
             </div>
-            <div style="width: 100%; height: 350px; background-color: #efefef; display: flex; justify-content: center; align-items: center; color: #8e8e8e;">
-                {image_content}
+            <div class="sp-media">{image:raw}</div>
+            <div class="sp-body">
+                <div class="sp-icons"><span>❤️ 💬 ✈️</span><span>🔖</span></div>
+                <p class="sp-likes">X likes</p>
+                <p><span class="sp-handle">yourcompany</span> <span class="sp-text">{post}</span></p>
+                <p class="sp-faint">View all X comments</p>
+                <p class="sp-ago">X MINUTES AGO</p>
             </div>
-            <div style="padding: 10px 15px;">
-                 <div style="display: flex; justify-content: space-between; margin-bottom: 10px;">
-                     <div style="font-size: 1.4em; color: #262626;">
-                         ❤️ 💬 ✈️
-                     </div>
-                     <div style="font-size: 1.4em; color: #262626;">
-                         🔖
-                     </div>
-                 </div>
-                 <p style="margin: 0 0 5px 0; font-weight: bold; color: #262626; font-size: 0.9em;">X likes</p>
-                 <p style="margin: 0 0 5px 0; color: #262626; font-size: 0.9em;">
-                     <span style="font-weight: bold;">yourcompany</span> {post_content_escaped}
-                 </p>
-                 <p style="margin: 0; font-size: 0.8em; color: #8e8e8e;">View all X comments</p>
-                 <p style="margin: 5px 0 0 0; font-size: 0.7em; color: #8e8e8e;">X MINUTES AGO</p>
+            <div class="sp-comment"><span>😊</span><input type="text" placeholder="Add a comment..."><button>Post</button></div>""" + _EXPORT_POST_BUTTON + """
+        </div>"""),
+
+    "linkedin": templates.Template('social_post_linkedin', """
+        <div class="sp-card sp-linkedin">
+            <div class="sp-header">
+                <img class="sp-avatar" src="https://placehold.co/48x48/0077B5/ffffff?text=C">
+                <div>
+                    <p class="sp-name">Your Company Name</p>
+                    <p class="sp-meta">Your Company • Follow</p>
+                    <p class="sp-meta">Xh • 🌐</p>
+                </div>
+                <span class="sp-more">...</span>
             </div>
-             <div style="padding: 10px 15px; background-color: #f8f8f8; border-top: 1px solid #efefef; display: flex; align-items: center;">
-                 <span style="font-size: 1.2em; margin-right: 10px;">😊</span>
-                 <input type="text" placeholder="Add a comment..." style="border: none; outline: none; flex-grow: 1; background: none; font-size: 0.9em;">
-                 <button style="border: none; background: none; color: #3897f0; font-weight: bold; cursor: pointer; font-size: 0.9em;">Post</button>
-             </div>
-             <div style="padding: 10px 15px; background-color: #f8f9fa; border-top: 1px solid #e0e0e0; text-align: right;">
-                 <button onclick="exportPost('{_escape_js_literal(download_filename)}')" style="background-color: {platform_colors[platform]}; color: white; padding: 5px 10px; border: none; border-radius: 4px; cursor: pointer; font-size: 0.8em;">Export Post</button>
-             </div>
-        </div>
-        <script>
-        function exportPost(filename) {{
-            const postContent = `{post_content_escaped}`;
-            const blob = new Blob([postContent], {{ type: 'text/plain' }});
-            const url = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.href = url;
-            a.download = filename; // Use the filename passed as an argument
-            document.body.appendChild(a);
-            a.click();
-            window.URL.revokeObjectURL(url);
-            document.body.removeChild(a);
-        }}
-        </script>
-        """
-
-    elif platform == "linkedin":
-         html_content = f"""
-         <div style="font-family: 'Google Sans', sans-serif; max-width: 600px; margin: 0 auto; border: 1px solid #e0e0e0; border-radius: 8px; background-color: #ffffff; box-shadow: 0 4px 8px rgba(0,0,0,0.1); overflow: hidden;">
-             <div style="padding: 12px 15px; display: flex; align-items: center;">
-                  <img src="https://placehold.co/48x48/{platform_colors[platform].replace('#', '')}/ffffff?text=C" style="border-radius: 50%; margin-right: 10px;">
-                  <div>
-                      <p style="margin: 0; font-weight: bold; color: #212121; font-size: 0.9em;">Your Company Name</p>
-                      <p style="margin: 0; font-size: 0.8em; color: #666; font-weight: normal;">Your Company • Follow</p>
-                      <p style="margin: 0; font-size: 0.7em; color: #666;">Xh • 🌐</p>
-                  </div>
-                  <div style="margin-left: auto;">
-                      <span style="font-size: 1.2em; color: #666;">...</span>
-                  </div>
-             </div>
-             <div style="padding: 0 15px 12px 15px; color: #333; font-size: 0.9em; line-height: 1.4;">
-                 {post_content_escaped}
-             </div>
-             <!-- Optional: Add a placeholder for a link preview or image -->
-             <div style="background-color: #f0f0f0; height: 150px; display: flex; justify-content: center; align-items: center; color: #666; font-size: 0.9em;">
-                 Link Preview or Image Placeholder ({platform.capitalize()})
-             </div>
-             <div style="padding: 8px 15px; display: flex; justify-content: space-between; align-items: center; font-size: 0.8em; color: #666; border-bottom: 1px solid #eee;">
-                 <span>X Likes</span>
-                 <span>X Comments • X Reposts</span>
-             </div>
-             <div style="padding: 8px 0; display: flex; justify-content-around; text-align: center; color: #666;">
-                 <div style="flex-grow: 1; cursor: pointer; padding: 8px 0; border-radius: 4px; transition: background-color 0.2s ease;">👍 Like</div>
-                 <div style="flex-grow: 1; cursor: pointer; padding: 8px 0; border-radius: 4px; transition: background-color 0.2s ease;">💬 Comment</div>
-                 <div style="flex-grow: 1; cursor: pointer; padding: 8px 0; border-radius: 4px; transition: background-color 0.2s ease;">🔁 Repost</div>
-                 <div style="flex-grow: 1; cursor: pointer; padding: 8px 0; border-radius: 4px; transition: background-color 0.2s ease;">✈️ Send</div>
-             </div>
-             <div style="padding: 10px 15px; background-color: #f8f9fa; border-top: 1px solid #e0e0e0; text-align: right;">
-                 <button onclick="exportPost('{_escape_js_literal(download_filename)}')" style="background-color: {platform_colors[platform]}; color: white; padding: 5px 10px; border: none; border-radius: 4px; cursor: pointer; font-size: 0.8em;">Export Post</button>
-             </div>
-         </div>
-         <script>
-         function exportPost(filename) {{
-             const postContent = `{post_content_escaped}`;
-             const blob = new Blob([postContent], {{ type: 'text/plain' }});
-             const url = window.URL.createObjectURL(blob);
-             const a = document.createElement('a');
-             a.href = url;
-             a.download = filename; // Use the filename passed as an argument
-             document.body.appendChild(a);
-             a.click();
-             window.URL.revokeObjectURL(url);
-             document.body.removeChild(a);
-         }}
-         </script>
-         """
+            <div class="sp-body"><span class="sp-text">{post}</span></div>
+            <div class="sp-media">{image:raw}</div>
+            <div class="sp-stats"><span>X Likes</span><span>X Comments • X Reposts</span></div>
+            <div class="sp-actions"><div>👍 Like</div><div>💬 Comment</div><div>🔁 Repost</div><div>✈️ Send</div></div>""" + _EXPORT_POST_BUTTON + """
+        </div>"""),
+}
 
-    else:
+_SOCIAL_POST_IMAGE = templates.Template('social_post_image', '<img src="{image_src}" alt="Social post image">')
+_UNKNOWN_PLATFORM = templates.Template('unknown_platform', "<div>Unknown platform: {platform}</div>")
+
+_IMAGE_PLACEHOLDERS = {"instagram": "Image Placeholder (Instagram)", "linkedin": "Link Preview or Image Placeholder (Linkedin)"}
+
+@templates.memoize
+def _create_social_post_html(post_text, platform="twitter", image_src=None):
+    """Generates the markup for one platform-specific social media post mockup; styles and script come from _SOCIAL_POST_ASSET."""
+    template = _SOCIAL_POST_TEMPLATES.get(platform)
+    if template is None:
         # Fallback for unknown platforms (shouldn't happen with current logic)
-        html_content = f"<div>Unknown platform: {platform}</div>"
+        return _UNKNOWN_PLATFORM.render(platform=platform)
 
-    return html_content
+    # Use the provided image (a data: URI) or the original placeholder
+    if image_src:
+        image_content = _SOCIAL_POST_IMAGE.render(image_src=image_src)
+    else:
+        image_content = templates.escape(_IMAGE_PLACEHOLDERS.get(platform, ''))
+
+    # Named after the content, so the same post always renders to the same HTML
+    filename = f"{platform}_post_{templates.content_hash(post_text)[:8]}.txt"
+    return template.render(post=post_text, filename=filename, image=image_content)
+
+def _create_social_posts_html(posts):
+    """Generates one document for a list of {'text', 'platform', 'image_src'} posts, with the shared assets included once."""
+    return templates.page(
+        "".join(_create_social_post_html(post['text'], post['platform'], post['image_src']) for post in posts),
+        _SOCIAL_POST_ASSET
+    )
+
+def _persona_outputs(persona_data):
+    """
+    The generated outputs kept for this persona version. Only the MESSAGING_OUTPUTS_LIMIT most recently
+    viewed versions are kept, since each holds full-size images and every refinement is a new version.
+    """
+    outputs = st.session_state.messaging_outputs
+    key = persona_fingerprint(persona_data)
+    persona_outputs = outputs.pop(key, {})
+    outputs[key] = persona_outputs
+    while len(outputs) > MESSAGING_OUTPUTS_LIMIT:
+        outputs.pop(next(iter(outputs)))
+    return persona_outputs
 
 def render(api_key):
     st.header("Generate Messaging from Persona 💬")
@@ -873,46 +574,162 @@ def render(api_key):
             "Social Post Hooks"
         ]
 
-        for i, content_type in enumerate(content_types):
+        # Outputs are kept per persona version so reruns show them without regenerating
+        persona_outputs = _persona_outputs(selected_persona_for_messaging)
+
+        generate_all = st.button("⚡ Generate All Content Types", key="generate_all_btn_tab2", use_container_width=True)
+        st.markdown("---")
+
+        output_slots = {}
+        for content_type in content_types:
             st.markdown(f"### {content_type} ➡️")
-            if st.button(f"Generate {content_type}", key=f"generate_btn_tab2_{content_type.replace(' ', '_').lower()}", use_container_width=True):
-                raw_text, html_output = _generate_content_for_persona(selected_persona_for_messaging, content_type, api_key)
-                
-                # Display the HTML preview
-                st.markdown("#### Preview")
-                st.components.v1.html(html_output, height=400, scrolling=True)
-                
-                # Display the raw text for copying
-                st.markdown("#### Raw Text (for copying)")
-                if content_type == "Landing Page Copy":
-                    st.code(raw_text, language="json")
-                else:
-                    st.code(raw_text, language="text")
-                
-                # Add export options based on content type
-                if content_type == "Pitch Slide Headlines":
-                    st.download_button(
-                        "Download as HTML",
-                        html_output,
-                        file_name="pitch_slides.html",
-                        mime="text/html"
-                    )
-                elif content_type == "Cold Email / Re-engagement Campaigns":
-                    st.download_button(
-                        "Download as Text",
-                        raw_text,
-                        file_name="email.txt",
-                        mime="text/plain"
-                    )
-                elif content_type == "Social Post Hooks":
-                    st.download_button(
-                        "Download as Text",
-                        raw_text,
-                        file_name="social_posts.txt",
-                        mime="text/plain"
-                    )
-                
+            if st.button(f"Generate {content_type}", key=f"generate_btn_tab2_{_content_type_slug(content_type)}", use_container_width=True):
+                with tracing.span("messaging.generate", content_type=content_type):
+                    persona_outputs[content_type] = _generate_content_for_persona(selected_persona_for_messaging, content_type, api_key)
+            output_slots[content_type] = st.empty()
             st.markdown("---")
 
-# Define the JavaScript download filename literal outside the main f-string
-js_download_assignment = 'a.download = \'email_${datetime.now().strftime("%%Y%%m%%d_%%H%%M%%S")}.txt\''; 
\ No newline at end of file
+        if generate_all:
+            for content_type in content_types:
+                output_slots[content_type].info(f"Generating {content_type}...")
+            # All five requests run at once; each preview is filled in as soon as its request finishes.
+            # Workers collect their warnings, which are shown here on the script thread.
+            warnings = {content_type: [] for content_type in content_types}
+            with tracing.span("messaging.generate_all", content_types=len(content_types)), \
+                    ThreadPoolExecutor(max_workers=len(content_types), thread_name_prefix='messaging') as executor:
+                futures = {
+                    executor.submit(bind_worker_context(_generate_content_for_persona), selected_persona_for_messaging,
+                                    content_type, api_key, warnings[content_type]): content_type
+                    for content_type in content_types
+                }
+                for future in as_completed(futures):
+                    content_type = futures[future]
+                    try:
+                        persona_outputs[content_type] = future.result()
+                    except Exception as e:
+                        output_slots[content_type].error(f"Failed to generate {content_type}: {e}")
+                        continue
+                    with output_slots[content_type].container():
+                        for message in warnings[content_type]:
+                            st.warning(message)
+                        _render_content_output(content_type, *persona_outputs[content_type])
+        else:
+            for content_type in content_types:
+                if content_type in persona_outputs:
+                    with output_slots[content_type].container():
+                        _render_content_output(content_type, *persona_outputs[content_type])
+
+        _render_batch_section(persona_names, content_types, api_key)
+
+def _render_batch_section(persona_names, content_types, api_key):
+    st.subheader("Batch Generation 📦")
+    st.markdown("Generate every selected content type for every selected persona and download the results as one zip (raw text, HTML mockups and images).")
+    batch_persona_indices = st.multiselect(
+        "Personas:",
+        options=list(range(len(persona_names))),
+        default=list(range(len(persona_names))),
+        format_func=lambda i: persona_names[i],
+        key="batch_personas_tab2"
+    )
+    batch_content_types = st.multiselect("Content types:", content_types, default=content_types, key="batch_content_types_tab2")
+
+    if st.button("📦 Generate Batch & Build Zip", key="generate_batch_btn_tab2", use_container_width=True):
+        if not batch_persona_indices or not batch_content_types:
+            st.warning("Please select at least one persona and one content type.")
+        else:
+            personas = [st.session_state.generated_personas[i] for i in batch_persona_indices]
+            row_labels = [f"{n + 1}. {persona_names[i]}" for n, i in enumerate(batch_persona_indices)]
+            grid = pd.DataFrame("⏳", index=row_labels, columns=batch_content_types)
+            total = len(personas) * len(batch_content_types)
+            progress_bar = st.progress(0.0, text=f"0 / {total} generated")
+            grid_placeholder = st.empty()
+            grid_placeholder.dataframe(grid, use_container_width=True)
+
+            # Replace the previous archive so temp files don't pile up across batches
+            previous_zip = st.session_state.get('batch_zip_path')
+            if previous_zip and os.path.exists(previous_zip):
+                os.remove(previous_zip)
+
+            completed = failed = 0
+            with tracing.span("messaging.generate_batch", personas=len(personas), content_types=len(batch_content_types)), \
+                    batch_generator.BatchZipWriter() as writer, \
+                    closing(batch_generator.run_matrix(personas, batch_content_types, _generate_content_for_persona, api_key, writer)) as cells:
+                # closing() ends the matrix (writing its manifest) before the writer, if a rerun or stop cuts it short
+                for cell in cells:
+                    completed += 1
+                    failed += 0 if cell.ok else 1
+                    grid.loc[row_labels[cell.persona_index], cell.content_type] = "✅" if cell.ok else "❌"
+                    grid_placeholder.dataframe(grid, use_container_width=True)
+                    progress_bar.progress(completed / total, text=f"{completed} / {total} generated")
+            st.session_state.batch_zip_path = writer.path
+            if failed:
+                st.warning(f"{failed} of {total} items failed; manifest.json in the zip lists the reasons.")
+            else:
+                st.success(f"Generated all {total} items.")
+
+    batch_zip_path = st.session_state.get('batch_zip_path')
+    if batch_zip_path and os.path.exists(batch_zip_path):
+        with open(batch_zip_path, 'rb') as zip_file:
+            st.download_button(
+                "Download Batch (ZIP) ⬇️",
+                zip_file,
+                file_name=os.path.basename(batch_zip_path), # Unique per batch and stable across reruns
+                mime="application/zip",
+                use_container_width=True,
+                key="download_batch_zip_btn_tab2"
+            )
+
+def _content_type_slug(content_type):
+    return content_type.replace(' ', '_').lower()
+
+def _render_content_output(content_type, raw_text, html_output, images=(), ok=True):
+    # Display the HTML preview
+    st.markdown("#### Preview")
+    render_html_component(f"messaging.{_content_type_slug(content_type)}", html_output, height=400, scrolling=True)
+
+    # Display the raw text for copying
+    st.markdown("#### Raw Text (for copying)")
+    if content_type == "Landing Page Copy":
+        st.code(raw_text, language="json")
+    else:
+        st.code(raw_text, language="text")
+
+    # Nothing worth exporting from a failed or unvalidated generation
+    if not ok:
+        return
+
+    # Add export options based on content type (keys keep the buttons distinct when several outputs are shown)
+    download_key = f"download_btn_tab2_{_content_type_slug(content_type)}"
+    if content_type == "Pitch Slide Headlines":
+        st.download_button(
+            "Download as HTML",
+            html_output,
+            file_name="pitch_slides.html",
+            mime="text/html",
+            key=download_key
+        )
+    elif content_type == "Cold Email / Re-engagement Campaigns":
+        st.download_button(
+            "Download as Text",
+            raw_text,
+            file_name="email.txt",
+            mime="text/plain",
+            key=download_key
+        )
+    elif content_type == "Social Post Hooks":
+        st.download_button(
+            "Download as Text",
+            raw_text,
+            file_name="social_posts.txt",
+            mime="text/plain",
+            key=download_key
+        )
+    # Full-resolution originals of the images shown as thumbnails in the preview
+    for i, (filename, image_bytes) in enumerate(images):
+        st.download_button(
+            f"Download Image {i + 1} (PNG)",
+            image_bytes,
+            file_name=filename,
+            mime="image/png",
+            key=f"{download_key}_image_{i}"
+        )
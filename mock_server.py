@@ -0,0 +1,661 @@
+"""
+Local stand-in for the Gemini `generateContent` and Imagen `:predict` endpoints.
+
+Serves deterministic canned payloads for every prompt family the app uses
+(persona, problem-solution, anti-persona, messaging, sentiment) so the hot
+paths can be benchmarked without network access or API quota.
+
+Context caches created through `cachedContents` are kept in memory, and a
+generateContent request that names one is answered as if the cached system
+instruction and contents had been sent inline.
+
+It also doubles as an OTLP/HTTP JSON trace collector stand-in on /v1/traces
+(see tracing.py); received spans are kept in memory (GET /mock/traces) and
+optionally appended to a JSONL file.
+
+Run it with:
+    python mock_server.py --port 8765 --latency lognormal:5.3,0.4 --rate-limit-rate 0.05
+
+and point the app at it by setting GEMINI_API_BASE_URL=http://127.0.0.1:8765
+(see shared.configure_gemini) and, for traces,
+TRACE_EXPORTER=otlp OTLP_ENDPOINT=http://127.0.0.1:8765/v1/traces.
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from config import Config
+
+DEFAULT_SETTINGS = {
+    'latency': 'fixed:0',        # fixed:<ms> | uniform:<lo>,<hi> | normal:<mean>,<sd> | lognormal:<mu>,<sigma>
+    'image_latency': None,       # Same format; falls back to 'latency' when unset
+    'error_rate': 0.0,           # Fraction of requests answered with a 500
+    'rate_limit_rate': 0.0,      # Fraction of requests answered with a 429
+    'response_padding': 0,       # Extra characters appended to text responses to inflate payload size
+    'image_size': 1024,          # Edge length in pixels of the generated Imagen PNG
+    'stream_chunks': 4,          # Number of chunks a streamed response is split into
+    'seed': 0,
+    'trace_file': None,          # Where OTLP spans posted to /v1/traces are appended as JSON lines
+}
+
+# --- Canned Payloads ---
+_NAMES = ["Maya Patel", "Jordan Reyes", "Sam Okafor", "Lena Fischer", "Kenji Mori", "Ava Thompson"]
+_ARCHETYPES = ["The Time-Strapped Founder", "The Budget-Conscious Shopper", "The Tech Enthusiast",
+               "The Cautious Adopter", "The Efficiency Seeker"]
+_SENTIMENTS = ["Positive", "Negative", "Neutral"]
+
+
+def _pick(options, key):
+    digest = hashlib.sha256(key.encode('utf-8')).digest()
+    return options[digest[0] % len(options)]
+
+
+def _persona_payload(key):
+    return {
+        'name': _pick(_NAMES, key),
+        'archetype': _pick(_ARCHETYPES, key + 'a'),
+        'motivations_summary': 'Wants to get more done with less effort.',
+        'motivations_details': ['Save time on repetitive tasks', 'Grow the business steadily', 'Stay in control of costs'],
+        'pain_points_summary': 'Overwhelmed by tools that do not talk to each other.',
+        'pain_points_details': ['Too many disconnected apps', 'Onboarding takes too long', 'Hard to see what is working'],
+        'aspirations_summary': 'Run a calm, predictable operation.',
+        'aspirations_details': ['Automate the busywork', 'Make decisions backed by data', 'Spend evenings offline'],
+        'typical_scenario': 'Starts the day triaging email, jumps between spreadsheets and dashboards, and '
+                            'looks for a single place to see what needs attention.',
+        'visual_avatar_description': 'A focused founder at a tidy desk with a laptop and coffee',
+    }
+
+
+def _problem_persona_payload(key):
+    return {
+        'name': _pick(_NAMES, key),
+        'archetype': _pick(_ARCHETYPES, key + 'a'),
+        'problem_description_from_persona_view_summary': 'I never know what is in stock until a customer complains.',
+        'problem_description_from_persona_view_details': 'Inventory lives in three places and none of them agree. '
+                                                         'Every weekend goes to reconciling counts by hand.',
+        'current_solutions_and_their_flaws_summary': 'Spreadsheets and manual counts that are always out of date.',
+        'current_solutions_and_their_flaws_details': ['Shared spreadsheet: error-prone and stale',
+                                                      'Weekly manual counts: slow and tiring'],
+        'ideal_solution_expectations_summary': 'One live view of stock across every channel.',
+        'ideal_solution_expectations_details': ['Real-time sync across channels', 'Low-stock alerts', 'Simple setup'],
+        'motivations_related_to_problem_summary': 'Stop losing sales to stockouts',
+        'motivations_related_to_problem_details': ['Protect revenue', 'Win back weekends'],
+        'pain_points_related_to_problem_summary': 'Constant stockouts and overstock',
+        'pain_points_related_to_problem_details': ['Cancelled orders', 'Cash tied up in excess stock'],
+        'visual_avatar_description': 'A small shop owner surrounded by boxes, checking a tablet',
+    }
+
+
+def _solution_ideas_payload(key):
+    return {
+        'solution_ideas': [
+            {
+                'title': 'Unified Stock Hub',
+                'description': 'Syncs inventory across every sales channel in real time.',
+                'key_features': ['Channel connectors', 'Live stock counts', 'Low-stock alerts'],
+                'implementation_steps': ['Build connectors', 'Design dashboard', 'Pilot with 10 shops'],
+                'potential_challenges': ['API rate limits', 'Data quality'],
+                'success_metrics': ['Stockouts per month', 'Hours saved per week'],
+            },
+            {
+                'title': 'Reorder Autopilot',
+                'description': 'Suggests reorder quantities from sales velocity.',
+                'key_features': ['Demand forecasting', 'Supplier templates', 'One-click purchase orders'],
+                'implementation_steps': ['Collect sales history', 'Train forecaster', 'Ship beta'],
+                'potential_challenges': ['Seasonality', 'Trust in suggestions'],
+                'success_metrics': ['Overstock value', 'Forecast accuracy'],
+            },
+        ],
+        'prioritization': {
+            'high_priority': ['Unified Stock Hub'],
+            'medium_priority': ['Reorder Autopilot'],
+            'low_priority': [],
+        },
+        'implementation_timeline': {
+            'phase1': {'duration': '4 weeks', 'activities': ['Connector MVP', 'Dashboard prototype']},
+            'phase2': {'duration': '6 weeks', 'activities': ['Forecasting beta', 'Pilot rollout']},
+        },
+    }
+
+
+def _anti_persona_payload(key):
+    return {
+        'negative_marketing_card': {
+            'title': 'Negative Marketing & Sales Guidelines',
+            'summary': 'Avoid enterprise buyers who need heavy customisation and long procurement cycles.',
+            'keywords_to_exclude': ['enterprise ERP', 'custom integration'],
+            'channels_to_deprioritize': ['Trade shows', 'Cold outbound to large companies'],
+            'sales_red_flags': ['Asks for on-premise deployment', 'Requires a 6-month pilot'],
+        },
+        'product_brief_card': {
+            'title': 'Product Feature Exclusion/Refinement Brief',
+            'summary': 'Keep the product simple; skip features only power users would ask for.',
+            'undesirable_features': ['Scriptable workflows', 'Granular role hierarchies'],
+            'refinement_suggestions': ['Sensible defaults', 'Guided setup'],
+            'misuse_warnings': ['Using the tool as a full accounting system'],
+        },
+        'opportunity_report_card': {
+            'title': 'New Market/Product Exploration Briefs',
+            'summary': 'Mid-size retailers are underserved and could justify a premium tier.',
+            'neglected_areas': [
+                {'area_summary': 'Mid-size retailers', 'value_score': 4, 'details': ['Premium tier', 'Multi-store support']},
+                {'area_summary': 'Wholesale suppliers', 'value_score': 3, 'details': ['B2B ordering portal']},
+            ],
+            'overall_exploration_ideas': ['Partner with POS vendors'],
+        },
+        'suggested_anti_personas': [
+            {'persona_name': 'The Over-Engineer', 'reason': 'Prefers overly complex solutions; would be frustrated by simplicity.'},
+        ],
+    }
+
+
+def _landing_page_payload(key):
+    return {
+        'Hero': {'Headline': 'Run your shop, not your spreadsheets',
+                 'Sub-headline': 'One live view of everything that needs your attention.'},
+        'Problem': {'Title': 'Too many tools, too little time',
+                    'Paragraph_1': 'Your data is scattered and your evenings are disappearing.',
+                    'Bullet_Points': ['Disconnected apps', 'Manual reconciliation', 'No clear priorities']},
+        'Solution': {'Title': 'Everything in one place',
+                     'Paragraph_1': 'We connect your tools and surface what matters.',
+                     'Features': ['Live sync', 'Smart alerts', 'Two-minute setup'],
+                     'Paragraph_2': 'Spend less time checking and more time growing.'},
+        'Call to Action': {'Button_Text': 'Start your free trial', 'Subtext': 'No credit card required.'},
+    }
+
+
+def _messaging_payload(prompt, key):
+    lowered = prompt.lower()
+    if 'landing page' in lowered:
+        return _landing_page_payload(key)
+    if 'pitch slide' in lowered:
+        return {'headlines': ['A $4B market stuck in spreadsheets', 'One view, every channel', 'Setup in two minutes',
+                              'Retention driven by daily habits', 'Proven with 50 pilot shops']}
+    if 'cold email' in lowered or 're-engagement' in lowered:
+        return {'subject': 'Win back your weekends',
+                'body': 'Hi there,\n\nStill reconciling stock by hand? We built a tool that does it for you.\n\n'
+                        'Want a quick demo this week?'}
+    if 'tagline' in lowered:
+        return {'taglines': ['Less checking, more growing.', 'Your shop, in one view.', 'Calm operations, finally.',
+                             'Every channel. One truth.', 'Busywork, automated.']}
+    if 'social' in lowered:
+        return {'posts': ['Still juggling five inventory apps? 😩 There is a better way ✨',
+                          'We asked 100 shop owners what steals their weekends. #1 answer: spreadsheets 📊',
+                          'Two minutes to set up. Hours saved every week. 👉 Try it today']}
+    return {'content': 'Generic marketing copy.'}
+
+
+_FIT_DIMENSIONS = ('ease_of_use', 'cost_efficiency', 'time_savings', 'reliability', 'scalability')
+
+
+def _fit_scores_payload(prompt, key):
+    # One entry per numbered candidate line, with scores derived from the candidate text
+    candidates = re.findall(r'^\s*(\d+)\. (.+)$', prompt, re.M)
+    return {'scores': [
+        dict({'candidate': int(number)},
+             **{d: hashlib.sha256(f"{d}:{text}".encode('utf-8')).digest()[0] % 5 + 1 for d in _FIT_DIMENSIONS})
+        for number, text in candidates
+    ]}
+
+
+def _persona_patch_payload(prompt):
+    # Adds the refinement feedback as a pain point, replacing the last one when the list is full
+    feedback = prompt.rpartition('Refinement Feedback:')[2].strip() or 'Refined'
+    listed = re.search(r'"pain_points_details":\[(.*?)\]', prompt)
+    count = len(json.loads(f"[{listed.group(1)}]")) if listed else 0
+    if count >= 5:
+        return {'changes': [{'op': 'replace', 'field': 'pain_points_details', 'index': count - 1, 'value': feedback}]}
+    return {'changes': [{'op': 'add', 'field': 'pain_points_details', 'value': feedback}]}
+
+
+def _sentiment_payload(prompt, key):
+    # Classify deterministically from the text being analysed so repeated runs agree
+    return _pick(_SENTIMENTS, key)
+
+
+# Ordered so that more specific markers win over general ones
+PROMPT_FAMILIES = [
+    ('fit_scores', re.compile(r'rate how well each candidate solution', re.I)),
+    ('persona_patch', re.compile(r'return only the changes', re.I)),
+    ('sentiment', re.compile(r'analy[sz]e the sentiment', re.I)),
+    ('image_summary', re.compile(r'descriptions of photos', re.I)),
+    ('image_context', re.compile(r'describe the key elements|analy[sz]e the provided image', re.I)),
+    ('solution_ideas', re.compile(r'solution ideas', re.I)),
+    ('problem_solution', re.compile(r'primarily embodies this problem|problem-solution persona', re.I)),
+    ('anti_persona', re.compile(r'negative marketing', re.I)),
+    ('messaging', re.compile(r'marketing copywriter', re.I)),
+    ('persona', re.compile(r'persona', re.I)),
+]
+
+
+def classify_prompt(prompt):
+    """Returns the prompt family name for a prompt, or 'generic' if none matches."""
+    for family, pattern in PROMPT_FAMILIES:
+        if pattern.search(prompt):
+            return family
+    return 'generic'
+
+
+def canned_response_text(prompt):
+    """Builds the deterministic response text for a prompt. Returns (family, text)."""
+    family = classify_prompt(prompt)
+    key = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+    if family == 'sentiment':
+        sentiment = _sentiment_payload(prompt, key)
+        if 'confidence' in prompt:
+            return family, json.dumps({'sentiment': sentiment, 'confidence': round(0.5 + int(key[:2], 16) / 510, 2)})
+        return family, sentiment
+    if family == 'image_summary':
+        count = len(re.findall(r'^\s*\d+\. ', prompt, re.M))
+        return family, (f'Across {count} photos: compact home offices and shared workspaces with laptops and '
+                        'coffee; a busy but organised mood suggesting remote professionals juggling several tools.')
+    if family == 'image_context':
+        return family, ('A tidy home office with a laptop, notebook and coffee; calm, focused mood suggesting '
+                        'a remote professional who values efficiency.')
+    if family == 'fit_scores':
+        payload = _fit_scores_payload(prompt, key)
+    elif family == 'persona_patch':
+        payload = _persona_patch_payload(prompt)
+    elif family == 'solution_ideas':
+        payload = _solution_ideas_payload(key)
+    elif family == 'problem_solution':
+        payload = _problem_persona_payload(key)
+    elif family == 'anti_persona':
+        payload = _anti_persona_payload(key)
+    elif family == 'messaging':
+        payload = _messaging_payload(prompt, key)
+    elif family == 'persona':
+        payload = _persona_payload(key)
+        if 'in image_context' in prompt:
+            payload = dict({'image_context': 'A tidy home office with a laptop, notebook and coffee; calm, focused mood.'}, **payload)
+    else:
+        return family, 'OK'
+    return family, json.dumps(payload)
+
+
+# --- Latency & Fault Injection ---
+def parse_latency_spec(spec):
+    """
+    Parses a latency distribution spec like 'uniform:20,200' into a sampler.
+    Returns a function taking a random.Random and returning a delay in seconds.
+    """
+    if not spec:
+        return lambda rng: 0.0
+    kind, _, raw_args = spec.partition(':')
+    args = [float(a) for a in raw_args.split(',') if a.strip()]
+    if kind == 'fixed':
+        return lambda rng: max(0.0, args[0] / 1000.0)
+    if kind == 'uniform':
+        return lambda rng: rng.uniform(args[0], args[1]) / 1000.0
+    if kind == 'normal':
+        return lambda rng: max(0.0, rng.gauss(args[0], args[1]) / 1000.0)
+    if kind == 'lognormal':
+        # mu/sigma describe the underlying normal of ln(milliseconds)
+        return lambda rng: rng.lognormvariate(args[0], args[1]) / 1000.0
+    raise ValueError(f"Unknown latency distribution '{kind}'. Use fixed, uniform, normal or lognormal.")
+
+
+_png_cache = {}
+_png_cache_lock = threading.Lock()
+
+
+def _solid_png(prompt, size):
+    """Returns PNG bytes of a solid-colour square derived from the prompt, cached per colour and size."""
+    from PIL import Image as PIL_Image
+
+    digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+    color = (digest[0], digest[1], digest[2])
+    cache_key = (color, size)
+    with _png_cache_lock:
+        if cache_key not in _png_cache:
+            buffered = io.BytesIO()
+            PIL_Image.new('RGB', (size, size), color).save(buffered, format='PNG')
+            _png_cache[cache_key] = buffered.getvalue()
+        return _png_cache[cache_key]
+
+
+def _estimate_tokens(text):
+    return max(1, math.ceil(len(text) / 4))
+
+
+def _extract_prompt(body):
+    """Concatenates all text parts of a generateContent request body."""
+    texts = []
+    for content in body.get('contents', []):
+        for part in content.get('parts', []):
+            if 'text' in part:
+                texts.append(part['text'])
+    system_instruction = body.get('systemInstruction') or body.get('system_instruction')
+    if system_instruction:
+        for part in system_instruction.get('parts', []):
+            if 'text' in part:
+                texts.append(part['text'])
+    return "\n".join(texts)
+
+
+def _rfc3339(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(timestamp)) + 'Z'
+
+
+def _count_inline_bytes(body):
+    total = 0
+    for content in body.get('contents', []):
+        for part in content.get('parts', []):
+            inline = part.get('inlineData') or part.get('inline_data')
+            if inline and inline.get('data'):
+                total += len(inline['data'])
+    return total
+
+
+# --- HTTP Handler ---
+class MockGeminiHandler(BaseHTTPRequestHandler):
+    server_version = "MockGemini/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.settings.get('verbose'):
+            super().log_message(format, *args)
+
+    # Helpers
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error_payload(self, status, message, reason):
+        self._send_json(status, {'error': {'code': status, 'message': message, 'status': reason}})
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw or b'{}')
+
+    def _inject_faults(self):
+        """Sleeps for the configured latency and returns True if a fault response was sent."""
+        settings = self.server.settings
+        rng = self.server.next_rng()
+        roll = rng.random()
+        if roll < settings['rate_limit_rate']:
+            self.server.record('rate_limited')
+            self._send_error_payload(429, 'Resource has been exhausted (e.g. check quota).', 'RESOURCE_EXHAUSTED')
+            return True, rng
+        if roll < settings['rate_limit_rate'] + settings['error_rate']:
+            self.server.record('errors')
+            self._send_error_payload(500, 'An internal error has occurred.', 'INTERNAL')
+            return True, rng
+        return False, rng
+
+    # Routes
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/healthz':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/mock/stats':
+            self._send_json(200, self.server.snapshot_stats())
+        elif path == '/mock/traces':
+            self._send_json(200, {'spans': self.server.snapshot_spans()})
+        else:
+            self._send_error_payload(404, f'Unknown path {path}', 'NOT_FOUND')
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        path = parsed.path
+        query = parse_qs(parsed.query)
+        try:
+            body = self._read_body()
+        except json.JSONDecodeError:
+            self._send_error_payload(400, 'Request body is not valid JSON.', 'INVALID_ARGUMENT')
+            return
+
+        if path == '/v1/traces':
+            self._handle_traces(body)
+        elif path.endswith('/cachedContents'):
+            self._handle_create_cache(body)
+        elif path.endswith(':generateContent'):
+            self._handle_generate(body, stream=False, query=query)
+        elif path.endswith(':streamGenerateContent'):
+            self._handle_generate(body, stream=True, query=query)
+        elif path.endswith(':predict'):
+            self._handle_predict(body)
+        else:
+            self._send_error_payload(404, f'Unknown path {path}', 'NOT_FOUND')
+
+    def _handle_generate(self, body, stream, query):
+        faulted, rng = self._inject_faults()
+        if faulted:
+            return
+        settings = self.server.settings
+        prompt = _extract_prompt(body)
+        cached = self.server.get_cached_content(body.get('cachedContent')) if body.get('cachedContent') else None
+        if body.get('cachedContent') and cached is None:
+            self._send_error_payload(404, f"CachedContent not found: {body['cachedContent']}", 'NOT_FOUND')
+            return
+        cached_prompt = _extract_prompt(cached) if cached else ""
+        family, text = canned_response_text(prompt + "\n" + cached_prompt if cached_prompt else prompt)
+        if settings['response_padding'] and family != 'sentiment':
+            # Pad with trailing whitespace so JSON payloads stay parseable
+            text = text + (' ' * settings['response_padding'])
+        self.server.record(family)
+
+        delay = self.server.latency(rng)
+        usage = {
+            'promptTokenCount': _estimate_tokens(prompt) + _count_inline_bytes(body) // 1000,
+            'candidatesTokenCount': _estimate_tokens(text),
+        }
+        if cached_prompt:
+            usage['cachedContentTokenCount'] = _estimate_tokens(cached_prompt)
+            usage['promptTokenCount'] += usage['cachedContentTokenCount']
+        usage['totalTokenCount'] = usage['promptTokenCount'] + usage['candidatesTokenCount']
+
+        if not stream:
+            time.sleep(delay)
+            self._send_json(200, _candidate_payload(text, usage))
+            return
+
+        chunk_count = max(1, int(settings['stream_chunks']))
+        chunk_size = max(1, math.ceil(len(text) / chunk_count))
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)] or ['']
+        use_sse = query.get('alt', [''])[0] == 'sse'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream' if use_sse else 'application/json; charset=UTF-8')
+        self.end_headers()
+        # Spread the sampled latency across the stream, front-loading time-to-first-token
+        time.sleep(delay * 0.5)
+        if not use_sse:
+            self.wfile.write(b'[')
+        for i, chunk in enumerate(chunks):
+            is_last = i == len(chunks) - 1
+            payload = _candidate_payload(chunk, usage if is_last else None, finished=is_last)
+            if use_sse:
+                self.wfile.write(b'data: ' + json.dumps(payload).encode('utf-8') + b'\r\n\r\n')
+            else:
+                self.wfile.write((',' if i else '').encode('utf-8') + json.dumps(payload).encode('utf-8'))
+            self.wfile.flush()
+            if not is_last:
+                time.sleep(delay * 0.5 / max(1, len(chunks) - 1))
+        if not use_sse:
+            self.wfile.write(b']')
+        self.wfile.flush()
+
+    def _handle_create_cache(self, body):
+        faulted, _ = self._inject_faults()
+        if faulted:
+            return
+        self.server.record('cached_content')
+        self._send_json(200, self.server.store_cached_content(body))
+
+    def _handle_traces(self, body):
+        spans = []
+        for resource_spans in body.get('resourceSpans', []):
+            for scope_spans in resource_spans.get('scopeSpans', []):
+                spans.extend(scope_spans.get('spans', []))
+        self.server.store_spans(spans)
+        self._send_json(200, {'partialSuccess': {}})
+
+    def _handle_predict(self, body):
+        faulted, rng = self._inject_faults()
+        if faulted:
+            return
+        settings = self.server.settings
+        instances = body.get('instances', {})
+        if isinstance(instances, list):
+            instances = instances[0] if instances else {}
+        prompt = instances.get('prompt', '')
+        sample_count = int(body.get('parameters', {}).get('sampleCount', 1))
+        self.server.record('imagen')
+        time.sleep(self.server.image_latency(rng))
+        png = _solid_png(prompt, int(settings['image_size']))
+        encoded = base64.b64encode(png).decode('ascii')
+        self._send_json(200, {'predictions': [
+            {'bytesBase64Encoded': encoded, 'mimeType': 'image/png'} for _ in range(sample_count)
+        ]})
+
+
+def _candidate_payload(text, usage=None, finished=True):
+    candidate = {'content': {'parts': [{'text': text}], 'role': 'model'}, 'index': 0}
+    if finished:
+        candidate['finishReason'] = 'STOP'
+    payload = {'candidates': [candidate], 'modelVersion': 'mock-gemini'}
+    if usage:
+        payload['usageMetadata'] = usage
+    return payload
+
+
+class MockGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, settings):
+        super().__init__(address, MockGeminiHandler)
+        self.settings = dict(DEFAULT_SETTINGS, **settings)
+        self.latency = parse_latency_spec(self.settings['latency'])
+        self.image_latency = parse_latency_spec(self.settings['image_latency'] or self.settings['latency'])
+        self._seed_rng = random.Random(self.settings['seed'])
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._spans = deque(maxlen=10000)
+        self._cached_contents = {}
+
+    def next_rng(self):
+        """Returns a per-request RNG derived from the server seed, so runs are reproducible."""
+        with self._lock:
+            return random.Random(self._seed_rng.getrandbits(64))
+
+    def record(self, name):
+        with self._lock:
+            self._stats[name] = self._stats.get(name, 0) + 1
+
+    def snapshot_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def store_spans(self, spans):
+        with self._lock:
+            self._spans.extend(spans)
+            self._stats['spans'] = self._stats.get('spans', 0) + len(spans)
+            if self.settings['trace_file']:
+                with open(self.settings['trace_file'], 'a', encoding='utf-8') as f:
+                    f.writelines(json.dumps(s) + "\n" for s in spans)
+
+    def store_cached_content(self, body):
+        """Keeps a cachedContents create request and returns the resource as the API would."""
+        now = time.time()
+        ttl = float(str(body.get('ttl', '3600s')).rstrip('s') or 3600)
+        with self._lock:
+            name = f"cachedContents/mock-{len(self._cached_contents) + 1}"
+            resource = dict(body, name=name,
+                            createTime=_rfc3339(now), updateTime=_rfc3339(now), expireTime=_rfc3339(now + ttl),
+                            usageMetadata={'totalTokenCount': _estimate_tokens(_extract_prompt(body))})
+            resource.pop('ttl', None)
+            self._cached_contents[name] = resource
+        return resource
+
+    def get_cached_content(self, name):
+        with self._lock:
+            return self._cached_contents.get(name)
+
+    def snapshot_spans(self):
+        with self._lock:
+            return list(self._spans)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def load_settings_from_config():
+    """Reads MOCK_* overrides from the environment via Config."""
+    settings = dict(DEFAULT_SETTINGS)
+    for key, default in DEFAULT_SETTINGS.items():
+        value = Config.get_config(f"MOCK_{key.upper()}")
+        if value is None:
+            continue
+        settings[key] = type(default)(value) if isinstance(default, (int, float)) else value
+    return settings
+
+
+def start_mock_server(host='127.0.0.1', port=0, settings=None):
+    """
+    Starts the mock server on a background daemon thread.
+    Pass port=0 to pick a free port. Returns the running MockGeminiServer; call shutdown() to stop it.
+    """
+    server = MockGeminiServer((host, port), settings or {})
+    thread = threading.Thread(target=server.serve_forever, name='mock-gemini', daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    settings = load_settings_from_config()
+    parser = argparse.ArgumentParser(description="Local mock of the Gemini and Imagen endpoints.")
+    parser.add_argument('--host', default=Config.get_config('MOCK_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(Config.get_config('MOCK_PORT', 8765)))
+    parser.add_argument('--latency', default=settings['latency'],
+                        help="fixed:<ms> | uniform:<lo>,<hi> | normal:<mean>,<sd> | lognormal:<mu>,<sigma>")
+    parser.add_argument('--image-latency', default=settings['image_latency'])
+    parser.add_argument('--error-rate', type=float, default=settings['error_rate'])
+    parser.add_argument('--rate-limit-rate', type=float, default=settings['rate_limit_rate'])
+    parser.add_argument('--response-padding', type=int, default=settings['response_padding'])
+    parser.add_argument('--image-size', type=int, default=settings['image_size'])
+    parser.add_argument('--stream-chunks', type=int, default=settings['stream_chunks'])
+    parser.add_argument('--seed', type=int, default=settings['seed'])
+    parser.add_argument('--trace-file', default=settings['trace_file'], help="Append received OTLP spans to this JSONL file")
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = MockGeminiServer((args.host, args.port), {
+        'latency': args.latency,
+        'image_latency': args.image_latency,
+        'error_rate': args.error_rate,
+        'rate_limit_rate': args.rate_limit_rate,
+        'response_padding': args.response_padding,
+        'image_size': args.image_size,
+        'stream_chunks': args.stream_chunks,
+        'seed': args.seed,
+        'trace_file': args.trace_file,
+        'verbose': args.verbose,
+    })
+    print(f"Mock Gemini/Imagen server listening on {server.base_url}")
+    print(f"Set GEMINI_API_BASE_URL={server.base_url} to route the app through it.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Version history for refined personas.
+
+Each persona in st.session_state.generated_personas has a PersonaHistory at the
+same index of st.session_state.persona_histories. A refinement is committed as a
+new version; undo and redo only move a cursor, so both are O(1) and copy nothing.
+
+Versions share structure: a version is a shallow dict whose unchanged values,
+the avatar image included, are the same objects as in the version before it.
+Each refinement costs one small dict plus the text it actually changed.
+"""
+from config import Config
+
+DEFAULT_HISTORY_SIZE = 50  # Versions kept per persona; the oldest are dropped first
+
+
+def _same(old, new):
+    # Text and lists compare by value; anything else (e.g. an avatar image) only by identity
+    return old is new or (isinstance(new, (str, list, int, float)) and type(old) is type(new) and old == new)
+
+
+def _share(previous, persona):
+    """persona as a new dict reusing previous's objects for every value that didn't change."""
+    return {k: previous[k] if k in previous and _same(previous[k], v) else v for k, v in persona.items()}
+
+
+class PersonaHistory:
+    __slots__ = ('_versions', '_notes', '_cursor', '_max_versions')
+
+    def __init__(self, persona, note="Generated"):
+        self._versions = [persona]
+        self._notes = [note]
+        self._cursor = 0
+        self._max_versions = max(2, int(Config.get_config('PERSONA_HISTORY_SIZE', DEFAULT_HISTORY_SIZE)))
+
+    def __len__(self):
+        return len(self._versions)
+
+    @property
+    def current(self):
+        return self._versions[self._cursor]
+
+    @property
+    def index(self):
+        return self._cursor
+
+    @property
+    def can_undo(self):
+        return self._cursor > 0
+
+    @property
+    def can_redo(self):
+        return self._cursor < len(self._versions) - 1
+
+    def version(self, index):
+        return self._versions[index]
+
+    def note(self, index):
+        return self._notes[index]
+
+    def commit(self, persona, note=""):
+        """Adds persona as the newest version (dropping any redo versions) and returns it."""
+        persona = _share(self.current, persona)
+        del self._versions[self._cursor + 1:]
+        del self._notes[self._cursor + 1:]
+        self._versions.append(persona)
+        self._notes.append(note)
+        if len(self._versions) > self._max_versions:
+            del self._versions[0]
+            del self._notes[0]
+        self._cursor = len(self._versions) - 1
+        return persona
+
+    def undo(self):
+        if self.can_undo:
+            self._cursor -= 1
+        return self.current
+
+    def redo(self):
+        if self.can_redo:
+            self._cursor += 1
+        return self.current
+
+
+def sync(histories, personas):
+    """
+    Returns a history list aligned with personas. A persona that isn't the current version
+    of the history at its index (newly generated, or replaced elsewhere) starts a new history.
+    """
+    return [
+        histories[i] if i < len(histories) and histories[i].current is persona else PersonaHistory(persona)
+        for i, persona in enumerate(personas)
+    ]
+
+
+def diff(before, after):
+    """
+    Field-level differences between two versions: {field: (old, new)} for changed values, or
+    {field: {'added': [...], 'removed': [...]}} for lists. Shared values are skipped without comparing.
+    """
+    changes = {}
+    for field in dict.fromkeys([*before, *after]):
+        old, new = before.get(field), after.get(field)
+        if _same(old, new):
+            continue
+        if isinstance(old, list) and isinstance(new, list):
+            changes[field] = {
+                'added': [item for item in new if item not in old],
+                'removed': [item for item in old if item not in new],
+            }
+        else:
+            changes[field] = (old, new)
+    return changes
@@ -0,0 +1,92 @@
+"""
+Field-level edits to a persona, as returned by patch-mode refinement.
+
+A patch is the `changes` list of schemas.PERSONA_PATCH:
+
+    {"op": "set", "field": "archetype", "value": "..."}            text fields
+    {"op": "add", "field": "pain_points_details", "value": "..."}  list fields; "index" inserts instead of appending
+    {"op": "replace", "field": "...", "index": 1, "value": "..."}
+    {"op": "remove", "field": "...", "index": 0}
+
+List indexes refer to the persona as it was sent, so several edits to one list
+don't shift each other. apply_patch() returns a new persona dict: untouched
+fields (avatar_image included) are the same objects as before, and only the
+lists that change are copied. A patch that doesn't fit the persona raises
+PatchError rather than being half-applied.
+"""
+import schemas
+import validators
+
+TEXT_FIELDS = frozenset(k for k, v in schemas.PERSONA['properties'].items() if v['type'] == 'string')
+LIST_FIELDS = {k: v.get('max_items') for k, v in schemas.PERSONA['properties'].items() if v['type'] == 'array'}
+MAX_LIST_ITEMS = min(limit for limit in LIST_FIELDS.values() if limit)
+
+
+class PatchError(ValueError):
+    pass
+
+
+def _check_change(change, persona):
+    op, field = change['op'], change['field']
+    if op == 'set':
+        if field not in TEXT_FIELDS:
+            raise PatchError(f"'set' needs a text field, got '{field}'")
+    elif field not in LIST_FIELDS:
+        raise PatchError(f"'{op}' needs a list field, got '{field}'")
+    if op != 'remove' and not change.get('value'):
+        raise PatchError(f"'{op}' on '{field}' has no value")
+    if op in ('replace', 'remove') or change.get('index') is not None:
+        size = len(persona.get(field) or [])
+        index = change.get('index')
+        # add may insert at the end of the list; replace/remove need an existing item
+        upper = size if op == 'add' else size - 1
+        if index is None or not 0 <= index <= upper:
+            raise PatchError(f"'{op}' on '{field}' has index {index!r}; the list has {size} items")
+
+
+def _apply_list(items, changes):
+    replaced = {c['index']: c['value'] for c in changes if c['op'] == 'replace'}
+    removed = {c['index'] for c in changes if c['op'] == 'remove'}
+    inserted = {}
+    for c in changes:
+        if c['op'] == 'add':
+            inserted.setdefault(len(items) if c.get('index') is None else c['index'], []).append(c['value'])
+    result = []
+    for i, item in enumerate(items):
+        result.extend(inserted.get(i, ()))
+        if i not in removed:
+            result.append(replaced.get(i, item))
+    result.extend(inserted.get(len(items), ()))
+    return result
+
+
+def apply_patch(persona, changes):
+    """Returns a copy of persona with changes applied. Raises PatchError if they don't apply cleanly."""
+    result = validators.validate('persona_patch', {'changes': changes})
+    if not result.ok or len(result.value['changes']) != len(changes):
+        raise PatchError("; ".join(result.messages()) or "invalid patch")
+    changes = result.value['changes']
+
+    patched = dict(persona)
+    by_list = {}
+    for change in changes:
+        _check_change(change, persona)
+        if change['op'] == 'set':
+            patched[change['field']] = change['value']
+        else:
+            by_list.setdefault(change['field'], []).append(change)
+    for field, list_changes in by_list.items():
+        items = _apply_list(list(persona.get(field) or []), list_changes)
+        limit = LIST_FIELDS[field]
+        if limit and len(items) > limit:
+            raise PatchError(f"'{field}' would have {len(items)} items; at most {limit} are allowed")
+        if not items:
+            raise PatchError(f"'{field}' would be empty")
+        patched[field] = items
+    return patched
+
+
+def changed_fields(before, after):
+    """Names of the fields whose values differ between two versions of a persona."""
+    return [k for k in dict.fromkeys([*before, *after])
+            if before.get(k) is not after.get(k) and before.get(k) != after.get(k)]
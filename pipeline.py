@@ -0,0 +1,414 @@
+"""
+Dependency-graph scheduler for multi-step model work.
+
+A Pipeline is a set of named stages; each stage declares the stages it requires
+and receives their results as keyword arguments. Stages whose requirements are
+met run concurrently on a thread pool, and Pipeline.run() yields a StageResult
+for every stage as soon as it finishes, so the caller (the Streamlit script
+thread) can render partial results while the rest of the graph is still running.
+Long stages declared with progress=True can also report partial values while they
+run; run(progress=True) yields those as StageResults with status 'progress'.
+Wall time therefore follows the critical path rather than the sum of all stages.
+
+Worker threads inherit the caller's tracing context and, inside a Streamlit run,
+its ScriptRunContext, so st.error() calls from engine functions still reach the page.
+
+build_persona_pipeline() wires up the Persona Builder:
+
+    feedback ──> row_sentiment
+        │──────> overall_sentiment
+        └──────> persona ──> avatar
+    image_context ─┘   └┄┄> (speculative avatar, started mid-stream)
+
+image_context fans out over the uploaded images (at most IMAGE_CONTEXT_CONCURRENCY
+at a time) and merges their descriptions into one summary for the persona prompt.
+Every image is downscaled and hashed before any is analyzed, so near-duplicates
+within one upload are analyzed once instead of racing past the image-context cache.
+With PERSONA_IMAGE_MODE=combined (the default) and at most COMBINED_IMAGE_LIMIT
+images, the images are sent once, with the persona prompt, and the model returns
+their description along with the persona; image_context then just hands that
+description on:
+
+    feedback ──> persona ──> image_context
+    images ───────┘   └────> avatar
+"""
+import io
+import re
+import queue
+import threading
+import time
+import unicodedata
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+import feedback_store
+import instrumentation
+import shared
+import tracing
+from config import Config
+
+try:
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+except ImportError:  # Streamlit not installed (e.g. headless benchmarking)
+    add_script_run_ctx = get_script_run_ctx = None
+
+DEFAULT_SENTIMENT_CONCURRENCY = 8
+SENTIMENT_PROGRESS_UPDATES = 20  # Progress reports per row_sentiment run, at most
+DEFAULT_IMAGE_CONTEXT_CONCURRENCY = 4
+DEFAULT_COMBINED_IMAGE_LIMIT = 4  # Up to this many images go straight into the persona call
+DEFAULT_AVATAR_SIMILARITY_THRESHOLD = 0.9  # Descriptions at least this similar keep the current avatar
+
+StageResult = namedtuple('StageResult', ['name', 'value', 'error', 'duration', 'status'])
+
+
+class Stage:
+    """A named step of a Pipeline. With progress=True, fn also receives report(value) for partial results."""
+    __slots__ = ('name', 'fn', 'requires', 'progress')
+
+    def __init__(self, name, fn, requires=(), progress=False):
+        self.name = name
+        self.fn = fn
+        self.requires = tuple(requires)
+        self.progress = progress
+
+
+def bind_worker_context(fn):
+    """Returns fn bound to the caller's tracing context and Streamlit ScriptRunContext, for use in a worker thread."""
+    traced = tracing.wrap(fn)
+    script_ctx = get_script_run_ctx(suppress_warning=True) if get_script_run_ctx else None
+    if script_ctx is None:
+        return traced
+
+    def run_with_script_ctx(*args, **kwargs):
+        add_script_run_ctx(threading.current_thread(), script_ctx)
+        return traced(*args, **kwargs)
+    return run_with_script_ctx
+
+
+def map_concurrently(fn, items, max_workers, on_result=None):
+    """
+    Applies fn to every item on at most max_workers threads; results keep the input order.
+    on_result(index, result), if given, is called on the calling thread as each item finishes.
+    """
+    items = list(items)
+    if not items:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items))), thread_name_prefix='fanout') as executor:
+        if on_result is None:
+            return list(executor.map(bind_worker_context(fn), items))
+        bound = bind_worker_context(fn)
+        futures = {executor.submit(bound, item): i for i, item in enumerate(items)}
+        results = [None] * len(items)
+        for future in as_completed(futures):
+            index = futures[future]
+            results[index] = future.result()
+            on_result(index, results[index])
+        return results
+
+
+# --- Avatar Change Detection ---
+# A new avatar costs an Imagen call, so one is only requested when the description changes what
+# the picture would show, not when the model rewords it ("a laptop and coffee" -> "coffee and laptop").
+_DESCRIPTION_WORD = re.compile(r"[a-z0-9]+")
+_DESCRIPTION_STOPWORDS = frozenset(
+    "a an the and or of with in on at to for from by as is are be their his her its who while into".split()
+)
+
+
+def _description_terms(description):
+    # Case, punctuation, word order, stopwords and plural -s are ignored
+    text = unicodedata.normalize('NFKC', description or '').lower()
+    return Counter(
+        word[:-1] if len(word) > 3 and word.endswith('s') and not word.endswith('ss') else word
+        for word in _DESCRIPTION_WORD.findall(text) if word not in _DESCRIPTION_STOPWORDS
+    )
+
+
+def description_similarity(old, new):
+    """
+    Overlap (0-1) of the normalized content words of two avatar descriptions: shared words over all
+    words (weighted Jaccard), so an added attribute ("a woman founder") counts as much as a changed one.
+    """
+    old_terms, new_terms = _description_terms(old), _description_terms(new)
+    if not old_terms and not new_terms:
+        return 1.0
+    return sum((old_terms & new_terms).values()) / sum((old_terms | new_terms).values())
+
+
+def _avatar_similarity_threshold():
+    return float(Config.get_config('AVATAR_SIMILARITY_THRESHOLD', DEFAULT_AVATAR_SIMILARITY_THRESHOLD))
+
+
+def avatar_description_changed(old, new):
+    """
+    True if new describes a different avatar than old, i.e. their description_similarity is below
+    AVATAR_SIMILARITY_THRESHOLD. Kept avatars are recorded as cache hits for 'avatar_description'.
+    """
+    if not new:
+        return False
+    similarity = description_similarity(old, new) if old else 0.0
+    changed = similarity < _avatar_similarity_threshold()
+    instrumentation.record_cache('avatar_description', not changed)
+    tracing.set_attribute("avatar.description_similarity", round(similarity, 3))
+    return changed
+
+
+class SpeculativeAvatar:
+    """
+    Starts the Imagen request for a persona's visual_avatar_description while the persona
+    JSON is still streaming. claim() hands the request over only if the final persona kept
+    the same description (see description_similarity); otherwise it is cancelled, or its
+    result dropped if already running.
+    """
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.description = None
+        self._future = None
+        self._lock = threading.Lock()
+
+    def start(self, description):
+        """Submits the speculative request; only the first description per instance is used."""
+        with self._lock:
+            if self._future is not None:
+                return
+            self.description = description
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='speculative-avatar')
+            self._future = executor.submit(bind_worker_context(shared.generate_persona_image), description, self.api_key)
+            executor.shutdown(wait=False)
+
+    def claim(self, description):
+        """Returns the Future for description if the speculation matches it, else discards the speculation and returns None."""
+        with self._lock:
+            future, speculated = self._future, self.description
+            self._future = None
+        if future is None:
+            return None
+        hit = description is not None and description_similarity(speculated, description) >= _avatar_similarity_threshold()
+        instrumentation.record_cache('speculative_avatar', hit)
+        if hit:
+            return future
+        future.cancel()
+        return None
+
+    def discard(self):
+        self.claim(None)
+
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage '{stage.name}'")
+            self.stages[stage.name] = stage
+        for stage in self.stages.values():
+            missing = [dep for dep in stage.requires if dep not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' requires unknown stage(s): {', '.join(missing)}")
+        self._check_acyclic()
+
+    def _check_acyclic(self):
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a dependency cycle through '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].requires:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def _run_stage(self, stage, kwargs, events):
+        start = time.perf_counter()
+        if stage.progress:
+            if events is None:
+                kwargs['report'] = lambda value: None
+            else:
+                kwargs['report'] = lambda value: events.put(
+                    StageResult(stage.name, value, None, time.perf_counter() - start, 'progress'))
+        with tracing.span(f"pipeline.{stage.name}"):
+            value = stage.fn(**kwargs)
+        return value, time.perf_counter() - start
+
+    def run(self, max_workers=None, progress=False):
+        """
+        Executes the graph and yields a StageResult per stage in completion order.
+        A stage that raises is reported with status 'error'; everything depending on it is 'skipped'.
+        With progress=True, partial values reported by progress stages are yielded as they arrive,
+        with status 'progress', before that stage's own result.
+        """
+        results = {}
+        failed = set()
+        pending = dict(self.stages)
+        running = {}
+        # Finished futures and progress reports arrive on one queue, in the order they happened
+        events = queue.SimpleQueue()
+        with ThreadPoolExecutor(max_workers=max_workers or len(self.stages) or 1, thread_name_prefix='pipeline') as executor:
+            while pending or running:
+                # Resolve skips first: they can cascade through several layers at once
+                skipped = True
+                while skipped:
+                    skipped = False
+                    for name, stage in list(pending.items()):
+                        if any(dep in failed for dep in stage.requires):
+                            del pending[name]
+                            failed.add(name)
+                            skipped = True
+                            yield StageResult(name, None, None, 0.0, 'skipped')
+                for name, stage in list(pending.items()):
+                    if all(dep in results for dep in stage.requires):
+                        del pending[name]
+                        kwargs = {dep: results[dep] for dep in stage.requires}
+                        future = executor.submit(bind_worker_context(self._run_stage), stage, kwargs,
+                                                 events if progress else None)
+                        running[future] = stage
+                        future.add_done_callback(events.put)
+                if not running:
+                    break
+                event = events.get()
+                if isinstance(event, StageResult):
+                    yield event
+                    continue
+                stage = running.pop(event)
+                try:
+                    value, duration = event.result()
+                except Exception as e:
+                    failed.add(stage.name)
+                    yield StageResult(stage.name, None, e, 0.0, 'error')
+                else:
+                    results[stage.name] = value
+                    yield StageResult(stage.name, value, None, duration, 'ok')
+
+
+# --- Persona Builder Graph ---
+def parse_feedback_csv(csv_bytes):
+    """Returns the non-empty 'feedback' column of an uploaded CSV as a list of strings."""
+    df = pd.read_csv(io.BytesIO(csv_bytes))
+    if 'feedback' not in df.columns:
+        raise ValueError("CSV must contain a column named 'feedback'.")
+    return df['feedback'].dropna().astype(str).tolist()
+
+
+def build_persona_pipeline(feedback_text=None, csv_bytes=None, images=None, api_key=None,
+                           generate_avatar=True, sentiment_concurrency=None, image_concurrency=None,
+                           known_feedback=None):
+    """
+    Builds the Persona Builder graph for the given inputs; images is a list of (bytes, mime_type).
+    Per-entry sentiment for a CSV comes back from row_sentiment as a FeedbackStore; known_feedback,
+    a digest -> FeedbackStore mapping, lets a CSV that was already classified skip the model calls.
+    Pasted text is treated as a single entry, so it only needs the overall sentiment. Images are
+    described in the persona call itself (combined mode), or analyzed concurrently beforehand and
+    their descriptions merged into one context summary for the persona.
+    """
+    if sentiment_concurrency is None:
+        sentiment_concurrency = int(Config.get_config('SENTIMENT_CONCURRENCY', DEFAULT_SENTIMENT_CONCURRENCY))
+    if image_concurrency is None:
+        image_concurrency = int(Config.get_config('IMAGE_CONTEXT_CONCURRENCY', DEFAULT_IMAGE_CONTEXT_CONCURRENCY))
+    images = [(data, mime_type) for data, mime_type in images or () if data]
+    combine_images = bool(images) and (
+        str(Config.get_config('PERSONA_IMAGE_MODE', 'combined')).lower() == 'combined'
+        and len(images) <= int(Config.get_config('COMBINED_IMAGE_LIMIT', DEFAULT_COMBINED_IMAGE_LIMIT))
+    )
+    combined_image_context = {}  # Filled by persona() in combined mode
+
+    def feedback():
+        if csv_bytes is not None:
+            return parse_feedback_csv(csv_bytes)
+        return [feedback_text] if feedback_text else []
+
+    def row_sentiment(feedback, report):
+        # Reports {'done', 'total', 'counts', 'entries'}: running counts per sentiment, and the
+        # entries classified since the last report
+        digest = feedback_store.upload_digest(csv_bytes)
+        known = (known_feedback or {}).get(digest)
+        if known is not None and len(known) == len(feedback):
+            instrumentation.record_cache('row_sentiment', True)
+            report({'done': len(known), 'total': len(known), 'counts': known.counts(), 'entries': known.tail(SENTIMENT_PROGRESS_UPDATES)})
+            return known
+        instrumentation.record_cache('row_sentiment', False)
+
+        batch_size = max(1, len(feedback) // SENTIMENT_PROGRESS_UPDATES)
+        batch = []
+        counts = Counter()
+        done = 0
+
+        def on_result(index, result):
+            nonlocal done
+            done += 1
+            counts[result[0]] += 1
+            batch.append({'text': feedback[index], 'sentiment': result[0]})
+            if len(batch) >= batch_size or done == len(feedback):
+                report({'done': done, 'total': len(feedback), 'counts': dict(counts), 'entries': list(batch)})
+                batch.clear()
+
+        results = map_concurrently(shared.classify_sentiment, feedback, sentiment_concurrency, on_result=on_result)
+        return feedback_store.FeedbackStore.build(
+            digest, feedback, [sentiment for sentiment, _ in results], [confidence for _, confidence in results]
+        )
+
+    def overall_sentiment(feedback):
+        combined = "\n\n".join(feedback)
+        return shared.analyze_sentiment(combined) if combined else None
+
+    def image_context():
+        prepared = map_concurrently(lambda image: shared.prepare_image_context(*image), images, image_concurrency)
+        owners = shared.group_similar_images([image_hash for _, image_hash in prepared])
+        distinct = list(dict.fromkeys(owners))
+        for _ in range(len(owners) - len(distinct)):
+            instrumentation.record_cache("analyze_image_context", True)
+        descriptions = map_concurrently(lambda i: shared.analyze_prepared_image_context(*prepared[i]), distinct, image_concurrency)
+        return shared.summarize_image_contexts(descriptions)
+
+    def image_context_from_persona(persona):
+        return combined_image_context.get('description', "")
+
+    # The avatar request starts as soon as its description has streamed in, overlapping the rest of the persona
+    speculative_avatar = SpeculativeAvatar(api_key) if generate_avatar else None
+
+    def persona(feedback, image_context=None):
+        combined = "\n\n".join(feedback)
+        if not combined and not images:
+            return None
+        on_avatar_description = speculative_avatar.start if speculative_avatar else None
+        if not combine_images:
+            return shared.generate_persona_from_gemini(combined, image_context, on_avatar_description=on_avatar_description)
+        persona = shared.generate_persona_from_gemini(combined, on_avatar_description=on_avatar_description, images=images)
+        if persona:
+            # The description is reported as the image_context stage, not kept as a persona field
+            combined_image_context['description'] = (persona.pop('image_context', None) or "").strip()
+        return persona
+
+    def avatar(persona):
+        description = persona.get('visual_avatar_description') if persona else None
+        if not description:
+            speculative_avatar.discard()
+            return None
+        speculative = speculative_avatar.claim(description)
+        tracing.set_attribute("avatar.speculative_hit", speculative is not None)
+        if speculative is not None:
+            return speculative.result()
+        return shared.generate_persona_image(description, api_key)
+
+    stages = [
+        Stage('feedback', feedback),
+        Stage('overall_sentiment', overall_sentiment, requires=('feedback',)),
+        Stage('persona', persona, requires=('feedback', 'image_context') if images and not combine_images else ('feedback',)),
+    ]
+    if csv_bytes is not None:
+        stages.append(Stage('row_sentiment', row_sentiment, requires=('feedback',), progress=True))
+    if combine_images:
+        stages.append(Stage('image_context', image_context_from_persona, requires=('persona',)))
+    elif images:
+        stages.append(Stage('image_context', image_context))
+    if generate_avatar:
+        stages.append(Stage('avatar', avatar, requires=('persona',)))
+    return Pipeline(stages)
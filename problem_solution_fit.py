@@ -1,9 +1,12 @@
 import streamlit as st
-from shared import generate_problem_solution_persona, generate_persona_image, text_model, parse_gemini_json_response
+from shared import generate_problem_solution_persona, generate_persona_image, text_model, generate_structured, validated, render_html_component
 import plotly.graph_objects as go
 import pandas as pd
 import json
-from streamlit.components.v1 import html as st_html
+import tracing
+import schemas
+import templates
+import fit_scoring
 
 def generate_solution_ideas(persona_data):
     """
@@ -13,58 +16,20 @@ def generate_solution_ideas(persona_data):
     prompt = f"""
     Based on the following problem-solution persona data, generate innovative solution ideas that address the core problem.
     Focus on practical, implementable solutions that align with the persona's needs and expectations.
+    Prioritize the solutions by title and lay out an implementation timeline.
 
     Persona Data:
     {json.dumps(persona_data, indent=2)}
-
-    Generate the output as a JSON object with the following structure:
-    {{
-        "solution_ideas": [
-            {{
-                "title": "Solution name/title",
-                "description": "Brief description of the solution",
-                "key_features": ["feature1", "feature2", "feature3"],
-                "implementation_steps": ["step1", "step2", "step3"],
-                "potential_challenges": ["challenge1", "challenge2"],
-                "success_metrics": ["metric1", "metric2"]
-            }}
-        ],
-        "prioritization": {{
-            "high_priority": ["solution1", "solution2"],
-            "medium_priority": ["solution3"],
-            "low_priority": ["solution4"]
-        }},
-        "implementation_timeline": {{
-            "phase1": {{
-                "duration": "X weeks",
-                "activities": ["activity1", "activity2"]
-            }},
-            "phase2": {{
-                "duration": "Y weeks",
-                "activities": ["activity3", "activity4"]
-            }}
-        }}
-    }}
-
-    Ensure the response is ONLY a valid JSON object with no extra text or markdown outside the JSON block.
     """
 
     try:
-        response = text_model.generate_content(prompt)
-        solution_data = parse_gemini_json_response(response.text)
-        return solution_data
+        ideas = generate_structured("generate_solution_ideas", prompt, schemas.SOLUTION_IDEAS)
     except Exception as e:
         st.error(f"Error generating solution ideas: {e}")
         return None
+    return validated('solution_ideas', ideas, "solution ideas")
 
-def create_solution_card(solution):
-    """Creates a styled card for displaying a solution idea."""
-    key_features_html = ''.join([f'<li>{feature}</li>' for feature in solution['key_features']])
-    implementation_steps_html = ''.join([f'<li>{step}</li>' for step in solution['implementation_steps']])
-    potential_challenges_html = ''.join([f'<li>{challenge}</li>' for challenge in solution['potential_challenges']])
-    success_metrics_html = ''.join([f'<li>{metric}</li>' for metric in solution['success_metrics']])
-
-    html_template = r"""
+_SOLUTION_CARD = templates.Template('solution_card', r"""
     <div style="background-color: #ffffff; border-radius: 10px; padding: 20px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
         <h3 style="color: #1a73e8; margin-top: 0;">{title}</h3>
         <p style="color: #5f6368;">{description}</p>
@@ -72,90 +37,100 @@ def create_solution_card(solution):
         <div style="margin-top: 15px;">
             <h4 style="color: #202124; margin-bottom: 10px;">Key Features:</h4>
             <ul style="color: #5f6368; margin-top: 0;">
-                {key_features}
+                {key_features:raw}
             </ul>
         </div>
         
         <div style="margin-top: 15px;">
             <h4 style="color: #202124; margin-bottom: 10px;">Implementation Steps:</h4>
             <ol style="color: #5f6368; margin-top: 0;">
-                {implementation_steps}
+                {implementation_steps:raw}
             </ol>
         </div>
         
         <div style="margin-top: 15px;">
             <h4 style="color: #202124; margin-bottom: 10px;">Potential Challenges:</h4>
             <ul style="color: #5f6368; margin-top: 0;">
-                {potential_challenges}
+                {potential_challenges:raw}
             </ul>
         </div>
         
         <div style="margin-top: 15px;">
             <h4 style="color: #202124; margin-bottom: 10px;">Success Metrics:</h4>
             <ul style="color: #5f6368; margin-top: 0;">
-                {success_metrics}
+                {success_metrics:raw}
             </ul>
         </div>
     </div>
-    """
-    return html_template.format(
+    """)
+
+@templates.memoize
+def create_solution_card(solution):
+    """Creates a styled card for displaying a solution idea."""
+    return _SOLUTION_CARD.render(
         title=solution['title'],
         description=solution['description'],
-        key_features=key_features_html,
-        implementation_steps=implementation_steps_html,
-        potential_challenges=potential_challenges_html,
-        success_metrics=success_metrics_html
+        key_features=templates.list_items(solution['key_features']),
+        implementation_steps=templates.list_items(solution['implementation_steps']),
+        potential_challenges=templates.list_items(solution['potential_challenges']),
+        success_metrics=templates.list_items(solution['success_metrics'])
     )
 
-def create_timeline_card(timeline):
-    """Creates a styled card for displaying the implementation timeline."""
-    timeline_html_content = ""
-    for phase, details in timeline.items():
-        activities_html = ''.join([f'<li>{activity}</li>' for activity in details['activities']])
-        timeline_html_content += r"""
+_TIMELINE_PHASE = templates.Template('timeline_phase', r"""
         <div style="margin-top: 15px;">
             <h4 style="color: #202124; margin-bottom: 10px;">{phase_title} ({duration})</h4>
             <ul style="color: #5f6368; margin-top: 0;">
-                {activities}
+                {activities:raw}
             </ul>
         </div>
-        """.format(
-            phase_title=phase.replace('_', ' ').title(),
-            duration=details['duration'],
-            activities=activities_html
-        )
-    
-    html_template = r"""
+        """)
+
+_TIMELINE_CARD = templates.Template('timeline_card', r"""
     <div style="background-color: #ffffff; border-radius: 10px; padding: 20px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
         <h3 style="color: #1a73e8; margin-top: 0;">Implementation Timeline</h3>
-        {content}
+        {content:raw}
     </div>
+    """)
+
+@templates.memoize
+def create_timeline_card(timeline):
+    """Creates a styled card for displaying the implementation timeline."""
+    phases = _TIMELINE_PHASE.render_each(
+        {
+            'phase_title': phase.replace('_', ' ').title(),
+            'duration': details['duration'],
+            'activities': templates.list_items(details['activities']),
+        }
+        for phase, details in timeline.items()
+    )
+    return _TIMELINE_CARD.render(content=phases)
+
+def create_fit_score_chart(persona, current_solutions, ideal_solution, solution_ideas=None):
     """
-    return html_template.format(content=timeline_html_content)
+    Creates a radar chart of fit scores: the persona's current solutions (averaged), its ideal
+    solution and, once generated, each solution idea. All candidates are scored in one batch.
+    """
+    candidates = list(current_solutions) + ["; ".join(ideal_solution)]
+    idea_titles = []
+    for idea in solution_ideas or []:
+        idea_titles.append(idea['title'])
+        candidates.append(f"{idea['title']}: {idea['description']} Key features: {', '.join(idea.get('key_features', []))}")
+    scores, source = fit_scoring.score_solutions(persona, candidates)
+
+    traces = []
+    if current_solutions:
+        traces.append(('Current Solutions', scores[:len(current_solutions)].mean(axis=0)))
+    traces.append(('Ideal Solution', scores[len(current_solutions)]))
+    traces.extend(zip(idea_titles, scores[len(current_solutions) + 1:]))
 
-def create_fit_score_chart(current_solutions, ideal_solution):
-    """Creates a radar chart comparing current solutions vs ideal solution."""
-    categories = ['Ease of Use', 'Cost Efficiency', 'Time Savings', 'Reliability', 'Scalability']
-    
-    # Generate scores based on the descriptions
-    current_scores = [3, 2, 2, 3, 2]  # Example scores for current solutions
-    ideal_scores = [5, 4, 5, 5, 4]    # Example scores for ideal solution
-    
     fig = go.Figure()
-    
-    fig.add_trace(go.Scatterpolar(
-        r=current_scores,
-        theta=categories,
-        fill='toself',
-        name='Current Solutions'
-    ))
-    
-    fig.add_trace(go.Scatterpolar(
-        r=ideal_scores,
-        theta=categories,
-        fill='toself',
-        name='Ideal Solution'
-    ))
+    for name, row in traces:
+        fig.add_trace(go.Scatterpolar(
+            r=row.round(1).tolist(),
+            theta=fit_scoring.DIMENSION_LABELS,
+            fill='toself',
+            name=name
+        ))
     
     fig.update_layout(
         polar=dict(
@@ -168,7 +143,7 @@ def create_fit_score_chart(current_solutions, ideal_solution):
         margin=dict(l=20, r=20, t=20, b=20)
     )
     
-    return fig
+    return fig, source
 
 def render(api_key):
     st.header("Problem-Solution Fit 🧩")
@@ -188,7 +163,7 @@ def render(api_key):
 
     if st.button("🔍 Generate Problem-Solution Persona", use_container_width=True, key="generate_problem_persona_btn"):
         if problem_statement_input:
-            with st.spinner("Analyzing problem and generating persona..."):
+            with st.spinner("Analyzing problem and generating persona..."), tracing.span("problem_solution.generate_persona"):
                 problem_persona = generate_problem_solution_persona(problem_statement_input)
                 if problem_persona:
                     st.session_state['problem_solution_persona'] = problem_persona
@@ -196,7 +171,7 @@ def render(api_key):
                     
                     # Generate and store avatar
                     if 'visual_avatar_description' in problem_persona and problem_persona['visual_avatar_description']:
-                        with st.spinner("Generating persona avatar..."):
+                        with st.spinner("Generating persona avatar..."), tracing.span("problem_solution.generate_avatar"):
                             avatar_image = generate_persona_image(problem_persona['visual_avatar_description'], api_key)
                             if avatar_image:
                                 st.session_state['problem_solution_avatar'] = avatar_image
@@ -258,7 +233,12 @@ def render(api_key):
                     for expectation in ideal_solution:
                         st.markdown(f"- {expectation}")
                 
-                st.plotly_chart(create_fit_score_chart(current_solutions, ideal_solution), use_container_width=True)
+                solution_ideas = (st.session_state.get('solution_ideas') or {}).get('solution_ideas')
+                with st.spinner("Scoring solution fit..."):
+                    fit_chart, score_source = create_fit_score_chart(persona, current_solutions, ideal_solution, solution_ideas)
+                st.plotly_chart(fit_chart, use_container_width=True)
+                if score_source != 'model':
+                    st.caption("Scores estimated locally from the solution descriptions.")
             
             elif selected_tab_title == "Motivations & Pain Points":
                 st.markdown("### Motivations & Pain Points")
@@ -283,7 +263,7 @@ def render(api_key):
                     st.markdown(f"- {expectation}")
                 
                 if st.button("💡 Generate Solution Ideas", use_container_width=True):
-                    with st.spinner("Generating innovative solution ideas..."):
+                    with st.spinner("Generating innovative solution ideas..."), tracing.span("problem_solution.generate_solution_ideas"):
                         solution_data = generate_solution_ideas(persona)
                         if solution_data:
                             st.session_state['solution_ideas'] = solution_data
@@ -320,8 +300,8 @@ def render(api_key):
         st.markdown("### Detailed Solution Proposals")
         for solution in st.session_state['solution_ideas'].get('solution_ideas', []):
             solution_card_html = create_solution_card(solution)
-            st_html(solution_card_html, height=400, scrolling=True) # Use st_html for robust rendering
+            render_html_component('solution_card', solution_card_html, height=400, scrolling=True)
         
         # Display implementation timeline
         timeline_card_html = create_timeline_card(st.session_state['solution_ideas'].get('implementation_timeline', {}))
-        st_html(timeline_card_html, height=300, scrolling=True) 
\ No newline at end of file
+        render_html_component('timeline_card', timeline_card_html, height=300, scrolling=True) 
\ No newline at end of file
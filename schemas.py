@@ -0,0 +1,219 @@
+"""
+Output schemas for every structured generator.
+
+Each schema is declared once here in the OpenAPI subset Gemini accepts as
+`response_schema` (type, properties, required, items, enum, description,
+min_items/max_items), and passed with response_mime_type="application/json"
+through shared.generate_structured. Field guidance lives in the descriptions,
+so prompts no longer spell the structure out in prose.
+
+MESSAGING_SCHEMAS maps each Messaging Generator content type to its schema.
+"""
+STRING = {'type': 'string'}
+INTEGER = {'type': 'integer'}
+
+
+def string(description):
+    return {'type': 'string', 'description': description}
+
+
+def string_list(description, min_items=None, max_items=None):
+    schema = {'type': 'array', 'items': STRING, 'description': description}
+    if min_items is not None:
+        schema['min_items'] = min_items
+    if max_items is not None:
+        schema['max_items'] = max_items
+    return schema
+
+
+def obj(properties, required=None, description=None):
+    """Object schema; every property is required unless `required` says otherwise."""
+    schema = {'type': 'object', 'properties': properties, 'required': list(properties) if required is None else required}
+    if description:
+        schema['description'] = description
+    return schema
+
+
+def array_of(items, description=None, min_items=None, max_items=None):
+    schema = {'type': 'array', 'items': items}
+    if description:
+        schema['description'] = description
+    if min_items is not None:
+        schema['min_items'] = min_items
+    if max_items is not None:
+        schema['max_items'] = max_items
+    return schema
+
+
+# --- Sentiment ---
+SENTIMENT = obj({
+    'sentiment': {'type': 'string', 'enum': ['Positive', 'Negative', 'Neutral']},
+    'confidence': {'type': 'number', 'description': "How sure the classification is, from 0 to 1."},
+}, required=['sentiment'])
+
+# --- Personas ---
+PERSONA = obj({
+    'name': string("A creative name for the persona."),
+    'archetype': string("A concise archetype, e.g. 'The Budget-Conscious Shopper'."),
+    'motivations_summary': string("Main motivations in 1-2 sentences."),
+    'motivations_details': string_list("Motivations as bullet points.", 3, 5),
+    'pain_points_summary': string("Main pain points in 1-2 sentences."),
+    'pain_points_details': string_list("Pain points as bullet points.", 3, 5),
+    'aspirations_summary': string("Main aspirations in 1-2 sentences."),
+    'aspirations_details': string_list("Aspirations as bullet points.", 3, 5),
+    'typical_scenario': string("A short paragraph on a typical interaction with a relevant product or service."),
+    'visual_avatar_description': string("Max 10 words for generating an avatar, e.g. 'Elderly man gardening'."),
+})
+
+# A PERSONA built from images in the same call: the model describes the images first, then the persona
+PERSONA_WITH_IMAGE_CONTEXT = obj(dict(
+    {'image_context': string("The key elements, environment, mood and lifestyle the images suggest, as they inform the persona. Max 120 words.")},
+    **PERSONA['properties']
+))
+
+# Field-level edits to a PERSONA, returned by patch-mode refinement (see persona_patch.py)
+PERSONA_PATCH = obj({
+    'changes': array_of(obj({
+        'op': {'type': 'string', 'enum': ['set', 'add', 'replace', 'remove'],
+               'description': "set: replace a text field. add: append to a list (or insert before index). replace/remove: the list item at index."},
+        'field': {'type': 'string', 'enum': list(PERSONA['properties'])},
+        'index': {'type': 'integer', 'description': "0-based position in the list as given; for replace, remove and optionally add."},
+        'value': string("The new text; for set, add and replace."),
+    }, required=['op', 'field']), description="Only the edits the feedback asks for; empty if nothing needs to change."),
+})
+
+PROBLEM_SOLUTION_PERSONA = obj({
+    'name': string("A creative, memorable name."),
+    'archetype': string("A concise archetype relevant to the problem."),
+    'problem_description_from_persona_view_summary': string("The problem from the persona's perspective, 1-2 impactful sentences."),
+    'problem_description_from_persona_view_details': string("The problem from the persona's perspective, 2-4 sentences."),
+    'current_solutions_and_their_flaws_summary': string("Their current inadequate solutions, 1-2 sentences."),
+    'current_solutions_and_their_flaws_details': string_list("Ways they currently try to solve the problem and why each falls short.", 2, 3),
+    'ideal_solution_expectations_summary': string("What they expect from an ideal solution, 1-2 sentences."),
+    'ideal_solution_expectations_details': string_list("Key characteristics or outcomes of an ideal solution.", 2, 3),
+    'motivations_related_to_problem_summary': string("Core motivations for solving the problem, max 10 words."),
+    'motivations_related_to_problem_details': string_list("Core motivations tied to solving the problem.", 2, 3),
+    'pain_points_related_to_problem_summary': string("Acute pain points caused by the problem, max 10 words."),
+    'pain_points_related_to_problem_details': string_list("Acute pain points caused by the problem.", 2, 3),
+    'visual_avatar_description': string("1-2 sentences for generating an image of the persona's struggle or desire for a solution."),
+})
+
+_TIMELINE_PHASE = obj({
+    'duration': string("e.g. '4 weeks'."),
+    'activities': string_list("Activities in this phase."),
+})
+
+SOLUTION_IDEAS = obj({
+    'solution_ideas': array_of(obj({
+        'title': STRING,
+        'description': string("Brief description of the solution."),
+        'key_features': string_list("Key features.", 3),
+        'implementation_steps': string_list("Implementation steps.", 3),
+        'potential_challenges': string_list("Potential challenges.", 2),
+        'success_metrics': string_list("Success metrics.", 2),
+    }), min_items=1),
+    'prioritization': obj({
+        'high_priority': string_list("Solution titles."),
+        'medium_priority': string_list("Solution titles."),
+        'low_priority': string_list("Solution titles."),
+    }),
+    'implementation_timeline': obj(
+        {'phase1': _TIMELINE_PHASE, 'phase2': _TIMELINE_PHASE, 'phase3': _TIMELINE_PHASE},
+        required=['phase1', 'phase2']
+    ),
+})
+
+# --- Fit Scoring ---
+# Radar chart dimensions: schema key -> label
+FIT_DIMENSIONS = {
+    'ease_of_use': 'Ease of Use',
+    'cost_efficiency': 'Cost Efficiency',
+    'time_savings': 'Time Savings',
+    'reliability': 'Reliability',
+    'scalability': 'Scalability',
+}
+
+_FIT_SCORE = {'type': 'integer', 'description': "1 (very poor) to 5 (excellent) for the persona."}
+
+FIT_SCORES = obj({
+    'scores': array_of(obj(
+        dict({'candidate': {'type': 'integer', 'description': "The candidate's number."}},
+             **{key: _FIT_SCORE for key in FIT_DIMENSIONS})
+    ), min_items=1),
+})
+
+# --- Anti-Persona Engine ---
+_CARD_SUMMARY = "One or two complete sentences, max 250 characters."
+
+ANTI_PERSONA_REPORTS = obj({
+    'negative_marketing_card': obj({
+        'title': string("Negative Marketing & Sales Guidelines"),
+        'summary': string(f"Who NOT to target and why. {_CARD_SUMMARY}"),
+        'keywords_to_exclude': string_list("Keywords/phrases to exclude from advertising campaigns."),
+        'channels_to_deprioritize': string_list("Marketing channels to de-prioritize."),
+        'sales_red_flags': string_list("Lead behaviors or questions that indicate an anti-persona."),
+    }),
+    'product_brief_card': obj({
+        'title': string("Product Feature Exclusion/Refinement Brief"),
+        'summary': string(f"Product features to avoid or refine for anti-personas. {_CARD_SUMMARY}"),
+        'undesirable_features': string_list("Features undesirable for core users but appealing to anti-personas."),
+        'refinement_suggestions': string_list("Suggestions for refining existing features."),
+        'misuse_warnings': string_list("Potential misuses or unintended behaviors."),
+    }),
+    'opportunity_report_card': obj({
+        'title': string("New Market/Product Exploration Briefs"),
+        'summary': string(f"Missed opportunities and new market potential. {_CARD_SUMMARY}"),
+        'neglected_areas': array_of(obj({
+            'area_summary': string("The neglected market area."),
+            'value_score': {'type': 'integer', 'description': "Potential value from 1 to 5."},
+            'details': string_list("Value missed and exploration ideas."),
+        })),
+        'overall_exploration_ideas': string_list("General exploration ideas."),
+    }),
+    'suggested_anti_personas': array_of(obj({
+        'persona_name': string("e.g. 'The Over-Engineer'."),
+        'reason': string("Why this persona is a poor fit."),
+    })),
+})
+
+# --- Messaging Generator ---
+LANDING_PAGE = obj({
+    'Hero': obj({
+        'Headline': string("A compelling headline."),
+        'Sub-headline': string("A concise sub-headline."),
+    }),
+    'Problem': obj({
+        'Title': STRING,
+        'Paragraph_1': string("Description of the problem."),
+        'Bullet_Points': string_list("Problem bullet points.", 3, 3),
+    }),
+    'Solution': obj({
+        'Title': STRING,
+        'Paragraph_1': string("Description of the solution."),
+        'Features': string_list("Solution features.", 3, 3),
+        'Paragraph_2': string("Further explanation of the solution."),
+    }),
+    'Call to Action': obj({
+        'Button_Text': STRING,
+        'Subtext': string("Optional subtext under the button."),
+    }, required=['Button_Text']),
+})
+
+PITCH_SLIDES = obj({'headlines': string_list("Concise, compelling investor-deck slide headlines.", 5, 7)})
+
+COLD_EMAIL = obj({
+    'subject': string("A catchy subject line."),
+    'body': string("The email body; paragraphs separated by newlines."),
+})
+
+TAGLINES = obj({'taglines': string_list("Short, memorable taglines or hero section ideas.", 5, 7)})
+
+SOCIAL_POSTS = obj({'posts': string_list("Short, attention-grabbing post hooks with relevant emojis.", 3, 5)})
+
+MESSAGING_SCHEMAS = {
+    "Landing Page Copy": LANDING_PAGE,
+    "Pitch Slide Headlines": PITCH_SLIDES,
+    "Cold Email / Re-engagement Campaigns": COLD_EMAIL,
+    "Taglines / Hero Section Ideas": TAGLINES,
+    "Social Post Hooks": SOCIAL_POSTS,
+}
@@ -2,20 +2,267 @@ import streamlit as st
 import google.generativeai as genai
 import json
 import io
+import hashlib
 from PIL import Image as PIL_Image
 from PIL import ImageOps as PIL_ImageOps
 import re
 import typing
 import base64
 import requests
+import time
+import datetime
+import threading
+import contextlib
+import contextvars
+from collections import OrderedDict
+from google.generativeai import caching as genai_caching
+from google.api_core import exceptions as google_exceptions
+from config import Config
+import instrumentation
+import media
+import tracing
+import schemas
+import validators
+import persona_patch
 
 # --- Shared Gemini Model Initialization ---
 # (Assume GEMINI_API_KEY is set in trial.py before importing shared.py)
+DEFAULT_API_BASE_URL = "https://generativelanguage.googleapis.com"
+IMAGEN_MODEL = "imagen-3.0-generate-002"
+# Point this at a local stand-in (e.g. mock_server.py) to run without network or quota
+api_base_url = Config.get_config("GEMINI_API_BASE_URL", DEFAULT_API_BASE_URL).rstrip('/')
+
 text_model = genai.GenerativeModel('gemini-2.0-flash')
 vision_model = genai.GenerativeModel('gemini-2.0-flash') # Multimodal for image analysis
 generation_model = None # Will be initialized in trial.py after vertexai.init
 
+def configure_gemini(api_key, base_url=None):
+    """
+    Configures the Gemini client. When the API base URL is overridden (argument or
+    GEMINI_API_BASE_URL), requests go over REST to that host instead of Google's endpoints.
+    """
+    global api_base_url
+    if base_url:
+        api_base_url = base_url.rstrip('/')
+    if api_base_url != DEFAULT_API_BASE_URL:
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": api_base_url})
+    else:
+        genai.configure(api_key=api_key)
+
+# --- Request Rate Limits ---
+# A caller can hold every model and Imagen request it makes to a limiter (anything with acquire(),
+# e.g. batch_generator.RateLimiter): on its own thread and on workers started through
+# pipeline.bind_worker_context, which carry the caller's context along.
+_request_limiter = contextvars.ContextVar('request_limiter', default=None)
+
+@contextlib.contextmanager
+def rate_limited(limiter):
+    """Within this block, every generate_content and Imagen request first takes a token from limiter."""
+    token = _request_limiter.set(limiter)
+    try:
+        yield limiter
+    finally:
+        _request_limiter.reset(token)
+
+def _acquire_request_slot():
+    limiter = _request_limiter.get()
+    if limiter is not None:
+        limiter.acquire()
+
+def generate_content(operation, contents, model=None, stream=False, on_chunk=None, cache_hit=None, **kwargs):
+    """
+    Calls model.generate_content (text_model by default) and records latency, token and byte
+    metrics for it under `operation`. With stream=True the chunks are consumed here; on_chunk,
+    if given, is called with the accumulated text after each chunk. cache_hit, when not None,
+    records whether a prompt/context cache was reused for this call. Returns the resolved response.
+    """
+    model = model or text_model
+    if cache_hit is not None:
+        instrumentation.record_cache(operation, cache_hit)
+    request_bytes = instrumentation.estimate_request_bytes(contents)
+    _acquire_request_slot()
+    with tracing.span("gemini.generate_content", operation=operation, model=model.model_name,
+                      stream=stream, request_bytes=request_bytes) as call_span:
+        start = time.perf_counter()
+        first_token_at = None
+        try:
+            response = model.generate_content(contents, stream=stream, **kwargs)
+            if stream:
+                accumulated = ""
+                for chunk in response:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        call_span.set_attribute("time_to_first_token_ms", (first_token_at - start) * 1000)
+                    if on_chunk is not None:
+                        try:
+                            accumulated += chunk.text
+                        except ValueError:
+                            # Safety-blocked and finish-only chunks have no text parts
+                            continue
+                        on_chunk(accumulated)
+                response.resolve()
+        except Exception:
+            instrumentation.record_call(operation, time.perf_counter() - start, request_bytes=request_bytes, status="error")
+            raise
+        wall_time = time.perf_counter() - start
+        usage = getattr(response, 'usage_metadata', None)
+        prompt_tokens = getattr(usage, 'prompt_token_count', None) if usage else None
+        response_tokens = getattr(usage, 'candidates_token_count', None) if usage else None
+        cached_tokens = getattr(usage, 'cached_content_token_count', None) if usage else None
+        try:
+            response_bytes = len(response.text.encode('utf-8'))
+        except ValueError:
+            # .text raises when the candidate was blocked or empty
+            response_bytes = 0
+        call_span.set_attributes(prompt_tokens=prompt_tokens or 0, response_tokens=response_tokens or 0,
+                                 cached_tokens=cached_tokens or 0, response_bytes=response_bytes)
+        instrumentation.record_call(
+            operation,
+            wall_time,
+            time_to_first_token=(first_token_at - start) if first_token_at is not None else wall_time,
+            prompt_tokens=prompt_tokens,
+            response_tokens=response_tokens,
+            request_bytes=request_bytes,
+            response_bytes=response_bytes,
+        )
+        return response
+
+def generate_structured(operation, contents, schema, model=None, **kwargs):
+    """
+    Requests schema-constrained JSON (response_mime_type/response_schema) through generate_content
+    and returns the parsed object. Raises json.JSONDecodeError if the reply is not valid JSON
+    (e.g. truncated at the token limit); the raw text is on the exception's .doc.
+    """
+    response = generate_content(
+        operation,
+        contents,
+        model=model,
+        generation_config={"response_mime_type": "application/json", "response_schema": schema},
+        **kwargs
+    )
+    return json.loads(response.text)
+
+def validated(name, data, what):
+    """
+    Validates a generated object as the output type `name` (see validators.py) and returns the
+    normalized value, or None after an st.error naming `what` if it is unusable. Entries dropped
+    on the way are recorded on the current span rather than shown.
+    """
+    if data is None:
+        return None
+    result = validators.validate(name, data)
+    if not result.ok:
+        st.error(f"Generated {what} is not in the expected format: " + "; ".join(result.messages()))
+        return None
+    if result.issues:
+        tracing.set_attribute(f"{name}.validation_issues", result.messages())
+    return result.value
+
+# --- Persona Context Reuse ---
+# Messaging requests for one persona share the same persona description. It is attached to a model
+# once per persona version, so each request only sends its task-specific prompt. With
+# GEMINI_CONTEXT_CACHE enabled the description is uploaded as a Gemini CachedContent; otherwise,
+# or when the upload is rejected (e.g. below the minimum cacheable size), it becomes the model's
+# system instruction. A CachedContent is deleted by the server when its TTL runs out, so a model
+# built on one is rebuilt shortly before then, or as soon as a call reports it NOT_FOUND.
+CONTEXT_CACHE_MODEL = "models/gemini-2.0-flash-001" # Context caching requires an explicit model version
+PERSONA_CONTEXT_CACHE_SIZE = 32
+CONTEXT_CACHE_EXPIRY_MARGIN = 60 # Seconds before a CachedContent expires that its model stops being reused
+_persona_context_models = OrderedDict() # context hash -> (GenerativeModel, expire time or None)
+_persona_context_locks = {}
+_persona_context_lock = threading.Lock()
+
+def _context_cache_enabled():
+    return str(Config.get_config("GEMINI_CONTEXT_CACHE", "")).lower() in ("1", "true", "yes")
+
+def _build_persona_context_model(persona_context):
+    """Returns (model, expires_at): expires_at is the CachedContent's expiry as a Unix time, or None."""
+    if _context_cache_enabled():
+        ttl = int(Config.get_config("GEMINI_CONTEXT_CACHE_TTL", 3600))
+        try:
+            requested_at = time.time()
+            cached = genai_caching.CachedContent.create(
+                model=Config.get_config("GEMINI_CONTEXT_CACHE_MODEL", CONTEXT_CACHE_MODEL),
+                display_name="persona-context",
+                system_instruction=persona_context,
+                ttl=datetime.timedelta(seconds=ttl)
+            )
+            expire_time = getattr(cached, 'expire_time', None)
+            expires_at = expire_time.timestamp() if expire_time else requested_at + ttl
+            return genai.GenerativeModel.from_cached_content(cached), expires_at
+        except Exception as e:
+            tracing.set_attribute("context_cache.error", f"{type(e).__name__}: {e}")
+    return genai.GenerativeModel(text_model.model_name, system_instruction=persona_context), None
+
+def _fresh_persona_context_model(key):
+    # Called with _persona_context_lock held. A model whose CachedContent is about to expire is dropped.
+    entry = _persona_context_models.get(key)
+    if entry is None:
+        return None
+    model, expires_at = entry
+    if expires_at is not None and expires_at - CONTEXT_CACHE_EXPIRY_MARGIN <= time.time():
+        del _persona_context_models[key]
+        return None
+    _persona_context_models.move_to_end(key)
+    return model
+
+def persona_context_model(persona_context):
+    """
+    Returns (model, reused) for a persona context string. The model is built once per distinct
+    context and kept in a small LRU until its CachedContent (if any) is close to expiring; reused
+    tells whether this call hit that cache. Concurrent callers with the same context wait for a single build.
+    """
+    key = hashlib.sha256(persona_context.encode('utf-8')).hexdigest()
+    with _persona_context_lock:
+        model = _fresh_persona_context_model(key)
+        if model is not None:
+            return model, True
+        key_lock = _persona_context_locks.setdefault(key, threading.Lock())
+    with key_lock:
+        with _persona_context_lock:
+            model = _fresh_persona_context_model(key)
+            if model is not None:
+                return model, True
+        model, expires_at = _build_persona_context_model(persona_context)
+        with _persona_context_lock:
+            _persona_context_models[key] = (model, expires_at)
+            _persona_context_locks.pop(key, None)
+            while len(_persona_context_models) > PERSONA_CONTEXT_CACHE_SIZE:
+                _persona_context_models.popitem(last=False)
+    return model, False
+
+def _forget_persona_context_model(persona_context, model):
+    key = hashlib.sha256(persona_context.encode('utf-8')).hexdigest()
+    with _persona_context_lock:
+        entry = _persona_context_models.get(key)
+        # Another caller may already have replaced it with a fresh model
+        if entry is not None and entry[0] is model:
+            del _persona_context_models[key]
+
+def generate_with_persona_context(operation, persona_context, contents, schema):
+    """
+    generate_structured on the persona context model for persona_context (see persona_context_model).
+    If the server has already deleted the model's CachedContent (NOT_FOUND), the model is dropped,
+    rebuilt and the call retried once.
+    """
+    model, reused = persona_context_model(persona_context)
+    try:
+        return generate_structured(operation, contents, schema, model=model, cache_hit=reused)
+    except google_exceptions.NotFound as e:
+        tracing.set_attribute("context_cache.not_found", str(e))
+        _forget_persona_context_model(persona_context, model)
+        model, reused = persona_context_model(persona_context)
+        return generate_structured(operation, contents, schema, model=model, cache_hit=reused)
+
 # --- Shared Helper Functions ---
+def persona_fingerprint(persona_data):
+    """
+    Stable hash of a persona's content (the avatar image is ignored), used to key results
+    that belong to one version of a persona, such as generated messaging.
+    """
+    persona_content = {k: v for k, v in persona_data.items() if k != 'avatar_image'}
+    return hashlib.sha256(json.dumps(persona_content, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
 def parse_gemini_json_response(response_text):
     match = re.search(r'```json\s*(.*?)\s*```', response_text, re.DOTALL)
     if match:
@@ -28,6 +275,301 @@ def parse_gemini_json_response(response_text):
         st.error(f"Failed to parse JSON response: {e}. Raw response: {json_content}")
         raise
 
+def extract_completed_json_string(partial_text, key):
+    """
+    Returns the value of the string field `key` from a partially streamed JSON object
+    once its closing quote has arrived, or None while it is still incomplete.
+    """
+    match = re.search(r'"%s"\s*:\s*"' % re.escape(key), partial_text)
+    if not match:
+        return None
+    escaped = False
+    for i in range(match.end(), len(partial_text)):
+        char = partial_text[i]
+        if escaped:
+            escaped = False
+        elif char == '\\':
+            escaped = True
+        elif char == '"':
+            try:
+                return json.loads(partial_text[match.end() - 1:i + 1])
+            except ValueError:
+                return None
+    return None
+
+def _on_completed_field(key, callback):
+    """Builds an on_chunk hook that calls callback(value) once, as soon as string field `key` is complete."""
+    fired = False
+
+    def on_chunk(accumulated_text):
+        nonlocal fired
+        if not fired:
+            value = extract_completed_json_string(accumulated_text, key)
+            if value:
+                fired = True
+                callback(value)
+    return on_chunk
+
+def classify_sentiment(text):
+    """
+    Analyzes the sentiment of the given text using Gemini.
+    Returns (sentiment, confidence): "Positive", "Negative" or "Neutral", and the model's
+    confidence from 0 to 1 (None if it gave none).
+    """
+    prompt = f"Analyze the sentiment of the following text as 'Positive', 'Negative', or 'Neutral', with your confidence from 0 to 1.\nText: {text}"
+    try:
+        result = validators.validate('sentiment', generate_structured("analyze_sentiment", prompt, schemas.SENTIMENT))
+    except Exception as e:
+        st.error(f"Error analyzing sentiment with Gemini: {e}")
+        return "Neutral", None
+    if not result.ok:
+        return "Neutral", None
+    confidence = result.value.get('confidence')
+    return result.value['sentiment'], None if confidence is None else min(max(float(confidence), 0.0), 1.0)
+
+def analyze_sentiment(text):
+    """
+    Analyzes the sentiment of the given text using Gemini.
+    Returns: "Positive", "Negative", or "Neutral".
+    """
+    return classify_sentiment(text)[0]
+
+# --- Image Context Reuse ---
+# Uploads are downscaled before analysis, and an image whose perceptual hash is within
+# IMAGE_CONTEXT_HASH_DISTANCE bits of an earlier one (the same photo re-saved, resized or
+# re-uploaded) reuses that image's analysis instead of calling the vision model again.
+IMAGE_CONTEXT_CACHE_SIZE = 64
+DEFAULT_IMAGE_CONTEXT_HASH_DISTANCE = 4  # Out of 64 bits
+_image_contexts = OrderedDict() # dhash -> image context description
+_image_context_lock = threading.Lock()
+
+def _image_hash_distance():
+    return int(Config.get_config("IMAGE_CONTEXT_HASH_DISTANCE", DEFAULT_IMAGE_CONTEXT_HASH_DISTANCE))
+
+def _similar_image_context(image_hash):
+    max_distance = _image_hash_distance()
+    with _image_context_lock:
+        best = min(_image_contexts, key=lambda known: media.hash_distance(known, image_hash), default=None)
+        if best is None or media.hash_distance(best, image_hash) > max_distance:
+            return None
+        _image_contexts.move_to_end(best)
+        return _image_contexts[best]
+
+def _remember_image_context(image_hash, image_context):
+    with _image_context_lock:
+        _image_contexts[image_hash] = image_context
+        while len(_image_contexts) > IMAGE_CONTEXT_CACHE_SIZE:
+            _image_contexts.popitem(last=False)
+
+def _vision_part(image_bytes, mime_type):
+    """
+    Returns (part, dhash) for an uploaded image: an inline image part holding the prepared
+    (downscaled, re-encoded) image, or the upload as it is if Pillow can't read it (dhash None).
+    """
+    try:
+        prepared_bytes, prepared_type, image_hash = media.prepare_vision_image(image_bytes)
+    except Exception as e:
+        # Send the upload as it is and let the model decide
+        tracing.set_attribute("image_context.prepare_error", f"{type(e).__name__}: {e}")
+        return {"mime_type": mime_type, "data": image_bytes}, None
+    tracing.set_attribute("image_context.original_bytes", len(image_bytes))
+    tracing.set_attribute("image_context.prepared_bytes", len(prepared_bytes))
+    if len(prepared_bytes) >= len(image_bytes):
+        return {"mime_type": mime_type, "data": image_bytes}, image_hash
+    return {"mime_type": prepared_type, "data": prepared_bytes}, image_hash
+
+def prepare_image_context(image_bytes, mime_type):
+    """Returns (part, dhash) for analyze_prepared_image_context, or (None, None) for an empty upload."""
+    if not image_bytes or not mime_type:
+        return None, None
+    return _vision_part(image_bytes, mime_type)
+
+def group_similar_images(image_hashes):
+    """
+    For each dhash, the index of the first hash in the list within IMAGE_CONTEXT_HASH_DISTANCE bits
+    of it: its own index unless it nearly duplicates an earlier image. A None hash is its own group.
+    """
+    max_distance = _image_hash_distance()
+    owners = []
+    for i, image_hash in enumerate(image_hashes):
+        owner = i
+        if image_hash is not None:
+            owner = next((j for j in dict.fromkeys(owners) if image_hashes[j] is not None
+                          and media.hash_distance(image_hashes[j], image_hash) <= max_distance), i)
+        owners.append(owner)
+    return owners
+
+def analyze_image_context(image_bytes, mime_type):
+    """
+    Analyzes the context of an image using Gemini's multimodal capabilities.
+    The image is downscaled and re-encoded first (media.prepare_vision_image), and near-identical
+    images reuse an earlier result.
+    Returns a string summary of the image context relevant for persona creation.
+    """
+    return analyze_prepared_image_context(*prepare_image_context(image_bytes, mime_type))
+
+def analyze_prepared_image_context(image_part, image_hash):
+    """analyze_image_context for an image already prepared by prepare_image_context."""
+    if image_part is None:
+        return ""
+    if image_hash is not None:
+        cached = _similar_image_context(image_hash)
+        instrumentation.record_cache("analyze_image_context", cached is not None)
+        if cached is not None:
+            return cached
+
+    try:
+        prompt_parts = [
+            image_part,
+            "Describe the key elements, environment, mood, and potential lifestyle suggested by this image, specifically focusing on details that could inform a customer persona. For example, is it a busy professional, a calm home user, an outdoor adventurer? Keep it concise and relevant to user context."
+        ]
+        response = generate_content("analyze_image_context", prompt_parts, model=vision_model)
+        image_context = response.text.strip()
+    except Exception as e:
+        st.error(f"Error analyzing image context with Gemini Vision: {e}")
+        return ""
+    if image_hash is not None and image_context:
+        _remember_image_context(image_hash, image_context)
+    return image_context
+
+def summarize_image_contexts(image_contexts):
+    """
+    Merges the context descriptions of several images into one compact summary for the persona
+    prompt. Repeated descriptions (e.g. from near-identical images) count once, and a single
+    description is returned as it is.
+    """
+    unique = [c for c in dict.fromkeys((c or '').strip() for c in image_contexts) if c]
+    if len(unique) <= 1:
+        return unique[0] if unique else ""
+
+    numbered = "\n".join(f"{i}. {c}" for i, c in enumerate(unique, 1))
+    prompt = f"""
+    Combine these {len(unique)} descriptions of photos from the same customer segment into one concise
+    context summary (at most 120 words) for building a customer persona: the common environment,
+    recurring objects and habits, mood and lifestyle, and any notable variation between the photos.
+
+    Photo descriptions:
+    {numbered}
+    """
+    try:
+        response = generate_content("summarize_image_contexts", prompt)
+        return response.text.strip()
+    except Exception as e:
+        st.error(f"Error summarizing image context with Gemini: {e}")
+        return "\n".join(unique)
+
+def generate_persona_from_gemini(feedback_text_combined, image_context=None, on_avatar_description=None, images=None):
+    """
+    Generates a detailed customer persona using Gemini AI, with optional image context.
+    images, a list of (bytes, mime_type), are sent with the prompt instead: the model describes
+    them and builds the persona in the same call, and the persona gets an extra 'image_context'
+    field with that description.
+    When on_avatar_description is given the response is streamed and the callback receives
+    visual_avatar_description as soon as it is complete, before the rest of the JSON is parsed.
+    Returns a dictionary of persona details.
+    """
+    base_prompt = """
+    Based on the following customer feedback and context, generate a detailed customer persona.
+
+    Customer Feedback:
+    {feedback_text}
+
+    {image_context_str}
+    """
+
+    if images:
+        image_context_str = ("The attached images show the customer's environment or product usage. "
+                             "Describe what they suggest in image_context, and let it inform the persona.\n")
+    else:
+        image_context_str = f"Image Context: {image_context}\n" if image_context else ""
+    full_prompt = base_prompt.format(feedback_text=feedback_text_combined, image_context_str=image_context_str)
+    contents = [_vision_part(*image)[0] for image in images] + [full_prompt] if images else full_prompt
+    schema = schemas.PERSONA_WITH_IMAGE_CONTEXT if images else schemas.PERSONA
+    model = vision_model if images else None
+
+    try:
+        if on_avatar_description:
+            persona = generate_structured("generate_persona_from_gemini", contents, schema, model=model, stream=True,
+                                          on_chunk=_on_completed_field('visual_avatar_description', on_avatar_description))
+        else:
+            persona = generate_structured("generate_persona_from_gemini", contents, schema, model=model)
+    except Exception as e:
+        st.error(f"Error generating persona with Gemini: {e}")
+        return None
+    return validated('persona', persona, "persona")
+
+def _refinement_mode():
+    return str(Config.get_config("PERSONA_REFINEMENT_MODE", "patch")).lower()
+
+def _refine_persona_patch(existing_persona_data, persona_json, refinement_feedback):
+    """Asks for only the edits the feedback calls for and applies them to the existing persona."""
+    prompt = f"""
+    Edit the customer persona below according to the refinement feedback. Return only the changes
+    it asks for, as operations on the persona's fields; everything else stays as it is.
+    List indexes are 0-based positions in the lists as shown. Lists hold at most {persona_patch.MAX_LIST_ITEMS} items,
+    so replace an item rather than adding to a full list.
+
+    Existing Persona:
+    {persona_json}
+
+    Refinement Feedback:
+    {refinement_feedback}
+    """
+    response = generate_structured("refine_persona_patch", prompt, schemas.PERSONA_PATCH)
+    changes = response.get('changes', []) if isinstance(response, dict) else None
+    refined = persona_patch.apply_patch(existing_persona_data, changes)
+    tracing.set_attribute("refine_persona.changed_fields", persona_patch.changed_fields(existing_persona_data, refined))
+    return refined
+
+def refine_persona_with_gemini(existing_persona_data, refinement_feedback, on_avatar_description=None):
+    """
+    Refines an existing persona based on user feedback using Gemini.
+    By default (PERSONA_REFINEMENT_MODE=patch) the model returns only the edits, which are applied
+    locally; untouched fields, avatar_image included, carry over as they are. If the edits can't be
+    parsed or don't apply cleanly, or with PERSONA_REFINEMENT_MODE=full, the whole persona is regenerated.
+    Request failures (quota, server errors, timeouts) are reported rather than retried as a larger request.
+    on_avatar_description works as in generate_persona_from_gemini.
+    Returns an updated dictionary of persona details.
+    """
+    persona_for_prompt = {k: v for k, v in existing_persona_data.items() if k != 'avatar_image'}
+    persona_json = json.dumps(persona_for_prompt, separators=(',', ':'), ensure_ascii=False)
+
+    if _refinement_mode() != 'full':
+        try:
+            refined = _refine_persona_patch(existing_persona_data, persona_json, refinement_feedback)
+        except (persona_patch.PatchError, json.JSONDecodeError) as e:
+            # The model answered but its edits are unusable: fall back to a full refinement below
+            tracing.set_attribute("refine_persona.patch_error", f"{type(e).__name__}: {e}")
+        except Exception as e:
+            st.error(f"Error refining persona with Gemini: {e}")
+            return None
+        else:
+            avatar_description = refined.get('visual_avatar_description')
+            if on_avatar_description and avatar_description != existing_persona_data.get('visual_avatar_description'):
+                on_avatar_description(avatar_description)
+            return refined
+
+    prompt = f"""
+    Refine the customer persona below according to the refinement feedback.
+    Keep everything the feedback does not ask to change.
+
+    Existing Persona:
+    {persona_json}
+
+    Refinement Feedback:
+    {refinement_feedback}
+    """
+    try:
+        if on_avatar_description:
+            refined = generate_structured("refine_persona_with_gemini", prompt, schemas.PERSONA, stream=True,
+                                          on_chunk=_on_completed_field('visual_avatar_description', on_avatar_description))
+        else:
+            refined = generate_structured("refine_persona_with_gemini", prompt, schemas.PERSONA)
+    except Exception as e:
+        st.error(f"Error refining persona with Gemini: {e}")
+        return None
+    return validated('persona', refined, "persona")
+
 def generate_content_for_persona(persona_data, content_type):
     persona_name = persona_data.get('name', 'the user')
     persona_archetype = persona_data.get('archetype', 'a typical customer')
@@ -61,7 +603,7 @@ Generate a landing page copy with:
 Each section should be concise, impactful, and tailored to the persona's needs.
 Provide the output as a JSON object with keys: 'Hero', 'Problem', 'Solution', 'Call to Action'.
 """
-            response = text_model.generate_content(prompt)
+            response = generate_content(f"generate_content_for_persona[{content_type}]", prompt)
             content_json = parse_gemini_json_response(response.text)
             raw_text = json.dumps(content_json, indent=2)
             html_output = _create_landing_page_html(content_json)
@@ -72,7 +614,7 @@ Provide the output as a JSON object with keys: 'Hero', 'Problem', 'Solution', 'C
 Generate 5-7 concise, compelling pitch slide headlines for an investor deck. Each headline should capture a key aspect of the product/solution in a way that resonates with the persona's problems and aspirations, and hints at market opportunity.
 Provide the output as a JSON object with a single key 'headlines' whose value is a list of strings.
 """
-            response = text_model.generate_content(prompt)
+            response = generate_content(f"generate_content_for_persona[{content_type}]", prompt)
             content_json = parse_gemini_json_response(response.text)
             headlines = content_json.get('headlines', [])
             raw_text = "\n".join(headlines)
@@ -84,7 +626,7 @@ Provide the output as a JSON object with a single key 'headlines' whose value is
 Generate a short, personalized cold email (or re-engagement email) for this persona. Include a catchy subject line, a brief body that addresses a key pain point and offers a clear value proposition, and a call to action. Keep it under 100 words.
 Provide the output as a JSON object with keys: 'subject' (string) and 'body' (string).
 """
-            response = text_model.generate_content(prompt)
+            response = generate_content(f"generate_content_for_persona[{content_type}]", prompt)
             content_json = parse_gemini_json_response(response.text)
             subject = content_json.get('subject', 'No Subject')
             body = content_json.get('body', 'No body.')
@@ -97,7 +639,7 @@ Provide the output as a JSON object with keys: 'subject' (string) and 'body' (st
 Generate 5-7 short, memorable taglines or hero section ideas for a website. These should instantly communicate the core value proposition and resonate with the persona's primary motivation or aspiration.
 Provide the output as a JSON object with a single key 'taglines' whose value is a list of strings.
 """
-            response = text_model.generate_content(prompt)
+            response = generate_content(f"generate_content_for_persona[{content_type}]", prompt)
             content_json = parse_gemini_json_response(response.text)
             taglines = content_json.get('taglines', [])
             raw_text = "\n".join(taglines)
@@ -109,7 +651,7 @@ Provide the output as a JSON object with a single key 'taglines' whose value is
 Generate 3-5 engaging social media post hooks (for Twitter, LinkedIn, or Instagram). Each hook should be short, attention-grabbing, and designed to pique the persona's interest by addressing a pain point or aspiration. Include relevant emojis.
 Provide the output as a JSON object with a single key 'posts' whose value is a list of strings.
 """
-            response = text_model.generate_content(prompt)
+            response = generate_content(f"generate_content_for_persona[{content_type}]", prompt)
             content_json = parse_gemini_json_response(response.text)
             posts = content_json.get('posts', [])
             raw_text = "\n\n".join(posts)
@@ -128,42 +670,22 @@ Provide the output as a JSON object with a single key 'posts' whose value is a l
         return error_msg, f"<p style='color: red;'>{error_msg}</p>"
 
 def generate_problem_solution_persona(problem_statement):
-    import google.generativeai as genai # Import locally if needed only here
-    # Assume text_model is available from the shared scope
     problem_persona_prompt = f"""
-    As a highly skilled product strategist and customer research expert, your task is to analyze the following problem statement and then synthesize a detailed customer persona that *primarily embodies this problem*, along with potential solution-fit insights.
-
-    The persona should be returned in a strict JSON format with the following keys:
-    - 'name': A creative, memorable name for this persona.
-    - 'archetype': A concise, descriptive archetype relevant to the problem.
-    - 'problem_description_from_persona_view_summary': A 1-2 sentence concise, impactful description of the problem *from this persona's perspective*.
-    - 'problem_description_from_persona_view_details': A 2-4 sentence detailed description.
-    - 'current_solutions_and_their_flaws_summary': A 1-2 sentence concise, impactful summary of their current inadequate solutions.
-    - 'current_solutions_and_their_flaws_details': A list of 2-3 ways they currently try to solve this problem, and why those solutions are inadequate.
-    - 'ideal_solution_expectations_summary': A 1-2 sentence concise, impactful summary of their ideal solution expectations.
-    - 'ideal_solution_expectations_details': A list of 2-3 key characteristics or outcomes they would expect from an ideal solution to this problem.
-    - 'motivations_related_to_problem_summary': A single, concise, impactful phrase (max 10 words) summarizing core motivations directly tied to solving this specific problem.
-    - 'motivations_related_to_problem_details': A list of 2-3 core motivations directly tied to solving this specific problem.
-    - 'pain_points_related_to_problem_summary': A single, concise, impactful phrase (max 10 words) summarizing acute pain points specifically caused by this problem.
-    - 'pain_points_related_to_problem_details': A list of 2-3 acute pain points specifically caused by this problem.
-    - 'visual_avatar_description': A textual description (1-2 sentences) suitable for generating an image that represents this persona, reflecting their struggle or their desire for a solution.
+    As a product strategist and customer research expert, analyze the following problem statement and synthesize a customer persona that *primarily embodies this problem*, along with solution-fit insights.
 
     Problem Statement:
     {problem_statement}
-
-    Ensure the entire response is a single, valid JSON object. Do not include any introductory or concluding remarks outside the JSON.
     """
     try:
-        response = text_model.generate_content([{"text": problem_persona_prompt}])
-        persona_data = parse_gemini_json_response(response.text)
-        return persona_data
+        persona = generate_structured("generate_problem_solution_persona", [{"text": problem_persona_prompt}], schemas.PROBLEM_SOLUTION_PERSONA)
     except json.JSONDecodeError as e:
         st.error(f"Failed to parse problem-solution persona JSON. Error: {e}")
-        st.code(response.text)
+        st.code(e.doc)
         return None
     except Exception as e:
         st.error(f"Error generating problem-solution persona: {e}")
         return None
+    return validated('problem_solution_persona', persona, "problem-solution persona")
 
 def generate_persona_image(description, api_key):
     """
@@ -175,7 +697,7 @@ def generate_persona_image(description, api_key):
         # st.info(f"--- Attempting to generate image for description: '{description}' ---") # Removed debug info
 
         # Use the Imagen model endpoint via Generative Language API
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/imagen-3.0-generate-002:predict?key={api_key}"
+        api_url = f"{api_base_url}/v1beta/models/{IMAGEN_MODEL}:predict?key={api_key}"
 
         # Refine the image prompt for the desired avatar style
         image_prompt = (
@@ -196,7 +718,24 @@ def generate_persona_image(description, api_key):
         }
 
         # st.info(f"[DEBUG] Sending request to Imagen API...") # Removed debug info
-        response = requests.post(api_url, headers={'Content-Type': 'application/json'}, json=payload)
+        request_body = json.dumps(payload)
+        _acquire_request_slot()
+        with tracing.span("imagen.predict", model=IMAGEN_MODEL, request_bytes=len(request_body)) as call_span:
+            start = time.perf_counter()
+            try:
+                response = requests.post(api_url, headers={'Content-Type': 'application/json'}, data=request_body)
+            except requests.exceptions.RequestException:
+                instrumentation.record_call("generate_persona_image", time.perf_counter() - start,
+                                            request_bytes=len(request_body), status="error")
+                raise
+            call_span.set_attributes(http_status=response.status_code, response_bytes=len(response.content))
+            instrumentation.record_call(
+                "generate_persona_image",
+                time.perf_counter() - start,
+                request_bytes=len(request_body),
+                response_bytes=len(response.content),
+                status="ok" if response.status_code == 200 else f"http_{response.status_code}",
+            )
         
         # Check for HTTP errors
         if response.status_code != 200:
@@ -262,4 +801,11 @@ def display_image(
         pil_image = PIL_ImageOps.contain(pil_image, (max_width, max_height))
     st.image(pil_image)
 
+def render_html_component(component, html_output, **kwargs):
+    """st.components.v1.html, recording the size of the payload sent to the browser under `component`."""
+    payload_bytes = len(html_output.encode('utf-8'))
+    instrumentation.record_render(component, payload_bytes)
+    tracing.set_attribute(f"render.{component}.bytes", payload_bytes)
+    st.components.v1.html(html_output, **kwargs)
+
 # Add other shared functions as needed (e.g., generate_problem_solution_persona, generate_persona_image) 
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+HTML templates for the mockups and report cards.
+
+Template sources use str.format field syntax and are parsed once, when the module
+defining them is imported, into literal chunks and field slots, so rendering is a
+single join. Every value is escaped for its context on the way in, here and
+nowhere else:
+
+    {name}        HTML-escaped text (the default)
+    {name:lines}  HTML-escaped text with newlines turned into <br>
+    {name:js}     a JavaScript string literal, safe inside <script> blocks and
+                  single-quoted attributes
+    {name:raw}    trusted markup, e.g. the output of another template
+
+Literal braces (CSS, JavaScript) are written doubled, as with str.format.
+
+Styling and behaviour shared by repeated components live in Assets. Components
+render data-only markup, and page() adds each asset's <style>/<script> once per
+document, however many components use it.
+
+@memoize caches a renderer's output under a hash of its arguments, so a rerun with
+the same content gets the same string back without rebuilding it.
+"""
+import functools
+import hashlib
+import html
+import json
+import string
+import threading
+from collections import OrderedDict
+
+import instrumentation
+
+HTML_CACHE_SIZE = 128  # Rendered documents kept per memoized renderer
+
+
+def escape(value):
+    return html.escape(str(value), quote=True)
+
+
+def escape_lines(value):
+    return escape(value).replace('\n', '<br>')
+
+
+def js_string(value):
+    # json.dumps gives a valid JS string literal; the escapes keep it from closing a
+    # <script> block or a single-quoted attribute
+    return (json.dumps(str(value), ensure_ascii=False)
+            .replace('<', '\\u003c').replace('>', '\\u003e').replace('&', '\\u0026').replace("'", '\\u0027'))
+
+
+_FILTERS = {
+    '': escape,
+    'lines': escape_lines,
+    'js': js_string,
+    'raw': str,
+}
+
+_formatter = string.Formatter()
+
+
+class Template:
+    """A template source parsed into (literal, field, filter) parts."""
+    __slots__ = ('name', '_parts')
+
+    def __init__(self, name, source):
+        self.name = name
+        parts = []
+        for literal, field, spec, conversion in _formatter.parse(source):
+            if field is None:
+                parts.append((literal, None, None))
+                continue
+            if not field.isidentifier() or conversion:
+                raise ValueError(f"Template '{name}': unsupported field '{{{field}}}'")
+            if spec not in _FILTERS:
+                raise ValueError(f"Template '{name}': unknown filter '{spec}' for field '{field}'")
+            parts.append((literal, field, _FILTERS[spec]))
+        self._parts = tuple(parts)
+
+    def render(self, **values):
+        out = []
+        for literal, field, apply in self._parts:
+            out.append(literal)
+            if field is not None:
+                out.append(apply(values[field]))
+        return ''.join(out)
+
+    def render_each(self, rows):
+        """Renders the template once per dict in rows and concatenates the results."""
+        return ''.join(self.render(**row) for row in rows)
+
+
+LIST_ITEM = Template('list_item', '<li>{text}</li>')
+
+
+def list_items(values):
+    return LIST_ITEM.render_each({'text': value} for value in values)
+
+
+class Asset:
+    """A component's shared CSS and JavaScript, emitted once per document by page()."""
+    __slots__ = ('name', 'css', 'js')
+
+    def __init__(self, name, css='', js=''):
+        self.name = name
+        self.css = css
+        self.js = js
+
+
+def page(body, *assets):
+    """Wraps rendered markup with the styles and scripts of its assets, each included once."""
+    unique = list({asset.name: asset for asset in assets}.values())
+    styles = ''.join(f"<style>{asset.css}</style>" for asset in unique if asset.css)
+    scripts = ''.join(f"<script>{asset.js}</script>" for asset in unique if asset.js)
+    return styles + body + scripts
+
+
+def content_hash(*args, **kwargs):
+    payload = json.dumps([args, kwargs], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def memoize(fn):
+    """
+    Caches fn's output keyed by a content hash of its (JSON-serializable) arguments,
+    in a per-function LRU of HTML_CACHE_SIZE entries. Lookups are recorded as
+    'html.<name>' cache hits/misses.
+    """
+    cache = OrderedDict()
+    lock = threading.Lock()
+    operation = f"html.{fn.__name__.lstrip('_')}"
+
+    @functools.wraps(fn)
+    def render(*args, **kwargs):
+        key = content_hash(*args, **kwargs)
+        with lock:
+            rendered = cache.get(key)
+            if rendered is not None:
+                cache.move_to_end(key)
+        instrumentation.record_cache(operation, rendered is not None)
+        if rendered is None:
+            rendered = fn(*args, **kwargs)
+            with lock:
+                cache[key] = rendered
+                while len(cache) > HTML_CACHE_SIZE:
+                    cache.popitem(last=False)
+        return rendered
+
+    render.cache_clear = cache.clear
+    return render
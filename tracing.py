@@ -0,0 +1,234 @@
+"""
+Lightweight tracing for the persona pipeline.
+
+Spans nest through a context variable, so a span opened inside another span
+(in the same thread, or in a worker started through tracing.wrap) becomes its
+child. A trace is exported once all of its spans have ended: usually when the
+root ends. A span that outlives the root, e.g. a speculative avatar still running
+on a pipeline worker, holds the export until it ends too, and a span started after
+the export goes out on its own under the same trace id:
+
+- TRACE_EXPORTER=jsonl writes one span per line to TRACE_FILE (default traces.jsonl)
+- TRACE_EXPORTER=otlp posts OTLP/HTTP JSON to OTLP_ENDPOINT
+  (default http://127.0.0.1:4318/v1/traces; mock_server.py accepts it too)
+- TRACE_EXPORTER=jsonl,otlp does both; unset or 'none' disables export
+
+Usage:
+    with tracing.span("persona_builder.generate_persona", rows=42) as s:
+        ...
+        s.set_attribute("persona.name", persona['name'])
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+
+import requests
+
+from config import Config
+
+SERVICE_NAME = "persona-builder-app"
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'attributes', 'status',
+                 'status_message', '_trace')
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes or {})
+        self.status = "UNSET"
+        self.status_message = ""
+        # Spans of one trace share a buffer, flushed when its last open span ends
+        self._trace = parent._trace if parent else _TraceBuffer()
+        with self._trace.lock:
+            self._trace.open += 1
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error):
+        self.status = "ERROR"
+        self.status_message = f"{type(error).__name__}: {error}"
+
+    @property
+    def duration_ms(self):
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'duration_ms': self.duration_ms,
+            'attributes': self.attributes,
+            'status': self.status,
+            'status_message': self.status_message,
+        }
+
+
+class _TraceBuffer:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+        self.open = 0
+
+
+class span:
+    """Context manager that opens a child of the current span (or a new root)."""
+
+    def __init__(self, name, **attributes):
+        self._name = name
+        self._attributes = attributes
+        self._span = None
+        self._token = None
+
+    def __enter__(self):
+        self._span = Span(self._name, _current_span.get(), self._attributes)
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        current = self._span
+        current.end_ns = time.time_ns()
+        # Streamlit's rerun/stop signals derive from BaseException and are not failures
+        if exc is not None and isinstance(exc, Exception):
+            current.record_error(exc)
+        elif current.status == "UNSET":
+            current.status = "OK"
+        _current_span.reset(self._token)
+        trace = current._trace
+        with trace.lock:
+            trace.spans.append(current)
+            trace.open -= 1
+            finished = None
+            if trace.open == 0:
+                finished, trace.spans = trace.spans, []
+        if finished:
+            export(finished)
+        return False
+
+
+def current_span():
+    return _current_span.get()
+
+
+def set_attribute(key, value):
+    """Sets an attribute on the current span, if there is one."""
+    active = _current_span.get()
+    if active is not None:
+        active.set_attribute(key, value)
+
+
+def wrap(fn):
+    """Binds fn to the caller's tracing context so spans opened in a worker thread nest correctly."""
+    context = contextvars.copy_context()
+
+    def run_in_context(*args, **kwargs):
+        # A Context can only be entered by one thread at a time, so every call gets its own copy
+        return context.copy().run(fn, *args, **kwargs)
+    return run_in_context
+
+
+# --- Exporters ---
+class JSONLExporter:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans):
+        lines = "".join(json.dumps(s.to_dict(), default=str) + "\n" for s in spans)
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class OTLPHTTPExporter:
+    """Posts spans as OTLP/HTTP JSON. Export happens on a daemon thread so the page never waits on it."""
+
+    def __init__(self, endpoint, timeout=2.0):
+        self.endpoint = endpoint
+        self.timeout = timeout
+
+    def _payload(self, spans):
+        return {'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+            'scopeSpans': [{
+                'scope': {'name': 'tracing'},
+                'spans': [{
+                    'traceId': s.trace_id,
+                    'spanId': s.span_id,
+                    'parentSpanId': s.parent_id or '',
+                    'name': s.name,
+                    'kind': 1,  # SPAN_KIND_INTERNAL
+                    'startTimeUnixNano': str(s.start_ns),
+                    'endTimeUnixNano': str(s.end_ns),
+                    'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in s.attributes.items()],
+                    'status': {'code': {'UNSET': 0, 'OK': 1, 'ERROR': 2}[s.status], 'message': s.status_message},
+                } for s in spans],
+            }],
+        }]}
+
+    def _post(self, payload):
+        try:
+            requests.post(self.endpoint, json=payload, timeout=self.timeout)
+        except requests.exceptions.RequestException:
+            pass  # Tracing must never break the app
+
+    def export(self, spans):
+        threading.Thread(target=self._post, args=(self._payload(spans),), daemon=True).start()
+
+
+_exporters = None
+_exporters_lock = threading.Lock()
+
+
+def configure(exporters):
+    """Replaces the active exporters (objects with an export(spans) method)."""
+    global _exporters
+    with _exporters_lock:
+        _exporters = list(exporters)
+
+
+def _exporters_from_config():
+    names = [n.strip() for n in (Config.get_config('TRACE_EXPORTER') or '').split(',') if n.strip()]
+    exporters = []
+    if 'jsonl' in names:
+        exporters.append(JSONLExporter(Config.get_config('TRACE_FILE', 'traces.jsonl')))
+    if 'otlp' in names:
+        exporters.append(OTLPHTTPExporter(Config.get_config('OTLP_ENDPOINT', 'http://127.0.0.1:4318/v1/traces')))
+    return exporters
+
+
+def export(spans):
+    global _exporters
+    if _exporters is None:
+        with _exporters_lock:
+            if _exporters is None:
+                _exporters = _exporters_from_config()
+    for exporter in _exporters:
+        exporter.export(spans)
@@ -8,15 +8,24 @@ import base64 # For encoding/decoding images
 import requests # For direct API calls (e.g., Imagen)
 import pandas as pd # For CSV handling
 import time # For showing temporary messages
+import hashlib # For keying cached analysis results by input
+import html # For escaping feedback text shown as HTML
+from collections import deque
 import re # For regex to parse JSON from markdown
 from google.cloud import storage
 from google.cloud import aiplatform
-from shared import text_model, generate_content_for_persona, parse_gemini_json_response, generate_problem_solution_persona, generate_persona_image, display_image, vision_model
+from shared import text_model, generate_content_for_persona, parse_gemini_json_response, generate_problem_solution_persona, generate_persona_image, display_image, vision_model, analyze_sentiment, analyze_image_context, generate_persona_from_gemini, refine_persona_with_gemini
 import messaging_generator
 import problem_solution_fit
 import anti_persona_engine
+import feedback_store
+import feedback_viewer
 import copy # copy is used in this file for persona export
 import shared
+import instrumentation
+import tracing
+import pipeline
+import persona_history
 
 # --- Streamlit UI Configuration ---
 st.set_page_config(
@@ -48,11 +57,18 @@ try:
     GEMINI_API_KEY = st.secrets["GEMINI_API_KEY"]
     if not GEMINI_API_KEY:
         raise KeyError("GEMINI_API_key environment variable not set.")
-    genai.configure(api_key=GEMINI_API_KEY)
+    shared.configure_gemini(GEMINI_API_KEY)
 except KeyError as e:
     st.error(f"{e} Please set it before running the app. Example: export GEMINI_API_KEY='YOUR_API_KEY'")
     st.stop()
 
+# Expose call metrics for scraping when METRICS_PORT is set (no-op otherwise)
+instrumentation.start_metrics_server()
+
+MAX_IMAGE_PREVIEWS = 6 # Context image thumbnails shown under the uploader
+LATEST_FEEDBACK_ENTRIES = 8 # Most recently classified CSV entries shown while sentiment analysis runs
+SENTIMENT_COLORS = {'Positive': 'green', 'Neutral': 'orange', 'Negative': 'red'}
+
 # --- Session State Initialization ---
 def init_session():
     defaults = {
@@ -60,10 +76,12 @@ def init_session():
         'current_persona_chat_model': None,
         'current_persona_details': None,
         'generated_personas': [],
+        'persona_histories': [],
         'selected_persona_index': -1,
-        'uploaded_image_bytes': None,
-        'uploaded_image_type': None,
-        'processed_feedback_data': [],
+        'uploaded_images': [],
+        'feedback_stores': {}, # Upload digest -> feedback_store.FeedbackStore of classified CSV entries
+        'persona_build_results': {},
+        'messaging_outputs': {},
         'generated_avatar_base64': None,
         'persona_generation_prompt_history': {},
         'active_main_tab_index': 0
@@ -87,114 +105,11 @@ tab_names = ["Persona Builder", "Messaging Generator", "Problem-Solution Fit", "
 selected_tab = st.radio("Main Tabs", tab_names, index=st.session_state.active_main_tab_index, horizontal=True, label_visibility="hidden")
 st.session_state.active_main_tab_index = tab_names.index(selected_tab)
 
-# --- Helper Functions ---
-def analyze_sentiment(text):
-    """
-    Analyzes the sentiment of the given text using Gemini.
-    Returns: "Positive", "Negative", or "Neutral".
-    """
-    prompt = f"Analyze the sentiment of the following text and respond with only 'Positive', 'Negative', or 'Neutral'.\nText: {text}"
-    try:
-        response = text_model.generate_content(prompt)
-        sentiment = response.text.strip().capitalize()
-        if sentiment not in ["Positive", "Negative", "Neutral"]:
-            return "Neutral"
-        return sentiment
-    except Exception as e:
-        st.error(f"Error analyzing sentiment with Gemini: {e}")
-        return "Neutral"
-
-def analyze_image_context(image_bytes, mime_type):
-    """
-    Analyzes the context of an image using Gemini's multimodal capabilities.
-    Returns a string summary of the image context relevant for persona creation.
-    """
-    if not image_bytes or not mime_type:
-        return ""
-
-    try:
-        image_part = {
-            "mime_type": mime_type,
-            "data": image_bytes
-        }
-        prompt_parts = [
-            image_part,
-            "Describe the key elements, environment, mood, and potential lifestyle suggested by this image, specifically focusing on details that could inform a customer persona. For example, is it a busy professional, a calm home user, an outdoor adventurer? Keep it concise and relevant to user context."
-        ]
-        response = vision_model.generate_content(prompt_parts)
-        return response.text.strip()
-    except Exception as e:
-        st.error(f"Error analyzing image context with Gemini Vision: {e}")
-        return ""
-
-def generate_persona_from_gemini(feedback_text_combined, image_context=None):
-    """
-    Generates a detailed customer persona using Gemini AI, with optional image context.
-    Returns a dictionary of persona details.
-    """
-    base_prompt = """
-    Based on the following customer feedback and context, generate a detailed customer persona in JSON format.
-    The persona should include:
-    - `name`: A creative name for the persona.
-    - `archetype`: A concise archetype (e.g., 'The Budget-Conscious Shopper', 'The Tech Enthusiast').
-    - `motivations_summary`: A concise summary of their main motivations (1-2 sentences).
-    - `motivations_details`: A list of 3-5 bullet points detailing their motivations.
-    - `pain_points_summary`: A concise summary of their main pain points (1-2 sentences).
-    - `pain_points_details`: A list of 3-5 bullet points detailing their pain points.
-    - `aspirations_summary`: A concise summary of their main aspirations (1-2 sentences).
-    - `aspirations_details`: A list of 3-5 bullet points detailing their aspirations.
-    - `typical_scenario`: A short paragraph describing a typical scenario where this persona interacts with a product/service relevant to their needs.
-    - `visual_avatar_description`: A short, descriptive phrase (max 10 words) for generating a visual avatar (e.g., 'A professional woman coding on a laptop', 'Elderly man gardening').
-
-    Customer Feedback:
-    {feedback_text}
-
-    {image_context_str}
-
-    Ensure the response is ONLY a JSON object.
-    """
-
-    image_context_str = f"Image Context: {image_context}\n" if image_context else ""
-    full_prompt = base_prompt.format(feedback_text=feedback_text_combined, image_context_str=image_context_str)
-
-    try:
-        response = text_model.generate_content(full_prompt)
-        persona_data = parse_gemini_json_response(response.text)
-        return persona_data
-    except Exception as e:
-        st.error(f"Error generating persona with Gemini: {e}")
-        return None
-
-def refine_persona_with_gemini(existing_persona_data, refinement_feedback):
-    """
-    Refines an existing persona based on user feedback using Gemini.
-    Returns an updated dictionary of persona details.
-    """
-    persona_for_prompt = {k: v for k, v in existing_persona_data.items() if k != 'avatar_image'}
-
-    prompt = f"""
-    You are an AI assistant tasked with refining customer personas.
-    Given the existing persona details below (in JSON format) and new refinement feedback,
-    update the persona. Ensure the output is ONLY the updated JSON object, adhering to the original structure.
-    Do not add any additional text or markdown outside the JSON.
-
-    Existing Persona:
-    {json.dumps(persona_for_prompt, indent=2)}
-
-    Refinement Feedback:
-    {refinement_feedback}
-
-    Updated Persona:
-    """
-    try:
-        response = text_model.generate_content(prompt)
-        refined_persona = parse_gemini_json_response(response.text)
-        return refined_persona
-    except Exception as e:
-        st.error(f"Error refining persona with Gemini: {e}")
-        return None
-
 # The following functions are moved to shared.py:
+# def analyze_sentiment(...)
+# def analyze_image_context(...)
+# def generate_persona_from_gemini(...)
+# def refine_persona_with_gemini(...)
 # def generate_persona_image(...)
 # def display_image(...)
 # def generate_content_for_persona(...)
@@ -204,302 +119,414 @@ def refine_persona_with_gemini(existing_persona_data, refinement_feedback):
 
 # --- Conditional Rendering by Tab ---
 if selected_tab == "Persona Builder":
-    st.header("Build Customer Personas from Feedback ✨")
-    st.markdown("""
-    <div style='color: #5F6368; font-size: 0.95em; margin-bottom: 1em;'>
-        Synthesize detailed customer personas by providing raw feedback, survey responses, or even a contextual image.
-    </div>
-    """, unsafe_allow_html=True)
-
-    feedback_option = st.radio(
-        "Choose feedback input method:",
-        ("Paste Text", "Upload CSV"),
-        key="feedback_input_option_tab1",
-        horizontal=True
-    )
-
-    feedback_text_combined = ""
-    st.session_state.processed_feedback_data = []
-
-    if feedback_option == "Paste Text":
-        feedback_text_area = st.text_area(
-            "Paste raw customer feedback, survey responses, or interview snippets here:",
-            height=180,
-            placeholder="e.g., 'The app is too complicated, I just want a simple way to track expenses. The onboarding was overwhelming.' or 'Love the new design, very intuitive and fast!'",
-            key="feedback_paste_area"
+    with tracing.span("page.persona_builder"):
+        st.header("Build Customer Personas from Feedback ✨")
+        st.markdown("""
+        <div style='color: #5F6368; font-size: 0.95em; margin-bottom: 1em;'>
+            Synthesize detailed customer personas by providing raw feedback, survey responses, or even contextual images.
+        </div>
+        """, unsafe_allow_html=True)
+
+        feedback_option = st.radio(
+            "Choose feedback input method:",
+            ("Paste Text", "Upload CSV"),
+            key="feedback_input_option_tab1",
+            horizontal=True
         )
-        if feedback_text_area:
-            feedback_text_combined = feedback_text_area
-            sentiment = analyze_sentiment(feedback_text_area)
-            st.session_state.processed_feedback_data.append({'text': feedback_text_area, 'sentiment': sentiment})
-            st.markdown(f"**Overall Feedback Sentiment:** <span style='font-weight:bold; color:{'green' if sentiment=='Positive' else ('red' if sentiment=='Negative' else 'orange')};'>{sentiment}</span>", unsafe_allow_html=True)
-            st.markdown("---")
 
-    elif feedback_option == "Upload CSV":
-        uploaded_csv = st.file_uploader(
-            "Upload a CSV file with customer feedback (ensure one column is named 'feedback'):",
-            type=["csv"],
-            key="feedback_csv_uploader"
-        )
-        if uploaded_csv is not None:
-            try:
-                df = pd.read_csv(uploaded_csv)
-                if 'feedback' in df.columns:
-                    feedback_entries = df['feedback'].dropna().astype(str).tolist()
-                    if feedback_entries:
-                        st.info(f"Processing {len(feedback_entries)} feedback entries from CSV... (Sentiment analysis may take time)")
-
-                        all_feedback_for_sentiment = []
-                        for i, entry in enumerate(feedback_entries):
-                            current_sentiment = analyze_sentiment(entry)
-                            st.session_state.processed_feedback_data.append({'text': entry, 'sentiment': current_sentiment})
-                            all_feedback_for_sentiment.append(f"Feedback {i+1} (Sentiment: {current_sentiment}): {entry}")
-
-                        feedback_text_combined = "\n\n".join([item['text'] for item in st.session_state.processed_feedback_data])
-
-                        if feedback_text_combined:
-                            overall_sentiment = analyze_sentiment(feedback_text_combined)
-                            st.markdown(f"**Overall Feedback Sentiment:** <span style='font-weight:bold; color:{'green' if overall_sentiment=='Positive' else ('red' if overall_sentiment=='Negative' else 'orange')};'>{overall_sentiment}</span>", unsafe_allow_html=True)
-
-                        with st.expander("View Individual Feedback Entries & Sentiments ⬇️"):
-                            for i, entry_data in enumerate(st.session_state.processed_feedback_data):
-                                color = 'green' if entry_data['sentiment'] == 'Positive' else ('red' if entry_data['sentiment'] == 'Negative' else 'orange')
-                                st.markdown(f"**Entry {i+1}** (Sentiment: <span style='color:{color}'>{entry_data['sentiment']}</span>): {entry_data['text']}", unsafe_allow_html=True)
-                                st.markdown("---")
-                    else:
-                        st.warning("No valid feedback entries found in the 'feedback' column of the CSV.")
-                else:
-                    st.error("CSV must contain a column named 'feedback'.")
-            except Exception as e:
-                st.error(f"Error reading CSV: {e}")
+        feedback_text_area = None
+        uploaded_csv = None
+        if feedback_option == "Paste Text":
+            feedback_text_area = st.text_area(
+                "Paste raw customer feedback, survey responses, or interview snippets here:",
+                height=180,
+                placeholder="e.g., 'The app is too complicated, I just want a simple way to track expenses. The onboarding was overwhelming.' or 'Love the new design, very intuitive and fast!'",
+                key="feedback_paste_area"
+            )
+        elif feedback_option == "Upload CSV":
+            uploaded_csv = st.file_uploader(
+                "Upload a CSV file with customer feedback (ensure one column is named 'feedback'):",
+                type=["csv"],
+                key="feedback_csv_uploader"
+            )
         st.markdown("---")
 
-    uploaded_image = st.file_uploader(
-        "Optional: Upload an image representing the customer's environment or product usage (e.g., a photo of their workspace, or them using a similar product):",
-        type=["jpg", "jpeg", "png"],
-        key="context_image_uploader"
-    )
-
-    image_context_description = ""
-    if uploaded_image is not None:
-        st.session_state.uploaded_image_bytes = uploaded_image.read()
-        st.session_state.uploaded_image_type = uploaded_image.type
-        st.image(uploaded_image, caption="Uploaded Context Image", width=150)
-        with st.spinner("Analyzing image for context..."):
-            image_context_description = analyze_image_context(st.session_state.uploaded_image_bytes, st.session_state.uploaded_image_type)
+        uploaded_images = st.file_uploader(
+            "Optional: Upload images representing the customer's environment or product usage (e.g., photos of their workspace, or of them using a similar product):",
+            type=["jpg", "jpeg", "png"],
+            accept_multiple_files=True,
+            key="context_image_uploader"
+        )
+        st.session_state.uploaded_images = [(image.getvalue(), image.type) for image in uploaded_images or []]
+        if uploaded_images:
+            # Previews are decoded on every rerun, so only the first few are shown
+            st.image(uploaded_images[:MAX_IMAGE_PREVIEWS], width=150)
+            st.caption(f"{len(uploaded_images)} context image(s) uploaded" + (f"; showing the first {MAX_IMAGE_PREVIEWS}" if len(uploaded_images) > MAX_IMAGE_PREVIEWS else ""))
+            st.markdown("---")
+
+        csv_bytes = uploaded_csv.getvalue() if uploaded_csv is not None else None
+        # Analysis results are kept per input, so reruns render them without calling the model again
+        build_input_key = hashlib.sha256(
+            b"\0".join([(feedback_text_area or '').encode('utf-8'), csv_bytes or b''] + [data for data, _ in st.session_state.uploaded_images])
+        ).hexdigest()
+        build_results = st.session_state.persona_build_results
+        if build_results.get('input_key') != build_input_key:
+            build_results = {}
+        # Classified CSV entries are kept per upload, whatever else changes in the inputs
+        csv_feedback = st.session_state.feedback_stores.get(feedback_store.upload_digest(csv_bytes)) if csv_bytes is not None else None
+
+        def render_overall_sentiment(sentiment):
+            st.markdown(f"**Overall Feedback Sentiment:** <span style='font-weight:bold; color:{'green' if sentiment=='Positive' else ('red' if sentiment=='Negative' else 'orange')};'>{sentiment}</span>", unsafe_allow_html=True)
+
+        def sentiment_counts_html(counts):
+            return " · ".join(f"<span style='color:{color}; font-weight:bold;'>{sentiment}: {counts.get(sentiment, 0)}</span>" for sentiment, color in SENTIMENT_COLORS.items())
+
+        def start_sentiment_progress(total):
+            """Placeholders that per-entry sentiment results stream into; returns update(progress) for row_sentiment reports."""
+            progress_bar = st.progress(0.0, text=f"Classified 0 of {total} feedback entries")
+            counts_placeholder = st.empty()
+            latest_placeholder = st.empty()
+            latest = deque(maxlen=LATEST_FEEDBACK_ENTRIES)
+
+            def update(progress):
+                latest.extend(progress['entries'])
+                progress_bar.progress(progress['done'] / progress['total'], text=f"Classified {progress['done']} of {progress['total']} feedback entries")
+                counts_placeholder.markdown(sentiment_counts_html(progress['counts']), unsafe_allow_html=True)
+                latest_placeholder.markdown("<br>".join(
+                    f"<span style='color:{SENTIMENT_COLORS.get(entry['sentiment'], 'orange')}'>●</span> {html.escape(entry['text'][:160])}"
+                    for entry in reversed(latest)
+                ), unsafe_allow_html=True)
+            return update
+
+        def render_feedback_entries(feedback):
+            st.markdown(f"**{len(feedback)} feedback entries:** " + sentiment_counts_html(feedback.counts()), unsafe_allow_html=True)
+            if st.toggle("View Individual Feedback Entries & Sentiments", key="show_feedback_entries"):
+                feedback_viewer.render(feedback.frame)
+
+        def render_image_context(image_context_description):
             if image_context_description:
-                st.success("Image context analyzed.")
                 with st.expander("View Image Context Analysis ⬇️"):
                     st.write(image_context_description)
             else:
-                st.warning("Could not extract meaningful context from the image.")
-        st.markdown("---")
-    else:
-        st.session_state.uploaded_image_bytes = None
-        st.session_state.uploaded_image_type = None
-
-    st.subheader("Generate New Persona 🤖")
-    if st.button("✨ Synthesize New Persona", use_container_width=True, key="generate_persona_btn"):
-        if not feedback_text_combined and not st.session_state.uploaded_image_bytes:
-            st.warning("Please provide either text feedback (paste or CSV) or an image (or both) to generate a persona.")
-        else:
-            with st.spinner("Generating persona with Gemini AI... This might take a moment."):
-                persona = generate_persona_from_gemini(
-                    feedback_text_combined,
-                    image_context_description
-                )
-
-            if persona:
-                st.session_state.generated_personas.append(persona)
-                st.session_state.selected_persona_index = len(st.session_state.generated_personas) - 1
-                st.success("Persona generated successfully!")
-                if 'visual_avatar_description' in persona and persona['visual_avatar_description']:
-                    with st.spinner("Generating persona avatar..."):
-                        avatar_image = generate_persona_image(persona['visual_avatar_description'], GEMINI_API_KEY)
-                        if avatar_image:
-                            st.session_state.generated_avatar_image = avatar_image
-                            st.session_state.generated_personas[st.session_state.selected_persona_index]['avatar_image'] = avatar_image
-                st.rerun()
+                st.warning("Could not extract meaningful context from the images.")
+
+        if build_results.get('overall_sentiment'):
+            render_overall_sentiment(build_results['overall_sentiment'])
+        if csv_feedback is not None and len(csv_feedback):
+            render_feedback_entries(csv_feedback)
+        if st.session_state.uploaded_images and 'image_context' in build_results:
+            render_image_context(build_results['image_context'])
+
+        st.subheader("Generate New Persona 🤖")
+        if st.button("✨ Synthesize New Persona", use_container_width=True, key="generate_persona_btn"):
+            if not feedback_text_area and csv_bytes is None and not st.session_state.uploaded_images:
+                st.warning("Please provide either text feedback (paste or CSV) or images (or both) to generate a persona.")
             else:
-                st.error("Failed to generate persona. Please check input and API keys.")
+                build_pipeline = pipeline.build_persona_pipeline(
+                    feedback_text=feedback_text_area,
+                    csv_bytes=csv_bytes,
+                    images=st.session_state.uploaded_images,
+                    api_key=GEMINI_API_KEY,
+                    known_feedback=st.session_state.feedback_stores
+                )
+                stage_labels = {
+                    'feedback': "Reading feedback",
+                    'row_sentiment': "Analyzing sentiment per entry",
+                    'overall_sentiment': "Analyzing overall sentiment",
+                    'image_context': "Analyzing images for context",
+                    'persona': "Generating persona with Gemini AI",
+                    'avatar': "Generating persona avatar",
+                }
+                build_results = {'input_key': build_input_key}
+                persona = None
+                # Stages run concurrently; each result is rendered as soon as its stage finishes
+                with st.status("Building persona...", expanded=True) as build_status, tracing.span("persona_builder.build_pipeline", stages=len(build_pipeline.stages)):
+                    stage_placeholders = {name: st.empty() for name in build_pipeline.stages}
+                    for name, placeholder in stage_placeholders.items():
+                        placeholder.markdown(f"⏳ {stage_labels.get(name, name)}...")
+                    update_sentiment_progress = None
+                    for result in build_pipeline.run(progress=True):
+                        label = stage_labels.get(result.name, result.name)
+                        placeholder = stage_placeholders[result.name]
+                        if result.status == 'progress':
+                            if result.name == 'row_sentiment' and update_sentiment_progress:
+                                update_sentiment_progress(result.value)
+                            continue
+                        if result.status == 'error':
+                            placeholder.markdown(f"❌ {label} failed")
+                            st.error(f"Error reading CSV: {result.error}" if result.name == 'feedback' else f"{label} failed: {result.error}")
+                            continue
+                        if result.status == 'skipped':
+                            placeholder.markdown(f"⏭️ {label} skipped")
+                            continue
+                        placeholder.markdown(f"✅ {label} ({result.duration:.1f}s)")
+                        if result.name == 'feedback':
+                            if csv_bytes is not None:
+                                if result.value:
+                                    update_sentiment_progress = start_sentiment_progress(len(result.value))
+                                else:
+                                    st.warning("No valid feedback entries found in the 'feedback' column of the CSV.")
+                        elif result.name == 'overall_sentiment':
+                            build_results['overall_sentiment'] = result.value
+                            if result.value:
+                                render_overall_sentiment(result.value)
+                        elif result.name == 'row_sentiment':
+                            feedback_store.remember(st.session_state.feedback_stores, result.value)
+                        elif result.name == 'image_context':
+                            build_results['image_context'] = result.value
+                            if result.value:
+                                st.success("Image context analyzed.")
+                        elif result.name == 'persona':
+                            persona = result.value
+                            if persona:
+                                st.session_state.generated_personas.append(persona)
+                                st.session_state.selected_persona_index = len(st.session_state.generated_personas) - 1
+                                st.success(f"Persona generated: {persona.get('name', 'N/A')}")
+                        elif result.name == 'avatar' and result.value and persona:
+                            st.session_state.generated_avatar_image = result.value
+                            persona['avatar_image'] = result.value
+                    build_status.update(label="Persona build finished", state="complete" if persona else "error")
+
+                st.session_state.persona_build_results = build_results
+                if persona:
+                    st.rerun()
+                else:
+                    st.error("Failed to generate persona. Please check input and API keys.")
 
-    if st.session_state.generated_personas:
-        st.subheader("Your Generated Personas 🧑‍💻")
-        persona_names = [p.get('name', f"Persona {i+1}") for i, p in enumerate(st.session_state.generated_personas)]
+        if st.session_state.generated_personas:
+            st.session_state.persona_histories = persona_history.sync(st.session_state.persona_histories, st.session_state.generated_personas)
+            st.subheader("Your Generated Personas 🧑‍💻")
+            persona_names = [p.get('name', f"Persona {i+1}") for i, p in enumerate(st.session_state.generated_personas)]
         
-        if st.session_state.selected_persona_index >= len(st.session_state.generated_personas):
-            st.session_state.selected_persona_index = len(st.session_state.generated_personas) - 1
-        if st.session_state.selected_persona_index < 0 and len(st.session_state.generated_personas) > 0:
-            st.session_state.selected_persona_index = 0
-
-        selected_persona_name = st.selectbox(
-            "Select a persona to view/refine:",
-            persona_names,
-            index=st.session_state.selected_persona_index,
-            key="persona_selector_tab1"
-        )
-        st.session_state.selected_persona_index = persona_names.index(selected_persona_name)
-        st.session_state.current_persona_details = st.session_state.generated_personas[st.session_state.selected_persona_index]
+            if st.session_state.selected_persona_index >= len(st.session_state.generated_personas):
+                st.session_state.selected_persona_index = len(st.session_state.generated_personas) - 1
+            if st.session_state.selected_persona_index < 0 and len(st.session_state.generated_personas) > 0:
+                st.session_state.selected_persona_index = 0
+
+            selected_persona_name = st.selectbox(
+                "Select a persona to view/refine:",
+                persona_names,
+                index=st.session_state.selected_persona_index,
+                key="persona_selector_tab1"
+            )
+            st.session_state.selected_persona_index = persona_names.index(selected_persona_name)
+            st.session_state.current_persona_details = st.session_state.generated_personas[st.session_state.selected_persona_index]
 
-        if 'avatar_image' in st.session_state.current_persona_details:
-            avatar = st.session_state.current_persona_details['avatar_image']
-            if avatar is not None and type(avatar).__name__ == 'GeneratedImage':
-                st.session_state.current_persona_details['avatar_image'] = None
-                st.session_state.generated_personas[st.session_state.selected_persona_index]['avatar_image'] = None
+            if 'avatar_image' in st.session_state.current_persona_details:
+                avatar = st.session_state.current_persona_details['avatar_image']
+                if avatar is not None and type(avatar).__name__ == 'GeneratedImage':
+                    st.session_state.current_persona_details['avatar_image'] = None
+                    st.session_state.generated_personas[st.session_state.selected_persona_index]['avatar_image'] = None
 
-        current_persona = st.session_state.current_persona_details
-        st.markdown("---")
-        st.subheader(f"Details for: {current_persona.get('name', 'N/A')} ({current_persona.get('archetype', 'N/A')})")
-
-        col1, col2 = st.columns([1, 2])
-        with col1:
-            if current_persona.get('avatar_image'):
-                display_image(current_persona['avatar_image'])
-                if st.button("🔄 Regenerate Avatar", key="regenerate_avatar_btn_tab1", use_container_width=True):
-                    with st.spinner("Regenerating persona avatar..."):
-                        if 'visual_avatar_description' in current_persona and current_persona['visual_avatar_description']:
-                            avatar_image = generate_persona_image(current_persona['visual_avatar_description'], GEMINI_API_KEY)
-                            if avatar_image:
-                                st.session_state.generated_avatar_image = avatar_image
-                                st.session_state.generated_personas[st.session_state.selected_persona_index]['avatar_image'] = avatar_image
-                                st.success("Avatar regenerated!")
-                                st.rerun()
+            current_persona = st.session_state.current_persona_details
+            st.markdown("---")
+            st.subheader(f"Details for: {current_persona.get('name', 'N/A')} ({current_persona.get('archetype', 'N/A')})")
+
+            col1, col2 = st.columns([1, 2])
+            with col1:
+                if current_persona.get('avatar_image'):
+                    display_image(current_persona['avatar_image'])
+                    if st.button("🔄 Regenerate Avatar", key="regenerate_avatar_btn_tab1", use_container_width=True):
+                        with st.spinner("Regenerating persona avatar..."):
+                            if 'visual_avatar_description' in current_persona and current_persona['visual_avatar_description']:
+                                avatar_image = generate_persona_image(current_persona['visual_avatar_description'], GEMINI_API_KEY)
+                                if avatar_image:
+                                    st.session_state.generated_avatar_image = avatar_image
+                                    st.session_state.generated_personas[st.session_state.selected_persona_index]['avatar_image'] = avatar_image
+                                    st.success("Avatar regenerated!")
+                                    st.rerun()
+                                else:
+                                    st.error("Failed to regenerate avatar.")
                             else:
-                                st.error("Failed to regenerate avatar.")
-                        else:
-                            st.warning("No visual avatar description available for this persona.")
-            else:
-                st.info("No avatar generated yet.")
-                if st.button("✨ Generate Avatar Now", key="generate_avatar_now_btn_tab1", use_container_width=True):
-                    with st.spinner("Generating persona avatar..."):
-                        if 'visual_avatar_description' in current_persona and current_persona['visual_avatar_description']:
-                            avatar_image = generate_persona_image(current_persona['visual_avatar_description'], GEMINI_API_KEY)
-                            if avatar_image:
-                                st.session_state.generated_avatar_image = avatar_image
-                                st.session_state.generated_personas[st.session_state.selected_persona_index]['avatar_image'] = avatar_image
-                                st.success("Avatar generated!")
-                                st.rerun()
+                                st.warning("No visual avatar description available for this persona.")
+                else:
+                    st.info("No avatar generated yet.")
+                    if st.button("✨ Generate Avatar Now", key="generate_avatar_now_btn_tab1", use_container_width=True):
+                        with st.spinner("Generating persona avatar..."):
+                            if 'visual_avatar_description' in current_persona and current_persona['visual_avatar_description']:
+                                avatar_image = generate_persona_image(current_persona['visual_avatar_description'], GEMINI_API_KEY)
+                                if avatar_image:
+                                    st.session_state.generated_avatar_image = avatar_image
+                                    st.session_state.generated_personas[st.session_state.selected_persona_index]['avatar_image'] = avatar_image
+                                    st.success("Avatar generated!")
+                                    st.rerun()
+                                else:
+                                    st.error("Failed to generate avatar.")
                             else:
-                                st.error("Failed to generate avatar.")
-                        else:
-                            st.warning("No visual avatar description available for this persona.")
+                                st.warning("No visual avatar description available for this persona.")
 
-        with col2:
-            st.markdown(f"<div class='summary-box summary-motivations'>🎯 Motivations: {current_persona.get('motivations_summary', 'N/A')}</div>", unsafe_allow_html=True)
-            for detail in current_persona.get('motivations_details', []):
-                st.markdown(f"• {detail}")
+            with col2:
+                st.markdown(f"<div class='summary-box summary-motivations'>🎯 Motivations: {current_persona.get('motivations_summary', 'N/A')}</div>", unsafe_allow_html=True)
+                for detail in current_persona.get('motivations_details', []):
+                    st.markdown(f"• {detail}")
 
-            st.markdown(f"<div class='summary-box summary-pain-points'>😩 Pain Points: {current_persona.get('pain_points_summary', 'N/A')}</div>", unsafe_allow_html=True)
-            for detail in current_persona.get('pain_points_details', []):
-                st.markdown(f"• {detail}")
+                st.markdown(f"<div class='summary-box summary-pain-points'>😩 Pain Points: {current_persona.get('pain_points_summary', 'N/A')}</div>", unsafe_allow_html=True)
+                for detail in current_persona.get('pain_points_details', []):
+                    st.markdown(f"• {detail}")
 
-            st.markdown(f"<div class='summary-box summary-aspirations'>✨ Aspirations: {current_persona.get('aspirations_summary', 'N/A')}</div>", unsafe_allow_html=True)
-            for detail in current_persona.get('aspirations_details', []):
-                st.markdown(f"• {detail}")
+                st.markdown(f"<div class='summary-box summary-aspirations'>✨ Aspirations: {current_persona.get('aspirations_summary', 'N/A')}</div>", unsafe_allow_html=True)
+                for detail in current_persona.get('aspirations_details', []):
+                    st.markdown(f"• {detail}")
 
-        st.markdown("---")
-        st.subheader("Typical Scenario 🗓️")
-        st.write(current_persona.get('typical_scenario', 'N/A'))
-        st.markdown("---")
+            st.markdown("---")
+            st.subheader("Typical Scenario 🗓️")
+            st.write(current_persona.get('typical_scenario', 'N/A'))
+            st.markdown("---")
 
-        st.subheader("Refine Persona ✏️")
-        refinement_text = st.text_area(
-            "Provide feedback to refine this persona (e.g., 'Make her more tech-savvy', 'Add a pain point about time management').",
-            key="refinement_text_area_tab1",
-            height=80
-        )
-        if st.button("🔄 Refine Persona", use_container_width=True, key="refine_persona_btn"):
-            if refinement_text:
-                with st.spinner("Refining persona..."):
-                    refined_persona = refine_persona_with_gemini(current_persona, refinement_text)
-                    if refined_persona:
-                        refined_persona['avatar_image'] = current_persona.get('avatar_image')
-                        st.session_state.generated_personas[st.session_state.selected_persona_index] = refined_persona
-                        st.success("Persona refined successfully!")
+            st.subheader("Refine Persona ✏️")
+            refinement_text = st.text_area(
+                "Provide feedback to refine this persona (e.g., 'Make her more tech-savvy', 'Add a pain point about time management').",
+                key="refinement_text_area_tab1",
+                height=80
+            )
+            if st.button("🔄 Refine Persona", use_container_width=True, key="refine_persona_btn"):
+                if refinement_text:
+                    with st.spinner("Refining persona..."), tracing.span("persona_builder.refine_persona", feedback_chars=len(refinement_text)):
+                        # A new avatar is started mid-stream only if the refinement meaningfully changed the
+                        # description; otherwise the current one is kept. It is dropped if the final persona
+                        # ends up with a different description
+                        speculative_avatar = pipeline.SpeculativeAvatar(GEMINI_API_KEY)
+                        current_avatar_description = current_persona.get('visual_avatar_description')
+
+                        def on_refined_avatar_description(description):
+                            if pipeline.avatar_description_changed(current_avatar_description, description):
+                                speculative_avatar.start(description)
+
+                        refined_persona = refine_persona_with_gemini(current_persona, refinement_text, on_avatar_description=on_refined_avatar_description)
+                        if refined_persona:
+                            avatar_future = speculative_avatar.claim(refined_persona.get('visual_avatar_description'))
+                            new_avatar = avatar_future.result() if avatar_future else None
+                            refined_persona['avatar_image'] = new_avatar or current_persona.get('avatar_image')
+                            history = st.session_state.persona_histories[st.session_state.selected_persona_index]
+                            st.session_state.generated_personas[st.session_state.selected_persona_index] = history.commit(refined_persona, note=refinement_text)
+                            st.success("Persona refined successfully!")
+                            st.rerun()
+                        else:
+                            st.error("Failed to refine persona.")
+                else:
+                    st.warning("Please enter refinement feedback.")
+
+            history = st.session_state.persona_histories[st.session_state.selected_persona_index]
+            if len(history) > 1:
+                st.markdown("---")
+                st.subheader("Version History 🕘")
+                st.caption(f"Version {history.index + 1} of {len(history)}: {history.note(history.index)}")
+                col_undo, col_redo = st.columns(2)
+                with col_undo:
+                    if st.button("↩️ Undo", use_container_width=True, key="undo_persona_btn", disabled=not history.can_undo):
+                        st.session_state.generated_personas[st.session_state.selected_persona_index] = history.undo()
+                        st.rerun()
+                with col_redo:
+                    if st.button("↪️ Redo", use_container_width=True, key="redo_persona_btn", disabled=not history.can_redo):
+                        st.session_state.generated_personas[st.session_state.selected_persona_index] = history.redo()
                         st.rerun()
-                    else:
-                        st.error("Failed to refine persona.")
-            else:
-                st.warning("Please enter refinement feedback.")
 
-        st.markdown("---")
-        st.subheader("Save & Export Persona 📥")
-        col_dl1, col_dl2 = st.columns(2)
-        with col_dl1:
-            persona_export = copy.deepcopy(current_persona)
-            if 'avatar_image' in persona_export and not isinstance(persona_export['avatar_image'], (str, type(None))):
-                try:
-                    if isinstance(persona_export['avatar_image'], Image.Image):
-                        buffered = io.BytesIO()
-                        persona_export['avatar_image'].save(buffered, format="PNG")
-                        persona_export['avatar_image'] = base64.b64encode(buffered.getvalue()).decode()
+                other_versions = [i for i in range(len(history)) if i != history.index]
+                compare_index = st.selectbox(
+                    "Compare the current version with:",
+                    other_versions,
+                    index=max(history.index - 1, 0),  # The version before the current one, if any
+                    format_func=lambda i: f"Version {i + 1}: {history.note(i)}",
+                    key=f"compare_version_select_{history.index}_{len(history)}"  # Reset to the default when the history moves
+                )
+                changes = persona_history.diff(history.version(compare_index), history.current)
+                if not changes:
+                    st.info("No differences.")
+                for field, change in changes.items():
+                    label = field.replace('_', ' ').capitalize()
+                    if field == 'avatar_image':
+                        st.markdown(f"**{label}:** changed")
+                    elif isinstance(change, dict):
+                        st.markdown(f"**{label}:**")
+                        for item in change['removed']:
+                            st.markdown(f"➖ ~~{item}~~")
+                        for item in change['added']:
+                            st.markdown(f"➕ {item}")
                     else:
-                        persona_export['avatar_image'] = "Avatar image not included in export."
-                except Exception as e:
-                    st.error(f"Error handling avatar image for export: {e}")
-                    persona_export['avatar_image'] = "Error processing avatar for export."
-
-            persona_json = json.dumps(persona_export, indent=2)
-            st.download_button(
-                label="Download Persona (JSON) ⬇️",
-                data=persona_json,
-                file_name=f"{current_persona.get('name', 'persona').replace(' ', '_').lower()}.json",
-                mime="application/json",
-                use_container_width=True,
-                key="download_json_btn"
-            )
-        with col_dl2:
-            motivations_details_formatted = '\n'.join([f'• {detail}' for detail in current_persona.get('motivations_details', [])])
-            pain_points_details_formatted = '\n'.join([f'• {detail}' for detail in current_persona.get('pain_points_details', [])])
-            aspirations_details_formatted = '\n'.join([f'• {detail}' for detail in current_persona.get('aspirations_details', [])])
-
-            persona_txt = (
-                f"Persona Name: {current_persona.get('name', 'N/A')}\n"
-                f"Archetype: {current_persona.get('archetype', 'N/A')}\n\n"
-                f"Motivations Summary: {current_persona.get('motivations_summary', 'N/A')}\n"
-                f"Motivations Details:\n"
-                f"{motivations_details_formatted}\n\n"
-                f"Pain Points Summary: {current_persona.get('pain_points_summary', 'N/A')}\n"
-                f"Pain Points Details:\n"
-                f"{pain_points_details_formatted}\n\n"
-                f"Aspirations Summary: {current_persona.get('aspirations_summary', 'N/A')}\n"
-                f"Aspirations Details:\n"
-                f"{aspirations_details_formatted}\n\n"
-                f"Typical Scenario:\n"
-                f"{current_persona.get('typical_scenario', 'N/A')}\n\n"
-                f"Visual Avatar Description: {current_persona.get('visual_avatar_description', 'N/A')}"
-            )
-            st.download_button(
-                label="Download Persona (TXT) ⬇️",
-                data=persona_txt,
-                file_name=f"{current_persona.get('name', 'persona').replace(' ', '_').lower()}.txt",
-                mime="text/plain",
-                use_container_width=True,
-                key="download_txt_btn"
-            )
-        st.markdown("---")
+                        st.markdown(f"**{label}:** ~~{change[0]}~~ → {change[1]}")
+
+            st.markdown("---")
+            st.subheader("Save & Export Persona 📥")
+            col_dl1, col_dl2 = st.columns(2)
+            with col_dl1:
+                persona_export = copy.deepcopy(current_persona)
+                if 'avatar_image' in persona_export and not isinstance(persona_export['avatar_image'], (str, type(None))):
+                    try:
+                        if isinstance(persona_export['avatar_image'], Image.Image):
+                            buffered = io.BytesIO()
+                            persona_export['avatar_image'].save(buffered, format="PNG")
+                            persona_export['avatar_image'] = base64.b64encode(buffered.getvalue()).decode()
+                        else:
+                            persona_export['avatar_image'] = "Avatar image not included in export."
+                    except Exception as e:
+                        st.error(f"Error handling avatar image for export: {e}")
+                        persona_export['avatar_image'] = "Error processing avatar for export."
+
+                persona_json = json.dumps(persona_export, indent=2)
+                st.download_button(
+                    label="Download Persona (JSON) ⬇️",
+                    data=persona_json,
+                    file_name=f"{current_persona.get('name', 'persona').replace(' ', '_').lower()}.json",
+                    mime="application/json",
+                    use_container_width=True,
+                    key="download_json_btn"
+                )
+            with col_dl2:
+                motivations_details_formatted = '\n'.join([f'• {detail}' for detail in current_persona.get('motivations_details', [])])
+                pain_points_details_formatted = '\n'.join([f'• {detail}' for detail in current_persona.get('pain_points_details', [])])
+                aspirations_details_formatted = '\n'.join([f'• {detail}' for detail in current_persona.get('aspirations_details', [])])
+
+                persona_txt = (
+                    f"Persona Name: {current_persona.get('name', 'N/A')}\n"
+                    f"Archetype: {current_persona.get('archetype', 'N/A')}\n\n"
+                    f"Motivations Summary: {current_persona.get('motivations_summary', 'N/A')}\n"
+                    f"Motivations Details:\n"
+                    f"{motivations_details_formatted}\n\n"
+                    f"Pain Points Summary: {current_persona.get('pain_points_summary', 'N/A')}\n"
+                    f"Pain Points Details:\n"
+                    f"{pain_points_details_formatted}\n\n"
+                    f"Aspirations Summary: {current_persona.get('aspirations_summary', 'N/A')}\n"
+                    f"Aspirations Details:\n"
+                    f"{aspirations_details_formatted}\n\n"
+                    f"Typical Scenario:\n"
+                    f"{current_persona.get('typical_scenario', 'N/A')}\n\n"
+                    f"Visual Avatar Description: {current_persona.get('visual_avatar_description', 'N/A')}"
+                )
+                st.download_button(
+                    label="Download Persona (TXT) ⬇️",
+                    data=persona_txt,
+                    file_name=f"{current_persona.get('name', 'persona').replace(' ', '_').lower()}.txt",
+                    mime="text/plain",
+                    use_container_width=True,
+                    key="download_txt_btn"
+                )
+            st.markdown("---")
 
-        st.subheader("Manage Personas 🗑️")
-        if st.button("❌ Delete Current Persona", use_container_width=True, key="delete_persona_btn"):
-            if st.session_state.generated_personas:
-                st.session_state.generated_personas.pop(st.session_state.selected_persona_index)
-                if len(st.session_state.generated_personas) > 0:
-                    st.session_state.selected_persona_index = max(0, st.session_state.selected_persona_index - 1)
+            st.subheader("Manage Personas 🗑️")
+            if st.button("❌ Delete Current Persona", use_container_width=True, key="delete_persona_btn"):
+                if st.session_state.generated_personas:
+                    st.session_state.generated_personas.pop(st.session_state.selected_persona_index)
+                    st.session_state.persona_histories.pop(st.session_state.selected_persona_index)
+                    if len(st.session_state.generated_personas) > 0:
+                        st.session_state.selected_persona_index = max(0, st.session_state.selected_persona_index - 1)
+                    else:
+                        st.session_state.selected_persona_index = -1
+                    st.success("Persona deleted.")
+                    st.rerun()
                 else:
-                    st.session_state.selected_persona_index = -1
-                st.success("Persona deleted.")
-                st.rerun()
-            else:
-                st.warning("No personas to delete.")
+                    st.warning("No personas to delete.")
 
 elif selected_tab == "Messaging Generator":
-    messaging_generator.render(GEMINI_API_KEY)
+    with tracing.span("page.messaging_generator"):
+        messaging_generator.render(GEMINI_API_KEY)
 
 elif selected_tab == "Problem-Solution Fit":
-    problem_solution_fit.render(GEMINI_API_KEY)
+    with tracing.span("page.problem_solution_fit"):
+        problem_solution_fit.render(GEMINI_API_KEY)
 
 elif selected_tab == "Anti-Persona Engine":
-    anti_persona_engine.render(GEMINI_API_KEY, st.session_state.active_main_tab_index)
+    with tracing.span("page.anti_persona_engine"):
+        anti_persona_engine.render(GEMINI_API_KEY, st.session_state.active_main_tab_index)
 
 # Custom CSS for a minimalistic, seamless, and visually pleasing UI
 st.markdown("""
@@ -0,0 +1,224 @@
+"""
+Validators for model outputs, compiled once from the declarations in schemas.py.
+
+compile_schema() turns a schema into a tree of small closures, so validating a
+response is a single walk with no schema interpretation. Validation also
+normalizes where it is safe to:
+
+- strings are stripped; numbers are accepted where a string is expected
+- numeric strings ("4", " 4.0 ") become numbers for integer/number fields
+- invalid items are dropped from arrays, and invalid optional properties are
+  dropped from objects, with an issue recorded for each
+- arrays longer than max_items are truncated
+
+A node is invalid when its type can't be coerced, a string is empty, a required
+property is missing or invalid, or an array that needs items ends up empty
+(min_items itself is left to the model's constrained decoding).
+
+validate(name, data) checks data against one of the registered output types and
+returns a ValidationResult with the normalized value (None if unusable) and a
+list of Issue(path, message) entries.
+"""
+from collections import namedtuple
+
+import schemas
+
+Issue = namedtuple('Issue', ['path', 'message'])
+
+_INVALID = object()
+
+
+class ValidationResult:
+    __slots__ = ('value', 'issues')
+
+    def __init__(self, value, issues):
+        self.value = value
+        self.issues = issues
+
+    @property
+    def ok(self):
+        return self.value is not None
+
+    def messages(self):
+        return [f"{issue.path or '<root>'}: {issue.message}" for issue in self.issues]
+
+
+def _join(path, key):
+    return f"{path}.{key}" if path else str(key)
+
+
+def _dropped(path, what, reasons):
+    # One issue per dropped node, carrying the first reason it was rejected
+    reason = f"{reasons[0].path}: {reasons[0].message}" if reasons else "invalid"
+    return Issue(path, f"{what} dropped ({reason})")
+
+
+def _compile_string(schema):
+    enum = frozenset(schema['enum']) if schema.get('enum') else None
+
+    def check(value, path, issues):
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(value)
+        if not isinstance(value, str):
+            issues.append(Issue(path, f"expected a string, got {type(value).__name__}"))
+            return _INVALID
+        value = value.strip()
+        if not value:
+            issues.append(Issue(path, "must not be empty"))
+            return _INVALID
+        if enum is not None and value not in enum:
+            issues.append(Issue(path, f"must be one of {sorted(enum)}"))
+            return _INVALID
+        return value
+    return check
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value.strip())
+        except ValueError:
+            return None
+    return None
+
+
+def _compile_integer(schema):
+    def check(value, path, issues):
+        number = _to_number(value)
+        if number is None or number != int(number):
+            issues.append(Issue(path, f"expected an integer, got {value!r}"))
+            return _INVALID
+        return int(number)
+    return check
+
+
+def _compile_number(schema):
+    def check(value, path, issues):
+        number = _to_number(value)
+        if number is None:
+            issues.append(Issue(path, f"expected a number, got {value!r}"))
+            return _INVALID
+        return number
+    return check
+
+
+def _compile_boolean(schema):
+    def check(value, path, issues):
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+            return value.strip().lower() == 'true'
+        issues.append(Issue(path, f"expected a boolean, got {value!r}"))
+        return _INVALID
+    return check
+
+
+def _compile_array(schema):
+    check_item = compile_schema(schema['items'])
+    needs_items = schema.get('min_items', 0) > 0
+    max_items = schema.get('max_items')
+
+    def check(value, path, issues):
+        if not isinstance(value, list):
+            issues.append(Issue(path, f"expected a list, got {type(value).__name__}"))
+            return _INVALID
+        items = []
+        for i, item in enumerate(value):
+            item_issues = []
+            checked = check_item(item, f"{path}[{i}]", item_issues)
+            if checked is _INVALID:
+                issues.append(_dropped(f"{path}[{i}]", "item", item_issues))
+            else:
+                issues.extend(item_issues)
+                items.append(checked)
+        if needs_items and not items:
+            issues.append(Issue(path, "must contain at least one valid item"))
+            return _INVALID
+        if max_items is not None and len(items) > max_items:
+            items = items[:max_items]
+        return items
+    return check
+
+
+def _compile_object(schema):
+    properties = [(key, compile_schema(sub)) for key, sub in schema.get('properties', {}).items()]
+    required = frozenset(schema.get('required', ()))
+
+    def check(value, path, issues):
+        if not isinstance(value, dict):
+            issues.append(Issue(path, f"expected an object, got {type(value).__name__}"))
+            return _INVALID
+        result = dict(value)  # Unknown keys pass through untouched
+        valid = True
+        for key, check_property in properties:
+            key_path = _join(path, key)
+            if key not in value or value[key] is None:
+                result.pop(key, None)
+                if key in required:
+                    issues.append(Issue(key_path, "is required"))
+                    valid = False
+                continue
+            property_issues = []
+            checked = check_property(value[key], key_path, property_issues)
+            if checked is _INVALID:
+                result.pop(key, None)
+                if key in required:
+                    issues.extend(property_issues)
+                    valid = False
+                else:
+                    issues.append(_dropped(key_path, "optional property", property_issues))
+            else:
+                issues.extend(property_issues)
+                result[key] = checked
+        return result if valid else _INVALID
+    return check
+
+
+_COMPILERS = {
+    'string': _compile_string,
+    'integer': _compile_integer,
+    'number': _compile_number,
+    'boolean': _compile_boolean,
+    'array': _compile_array,
+    'object': _compile_object,
+}
+
+
+def compile_schema(schema):
+    """Compiles a schemas.py declaration into check(value, path, issues) -> normalized value or _INVALID."""
+    compiler = _COMPILERS.get(schema.get('type'))
+    if compiler is None:
+        raise ValueError(f"Unsupported schema type: {schema.get('type')!r}")
+    return compiler(schema)
+
+
+def compile_validator(schema):
+    """Returns validate(data) -> ValidationResult for a schema."""
+    check = compile_schema(schema)
+
+    def validate_data(data):
+        issues = []
+        value = check(data, "", issues)
+        return ValidationResult(None if value is _INVALID else value, issues)
+    return validate_data
+
+
+VALIDATORS = {
+    'sentiment': compile_validator(schemas.SENTIMENT),
+    'persona': compile_validator(schemas.PERSONA),
+    'persona_patch': compile_validator(schemas.PERSONA_PATCH),
+    'problem_solution_persona': compile_validator(schemas.PROBLEM_SOLUTION_PERSONA),
+    'solution_ideas': compile_validator(schemas.SOLUTION_IDEAS),
+    'fit_scores': compile_validator(schemas.FIT_SCORES),
+    'anti_persona_reports': compile_validator(schemas.ANTI_PERSONA_REPORTS),
+}
+VALIDATORS.update({content_type: compile_validator(schema) for content_type, schema in schemas.MESSAGING_SCHEMAS.items()})
+
+
+def validate(name, data):
+    """Validates data as the registered output type `name` (a key of VALIDATORS)."""
+    return VALIDATORS[name](data)